@@ -0,0 +1,483 @@
+import datetime
+import json
+import logging
+
+from src.clients import clients
+from src.history import estimate_tokens, truncating_summarizer
+from src.ratelimit import (
+    call_with_retry,
+    call_with_retry_async,
+    stream_with_retry,
+    stream_with_retry_async,
+)
+from src.response_cache import make_key, response_cache
+from src.rewards import answer_best_card, detect_category, grounding_context
+from src.rules import answer_524, chase_524_status, is_524_question, prompt_facts
+from src.tool_runner import ToolRunner
+from src.tracing import span
+from src.tools.search import (
+    SEARCH_DEADLINE,
+    search_credit_card_info,
+    search_credit_card_info_async,
+)
+
+logger = logging.getLogger(__name__)
+
+# Agent 可调用的工具 (函数名 -> 函数)
+TOOLS = [search_credit_card_info]
+TOOL_REGISTRY = {fn.__name__: fn for fn in TOOLS}
+# 搜索自身有并行截止时间，工具超时在此基础上留出合并/压缩的余量
+tool_runner = ToolRunner(
+    TOOL_REGISTRY,
+    timeouts={"search_credit_card_info": SEARCH_DEADLINE + 10},
+    async_registry={"search_credit_card_info": search_credit_card_info_async},
+)
+
+# 单轮对话中最多允许几轮工具调用，防止模型无限循环搜索
+MAX_TOOL_ROUNDS = 5
+# 福利日历分析使用的模型
+BENEFITS_MODEL = "gemini-flash-latest"
+
+
+def build_system_instruction(user_p, lang="en"):
+    # 🔥 1. 获取准确的今天日期
+    today_str = datetime.date.today().strftime("%Y-%m-%d")
+
+    lang_instruction = "Respond in English." if lang == "en" else "请用中文回答。"
+
+    # 🔥 2. 强制在 System Prompt 的最开头注入日期
+    # 注意：这里必须用 f""" ... """ 格式化字符串
+    return f"""
+    [SYSTEM INFO]
+    Current Date: {today_str}
+    Role: You are Walle, an expert credit card agent.
+    
+    [USER CONTEXT]
+    {user_p.get_summary()}
+    
+    [TASK GUIDELINES]
+    1. Always SEARCH before answering about quarterly categories.
+       When several cards need a lookup, issue one search call per card in the same turn (they run in parallel).
+    2. For Chase 5/24 Rule and application velocity:
+       - Use the numbers in [LOCAL 5/24 CALCULATOR]; do NOT recount from the open dates.
+    
+    {lang_instruction}
+    """
+
+
+def benefits_prompt(user_profile, lang="en"):
+    """福利日历: 让模型找出会过期的福利 (按年/按月的报销、免费房晚等)"""
+    today_year = datetime.date.today().year
+
+    lang_instruction = (
+        "Output the 'benefit' and 'description' values in Simplified Chinese."
+        if lang == "zh"
+        else "Output in English."
+    )
+    return f"""
+    Analyze the following credit cards held by the user:
+    {user_profile.get_summary()}
+    
+    Task:
+    Identify time-sensitive benefits (credits, free nights, allowances) that expire annually or monthly.
+    Return a JSON list. Do not output markdown code blocks, just raw JSON.
+    {lang_instruction}
+    
+    Format:
+    [
+        {{
+            "card": "Card Name",
+            "benefit": "Benefit Title (e.g. $50 Hotel Credit)",
+            "deadline": "YYYY-MM-DD" (Assume current year {today_year}. If monthly, use end of this month),
+            "description": "Brief instruction on how to use it."
+        }}
+    ]
+    """
+
+
+def parse_benefits(text):
+    # 清洗数据，防止 AI 加 ```json 包裹
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+    return json.loads(clean_text)
+
+
+def analyze_benefits(
+    client, user_profile, lang="en", session=None, model=BENEFITS_MODEL, cancel=None
+):
+    """
+    调用 AI 分析当前卡片的福利，返回 [{"card", "benefit", "deadline", "description"}]
+    cancel (threading.Event) 被设置后不再等待配额或重试，抛出 RequestCancelled
+    """
+    prompt = benefits_prompt(user_profile, lang)
+    # 与聊天共用同一个限流器，遇到 429 自动退避重试
+    with clients.track("gemini"):
+        response = call_with_retry(
+            lambda: client.models.generate_content(model=model, contents=[prompt]),
+            model,
+            tokens=estimate_tokens(prompt),
+            session=session,
+            cancel=cancel,
+        )
+    return parse_benefits(response.text)
+
+
+async def analyze_benefits_async(
+    client, user_profile, lang="en", session=None, model=BENEFITS_MODEL
+):
+    """analyze_benefits 的 asyncio 版本 (client.aio)"""
+    prompt = benefits_prompt(user_profile, lang)
+    with clients.track("gemini"):
+        response = await call_with_retry_async(
+            lambda: client.aio.models.generate_content(model=model, contents=[prompt]),
+            model,
+            tokens=estimate_tokens(prompt),
+            session=session,
+        )
+    return parse_benefits(response.text)
+
+
+def build_contents(history, prompt):
+    """
+    把 [{"role": "user"/"assistant", "content": "..."}] 格式的聊天记录
+    加上本轮提问，转换为 Gemini 的 Content 列表
+    """
+    from google.genai import types
+
+    contents = []
+    for msg in history:
+        role = "model" if msg["role"] == "assistant" else "user"
+        contents.append(
+            types.Content(role=role, parts=[types.Part.from_text(text=msg["content"])])
+        )
+    contents.append(
+        types.Content(role="user", parts=[types.Part.from_text(text=prompt)])
+    )
+    return contents
+
+
+def build_config(system_instruction):
+    from google.genai import types
+
+    # 关闭 SDK 的自动函数调用，由 stream_reply 自己执行工具，这样才能边生成边输出
+    return types.GenerateContentConfig(
+        tools=TOOLS,
+        system_instruction=system_instruction,
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+    )
+
+
+def run_tools(calls):
+    """
+    并行执行同一轮中的所有函数调用 (例如每张卡各搜一次)，
+    返回 function_response Part 列表，顺序与调用一致
+    """
+    from google.genai import types
+
+    with span("tools.run", calls=len(calls)):
+        results = tool_runner.run([(call.name, call.args) for call in calls])
+    return [
+        types.Part.from_function_response(name=call.name, response=result)
+        for call, result in zip(calls, results)
+    ]
+
+
+def apply_local_engines(user_profile, prompt, system_instruction, lang="en"):
+    """
+    在调用模型之前先尝试本地确定性引擎。
+    返回 (direct_answer, system_instruction):
+    direct_answer 不为 None 时可以直接展示，不需要调用 API；
+    否则 system_instruction 中会附上本地计算的事实，供模型参考。
+    """
+    # 5/24 状态按卡包 memoize，卡包不变时不会重复计算
+    status = chase_524_status(user_profile)
+    if is_524_question(prompt):
+        return answer_524(status, lang), system_instruction
+
+    direct = answer_best_card(user_profile, prompt, lang)
+    if direct is not None:
+        return direct, system_instruction
+
+    if user_profile.cards:
+        system_instruction += "\n" + prompt_facts(status)
+
+    category = detect_category(prompt)
+    if category is not None:
+        system_instruction += "\n" + grounding_context(user_profile, category)
+    return None, system_instruction
+
+
+def estimate_request_tokens(contents, system_instruction):
+    """估算一次请求的输入 token 数，用于 TPM 限流"""
+    text = "".join(
+        part.text or "" for content in contents for part in content.parts or []
+    )
+    return estimate_tokens(system_instruction) + estimate_tokens(text)
+
+
+def _record_round(s, metadata, call_parts):
+    """把一轮生成的 token 数和函数调用数记到 span 上"""
+    if metadata is not None:
+        s.set(
+            prompt_tokens=metadata.prompt_token_count,
+            output_tokens=metadata.candidates_token_count,
+        )
+    s.set(tool_calls=len(call_parts))
+
+
+def stream_reply(
+    client, model, contents, system_instruction, usage=None, session=None, cancel=None
+):
+    """
+    流式生成回答，逐块 yield 文本。
+
+    如果模型在某一轮返回了函数调用，就执行工具、把结果追加到对话里再继续生成，
+    直到模型给出最终文本 (或超过 MAX_TOOL_ROUNDS)。
+
+    传入 usage (dict) 时，会写入第一轮请求的 prompt_token_count
+    以及所有轮次累计的 candidates_token_count。
+
+    每一轮请求都经过共享限流器 (src/ratelimit.py)，session 用于在多个会话间公平排队。
+    cancel (threading.Event) 被设置后不再等待配额，也不再开始新的工具调用轮次。
+    """
+    from google.genai import types
+
+    config = build_config(system_instruction)
+    contents = list(contents)
+    if usage is not None:
+        usage["candidates_token_count"] = 0
+
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        call_parts = []
+        metadata = None
+        with span("gemini.generate", model=model, round=tool_round) as s:
+            for chunk in stream_with_retry(
+                lambda: client.models.generate_content_stream(
+                    model=model, contents=contents, config=config
+                ),
+                model,
+                tokens=estimate_request_tokens(contents, system_instruction),
+                session=session,
+                cancel=cancel,
+            ):
+                # 流式响应中 usage_metadata 是本轮的累计值，保留最后一次即可
+                metadata = chunk.usage_metadata or metadata
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.function_call:
+                        # 保留原始 Part (包含 thought_signature)，回传给模型时需要
+                        call_parts.append(part)
+                    elif part.text and not part.thought:
+                        yield part.text
+            _record_round(s, metadata, call_parts)
+
+        if usage is not None and metadata is not None:
+            if tool_round == 0:
+                usage["prompt_token_count"] = metadata.prompt_token_count
+            usage["candidates_token_count"] += metadata.candidates_token_count or 0
+
+        if not call_parts or (cancel is not None and cancel.is_set()):
+            return
+
+        contents.append(types.Content(role="model", parts=call_parts))
+        contents.append(
+            types.Content(
+                role="user",
+                parts=run_tools([part.function_call for part in call_parts]),
+            )
+        )
+
+    logger.warning("Max tool rounds exceeded, stopping generation.")
+
+
+def cached_stream_reply(
+    client,
+    model,
+    contents,
+    system_instruction,
+    cache=None,
+    usage=None,
+    session=None,
+    cancel=None,
+):
+    """
+    带回答缓存的 stream_reply: 命中时直接返回完整文本 (毫秒级、不消耗配额)，
+    未命中时边流式输出边累积，完整生成成功后写入缓存 (被取消的回答不写入)。
+    """
+    cache = cache or response_cache
+    key = make_key(model, system_instruction, contents)
+
+    with span("llm.reply", model=model) as s:
+        cached = cache.get(key)
+        s.set(cache_hit=cached is not None)
+        if cached is not None:
+            if usage is not None:
+                usage["cache_hit"] = True
+            yield cached
+            return
+
+        chunks = []
+        with clients.track("gemini"):
+            for chunk in stream_reply(
+                client,
+                model,
+                contents,
+                system_instruction,
+                usage=usage,
+                session=session,
+                cancel=cancel,
+            ):
+                chunks.append(chunk)
+                yield chunk
+
+    text = "".join(chunks)
+    if text and not (cancel is not None and cancel.is_set()):
+        cache.set(key, text)
+
+
+async def run_tools_async(calls):
+    """run_tools 的 asyncio 版本: 协程版本的工具直接在事件循环中并行执行"""
+    from google.genai import types
+
+    with span("tools.run", calls=len(calls)):
+        results = await tool_runner.run_async(
+            [(call.name, call.args) for call in calls]
+        )
+    return [
+        types.Part.from_function_response(name=call.name, response=result)
+        for call, result in zip(calls, results)
+    ]
+
+
+async def stream_reply_async(
+    client, model, contents, system_instruction, usage=None, session=None
+):
+    """stream_reply 的 asyncio 版本 (client.aio)，等待模型和工具时不占用线程"""
+    from google.genai import types
+
+    config = build_config(system_instruction)
+    contents = list(contents)
+    if usage is not None:
+        usage["candidates_token_count"] = 0
+
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        call_parts = []
+        metadata = None
+        with span("gemini.generate", model=model, round=tool_round) as s:
+            async for chunk in stream_with_retry_async(
+                lambda: client.aio.models.generate_content_stream(
+                    model=model, contents=contents, config=config
+                ),
+                model,
+                tokens=estimate_request_tokens(contents, system_instruction),
+                session=session,
+            ):
+                metadata = chunk.usage_metadata or metadata
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.function_call:
+                        call_parts.append(part)
+                    elif part.text and not part.thought:
+                        yield part.text
+            _record_round(s, metadata, call_parts)
+
+        if usage is not None and metadata is not None:
+            if tool_round == 0:
+                usage["prompt_token_count"] = metadata.prompt_token_count
+            usage["candidates_token_count"] += metadata.candidates_token_count or 0
+
+        if not call_parts:
+            return
+
+        contents.append(types.Content(role="model", parts=call_parts))
+        contents.append(
+            types.Content(
+                role="user",
+                parts=await run_tools_async(
+                    [part.function_call for part in call_parts]
+                ),
+            )
+        )
+
+    logger.warning("Max tool rounds exceeded, stopping generation.")
+
+
+async def cached_stream_reply_async(
+    client, model, contents, system_instruction, cache=None, usage=None, session=None
+):
+    """cached_stream_reply 的 asyncio 版本"""
+    cache = cache or response_cache
+    key = make_key(model, system_instruction, contents)
+
+    with span("llm.reply", model=model) as s:
+        cached = cache.get(key)
+        s.set(cache_hit=cached is not None)
+        if cached is not None:
+            if usage is not None:
+                usage["cache_hit"] = True
+            yield cached
+            return
+
+        chunks = []
+        with clients.track("gemini"):
+            async for chunk in stream_reply_async(
+                client,
+                model,
+                contents,
+                system_instruction,
+                usage=usage,
+                session=session,
+            ):
+                chunks.append(chunk)
+                yield chunk
+
+    text = "".join(chunks)
+    if text:
+        cache.set(key, text)
+
+
+def generate_reply(client, model, contents, system_instruction):
+    """非流式版本: 返回完整文本"""
+    return "".join(cached_stream_reply(client, model, contents, system_instruction))
+
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and Walle,
+a credit card agent. Update the summary with the new messages below.
+Keep card names, dates, amounts and decisions; drop pleasantries.
+Reply with the updated summary only, at most 150 words.
+
+[CURRENT SUMMARY]
+{summary}
+
+[NEW MESSAGES]
+{messages}
+"""
+
+
+def make_gemini_summarizer(client=None, model="gemini-flash-latest"):
+    """
+    返回一个用 Gemini 增量更新滚动摘要的 summarizer (用于 ConversationHistory)。
+    不传 client 时每次都从客户端注册表获取，客户端重建后也能用上新的实例。
+    """
+
+    def summarize(summary, messages):
+        gemini = client or clients.get("gemini")
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(empty)", messages=transcript
+        )
+        try:
+            response = call_with_retry(
+                lambda: gemini.models.generate_content(model=model, contents=[prompt]),
+                model,
+                tokens=estimate_tokens(prompt),
+            )
+            return response.text.strip()
+        except Exception as e:
+            clients.report_error("gemini", e)
+            logger.error(f"History summarization failed, truncating instead: {e}")
+            return truncating_summarizer(summary, messages)
+
+    return summarize
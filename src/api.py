@@ -0,0 +1,530 @@
+"""
+Walle 的 HTTP API (ASGI)，供移动端等客户端使用，与 Streamlit 界面共用同一套 Agent 核心。
+
+运行:
+    python -m src.api                    # uvicorn，默认 127.0.0.1:8000
+    python -m src.api --port 9000 --workers 4
+
+接口 (JSON；用户由 X-User-Id 请求头指定，身份验证交给前面的网关):
+    GET    /healthz
+    GET    /v1/wallet
+    POST   /v1/wallet/cards              {"bank", "name", "network", "last_four", "open_date"}
+    PUT    /v1/wallet/cards/{card_id}    (只需要传要修改的字段)
+    DELETE /v1/wallet/cards/{card_id}
+    POST   /v1/chat                      {"message", "history", "lang", "stream"}
+    POST   /v1/benefits                  {"lang"}
+
+/v1/chat 默认以 server-sent events 流式返回 (event: delta / done / error)，
+"stream": false 时返回完整 JSON。
+
+服务本身无状态: 卡包在存储后端，聊天记录由客户端随请求带上，
+因此可以在负载均衡后面水平扩展多个进程。
+
+注意: 每个用户的并发上限 (WALLE_API_USER_CONCURRENCY) 是按进程计算的，
+使用 --workers N 或多个实例时，实际上限是 N × limit；需要全局限制时应在网关上配置。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from contextlib import asynccontextmanager
+
+# --- 路径配置 ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.agent import (
+    analyze_benefits_async,
+    apply_local_engines,
+    build_contents,
+    build_system_instruction,
+    cached_stream_reply_async,
+)
+from src.clients import clients
+from src.history import ConversationHistory
+from src.models import CreditCard
+from src.rules import parse_date
+from src.storage import (
+    delete_card_from_db,
+    load_user_data,
+    save_new_card,
+    update_card_in_db,
+)
+from src.tracing import hash_user, span
+
+logger = logging.getLogger(__name__)
+
+API_HOST = os.getenv("WALLE_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("WALLE_API_PORT", "8000"))
+# 每个用户同时进行中的请求数上限，超出时返回 429
+API_USER_CONCURRENCY = int(os.getenv("WALLE_API_USER_CONCURRENCY", "2"))
+MAX_BODY_BYTES = 256 * 1024
+
+CHAT_MODEL = "gemini-flash-latest"
+CARD_FIELDS = ("bank", "name", "network", "last_four", "open_date")
+NETWORKS = ("Unknown", "Visa", "Mastercard", "Amex", "Discover")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class UserConcurrency:
+    """
+    按用户限制同时进行中的请求数 (单个事件循环内使用，不需要加锁)。
+    超出上限时立即拒绝，而不是排队占用连接，客户端收到 429 后稍后重试。
+    """
+
+    def __init__(self, limit=API_USER_CONCURRENCY):
+        self.limit = limit
+        self._active = {}
+
+    def active(self, user_id):
+        return self._active.get(user_id, 0)
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        if self.active(user_id) >= self.limit:
+            raise HTTPError(429, "Too many concurrent requests for this user")
+        self._active[user_id] = self.active(user_id) + 1
+        try:
+            yield
+        finally:
+            self._active[user_id] -= 1
+            if not self._active[user_id]:
+                del self._active[user_id]
+
+
+# --- 请求 / 响应 ---
+
+
+class Request:
+    def __init__(self, scope, receive, params):
+        self.scope = scope
+        self.receive = receive
+        self.params = params
+        self.method = scope["method"]
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+
+    @property
+    def user_id(self):
+        user_id = self.headers.get("x-user-id", "").strip().lower()
+        if not user_id:
+            raise HTTPError(401, "Missing X-User-Id header")
+        return user_id
+
+    async def json(self):
+        body = b""
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "Client disconnected")
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            if not message.get("more_body"):
+                break
+        if not body:
+            return {}
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "Invalid JSON body")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "JSON body must be an object")
+        return payload
+
+
+async def send_json(send, status, payload=None):
+    body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def sse_event(event, data):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+# --- 卡包 ---
+
+
+def card_to_dict(card):
+    return {
+        "card_id": card.card_id,
+        "bank": card.bank,
+        "name": card.name,
+        "network": card.network,
+        "last_four": card.last_four,
+        "open_date": card.open_date,
+    }
+
+
+def validate_card_fields(payload, partial=False):
+    """校验卡片字段，返回 {字段: 值}；partial=True 时只校验传入的字段 (用于修改)"""
+    fields = {}
+    for name in CARD_FIELDS:
+        if name not in payload:
+            continue
+        value = payload[name]
+        if not isinstance(value, str):
+            raise HTTPError(400, f"'{name}' must be a string")
+        fields[name] = value.strip()
+
+    if not partial:
+        for name in ("bank", "name"):
+            if not fields.get(name):
+                raise HTTPError(400, f"'{name}' is required")
+    if "network" in fields and fields["network"] not in NETWORKS:
+        raise HTTPError(400, f"'network' must be one of {', '.join(NETWORKS)}")
+    if "last_four" in fields and not re.fullmatch(r"\d{4}", fields["last_four"]):
+        raise HTTPError(400, "'last_four' must be 4 digits")
+    if fields.get("open_date") and parse_date(fields["open_date"]) is None:
+        raise HTTPError(400, "'open_date' must be YYYY-MM-DD")
+    return fields
+
+
+async def find_card(user_id, card_id):
+    user = await asyncio.to_thread(load_user_data, user_id)
+    for card in user.cards:
+        if card.card_id == card_id:
+            return card
+    raise HTTPError(404, "Card not found")
+
+
+async def get_wallet(request, send):
+    user = await asyncio.to_thread(load_user_data, request.user_id)
+    await send_json(
+        send,
+        200,
+        {"user_id": user.user_id, "cards": [card_to_dict(c) for c in user.cards]},
+    )
+
+
+async def add_card(request, send):
+    fields = validate_card_fields(await request.json())
+    card = CreditCard(
+        fields["bank"],
+        fields["name"],
+        fields.get("network") or "Unknown",
+        fields.get("last_four") or "0000",
+        open_date=fields.get("open_date", ""),
+    )
+    await asyncio.to_thread(save_new_card, request.user_id, card)
+    await send_json(send, 201, card_to_dict(card))
+
+
+async def update_card(request, send):
+    fields = validate_card_fields(await request.json(), partial=True)
+    card = await find_card(request.user_id, request.params["card_id"])
+    for name, value in fields.items():
+        setattr(card, name, value)
+    if not card.bank or not card.name:
+        raise HTTPError(400, "'bank' and 'name' cannot be empty")
+    await asyncio.to_thread(update_card_in_db, request.user_id, card.card_id, card)
+    await send_json(send, 200, card_to_dict(card))
+
+
+async def delete_card(request, send):
+    card = await find_card(request.user_id, request.params["card_id"])
+    await asyncio.to_thread(delete_card_from_db, request.user_id, card.card_id)
+    await send_json(send, 204)
+
+
+# --- 聊天 ---
+
+
+def validate_history(history):
+    if not isinstance(history, list):
+        raise HTTPError(400, "'history' must be a list")
+    for msg in history:
+        if (
+            not isinstance(msg, dict)
+            or msg.get("role") not in ("user", "assistant")
+            or not isinstance(msg.get("content"), str)
+        ):
+            raise HTTPError(
+                400, "history items must be {'role': 'user'|'assistant', 'content'}"
+            )
+    return history
+
+
+def validate_lang(payload):
+    lang = payload.get("lang", "en")
+    if lang not in ("en", "zh"):
+        raise HTTPError(400, "'lang' must be 'en' or 'zh'")
+    return lang
+
+
+async def reply_stream(user_id, message, history, lang, usage):
+    """本轮回答的异步文本流: 本地引擎能直接回答时不调用模型"""
+    with span(
+        "chat.turn", user=hash_user(user_id), lang=lang, model=CHAT_MODEL, api=True
+    ) as s:
+        user = await asyncio.to_thread(load_user_data, user_id)
+        with span("prompt.build"):
+            system_instruction = build_system_instruction(user, lang)
+            direct, system_instruction = apply_local_engines(
+                user, message, system_instruction, lang
+            )
+        if direct is not None:
+            usage["source"] = "local"
+            s.set(source="local")
+            yield direct
+            return
+
+        usage["source"] = "model"
+        # 无状态: 每个请求按 token 预算截断客户端带来的聊天记录 (不额外调用模型做摘要)
+        with span("history.compact", messages=len(history)):
+            prompt_history = ConversationHistory().compact(history)
+        contents = build_contents(prompt_history, message)
+        async for chunk in cached_stream_reply_async(
+            clients.get("gemini"),
+            CHAT_MODEL,
+            contents,
+            system_instruction,
+            usage=usage,
+            session=user_id,
+        ):
+            yield chunk
+        s.set(
+            source="model",
+            cache_hit=usage.get("cache_hit", False),
+            prompt_tokens=usage.get("prompt_token_count"),
+            output_tokens=usage.get("candidates_token_count"),
+        )
+
+
+_STREAM_END = object()
+
+
+async def _drain_stream(stream, queue):
+    """
+    在同一个 Task 里驱动整个生成器，把文本块 (或异常、结束标记) 放进队列。
+
+    不能每个文本块单独建一个 Task 去调用 __anext__(): 每个 Task 都复制一份新的
+    上下文，第一次 yield 之后打开的 span (工具调用、之后的模型轮次) 会丢掉
+    chat.turn 这个父节点，变成单独的 trace。
+    """
+    try:
+        async for chunk in stream:
+            await queue.put(chunk)
+    except Exception as e:
+        await queue.put(e)
+    else:
+        await queue.put(_STREAM_END)
+    finally:
+        await stream.aclose()
+
+
+async def chat(request, send):
+    user_id = request.user_id
+    payload = await request.json()
+    message = payload.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "'message' is required")
+    history = validate_history(payload.get("history", []))
+    lang = validate_lang(payload)
+
+    usage = {}
+    stream = reply_stream(user_id, message.strip(), history, lang, usage)
+    if not payload.get("stream", True):
+        try:
+            text = "".join([chunk async for chunk in stream])
+        except Exception as e:
+            logger.error(f"Chat failed for {user_id}: {e}")
+            raise HTTPError(502, f"Model error: {e}")
+        await send_json(send, 200, {"reply": text, "usage": usage})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    # 客户端断开时立即停止生成 (包括正在等待第一个 token 或工具调用时)，
+    # 释放该用户的并发名额，不再继续消耗配额
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request.receive))
+    queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_drain_stream(stream, queue))
+    chunks = []
+    try:
+        while True:
+            next_item = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                {next_item, disconnected}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not next_item.done():
+                next_item.cancel()
+                logger.info(f"Client disconnected, stopped chat for {user_id}")
+                return
+            item = next_item.result()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            chunks.append(item)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": sse_event("delta", {"text": item}),
+                    "more_body": True,
+                }
+            )
+        final = sse_event("done", {"text": "".join(chunks), "usage": usage})
+    except Exception as e:
+        logger.error(f"Chat stream failed for {user_id}: {e}")
+        final = sse_event("error", {"error": str(e)})
+    finally:
+        disconnected.cancel()
+        producer.cancel()
+        # 等生成器真正停下来 (span 结束、工具调用取消)
+        await asyncio.wait({producer})
+    await send({"type": "http.response.body", "body": final})
+
+
+# --- 福利日历 ---
+
+
+async def benefits(request, send):
+    user_id = request.user_id
+    lang = validate_lang(await request.json())
+    user = await asyncio.to_thread(load_user_data, user_id)
+    try:
+        items = await analyze_benefits_async(
+            clients.get("gemini"), user, lang, session=user_id
+        )
+    except Exception as e:
+        logger.error(f"Benefit analysis failed for {user_id}: {e}")
+        raise HTTPError(502, f"Model error: {e}")
+    await send_json(send, 200, {"benefits": items})
+
+
+async def healthz(request, send):
+    await send_json(send, 200, {"status": "ok"})
+
+
+# (方法, 路径正则, 处理函数, 是否计入用户并发)
+ROUTES = [
+    ("GET", r"/healthz", healthz, False),
+    ("GET", r"/v1/wallet", get_wallet, True),
+    ("POST", r"/v1/wallet/cards", add_card, True),
+    ("PUT", r"/v1/wallet/cards/(?P<card_id>[\w-]+)", update_card, True),
+    ("DELETE", r"/v1/wallet/cards/(?P<card_id>[\w-]+)", delete_card, True),
+    ("POST", r"/v1/chat", chat, True),
+    ("POST", r"/v1/benefits", benefits, True),
+]
+_ROUTES = [
+    (method, re.compile(pattern + "/?"), handler, limited)
+    for method, pattern, handler, limited in ROUTES
+]
+
+
+class WalleAPI:
+    """ASGI 应用 (不依赖 Web 框架)，可以用 uvicorn 等任意 ASGI 服务器运行"""
+
+    def __init__(self, user_limit=API_USER_CONCURRENCY):
+        self.concurrency = UserConcurrency(user_limit)
+
+    def route(self, method, path):
+        allowed = False
+        for route_method, pattern, handler, limited in _ROUTES:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method == method:
+                return handler, match.groupdict(), limited
+            allowed = True
+        raise HTTPError(405 if allowed else 404, "Not found")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        started = False
+
+        async def tracking_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            handler, params, limited = self.route(scope["method"], scope["path"])
+            request = Request(scope, receive, params)
+            if limited:
+                async with self.concurrency.slot(request.user_id):
+                    await handler(request, tracking_send)
+            else:
+                await handler(request, tracking_send)
+        except HTTPError as e:
+            if not started:
+                await send_json(send, e.status, {"error": e.message})
+        except Exception as e:
+            logger.exception(f"Unhandled error on {scope['path']}: {e}")
+            if not started:
+                await send_json(send, 500, {"error": "Internal server error"})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = WalleAPI()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Walle HTTP API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run("src.api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,47 @@
 import datetime
-import json
 import os
 import sys
-import time
 
 import streamlit as st
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 
 # --- 路径配置 (必须在 import src 之前) ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.startup import StartupTimer
+
+# ⏱️ 启动计时: 记录本次脚本运行各阶段的耗时
+startup_timer = StartupTimer()
+
 # 引入新工具
-from src.models import CreditCard
+from src.agent import (
+    analyze_benefits,
+    apply_local_engines,
+    build_contents,
+    build_system_instruction,
+    cached_stream_reply,
+    make_gemini_summarizer,
+)
+from src.clients import clients
+from src.history import ConversationHistory
+from src.jobs import CANCELLED, FAILED, JOB_POLL_INTERVAL, job_runner
+from src.models import POPULAR_CARDS, CreditCard
+from src.response_cache import response_cache
 from src.storage import (
     delete_card_from_db,
     load_user_data,
     save_new_card,
     update_card_in_db,
 )
-from src.tools.search import search_credit_card_info
+from src.tracing import hash_user, span, tracer, waterfall
+from src.transcript import Transcript
 from src.utils import (
     create_google_calendar_url,
     create_ics_file_content,
     get_available_models,
 )
+from src.warmup import start_warmup_scheduler
+
+startup_timer.mark("imports")
 
 # --- 1. 国际化字典 (Translation Dictionary) ---
 TRANSLATIONS = {
@@ -69,6 +86,13 @@ TRANSLATIONS = {
         "chat_placeholder": "E.g., Which card for groceries?",
         "thinking": "Thinking...",
         "done": "Done",
+        "load_earlier": "⬆️ Load earlier messages ({count} more)",
+        "cancel_btn": "⏹️ Cancel",
+        "cancelled": "Cancelled",
+        "benefits_running": "⏳ Scanning your wallet benefits... {seconds}s",
+        "trace_title": "🔬 Last turn trace",
+        "trace_empty": "No traced chat turn yet.",
+        "refresh_btn": "🔄 Refresh",
         "login_required_title": "Welcome to Walle AI 🤖",
         "login_required_msg": "Your personal credit card maximizer agent.\n\n👈 **Please login using your email in the sidebar to start.**\n\n*(Data is securely stored in your private Google Sheet)*",
     },
@@ -113,6 +137,13 @@ TRANSLATIONS = {
         "chat_placeholder": "例如：买菜刷哪张卡？",
         "thinking": "思考中...",
         "done": "完成",
+        "load_earlier": "⬆️ 加载更早的消息 (还有 {count} 条)",
+        "cancel_btn": "⏹️ 取消",
+        "cancelled": "已取消",
+        "benefits_running": "⏳ 正在分析卡包福利... {seconds}s",
+        "trace_title": "🔬 上一轮对话的耗时",
+        "trace_empty": "还没有被追踪的对话。",
+        "refresh_btn": "🔄 刷新",
         "login_required_title": "欢迎来到 Walle AI 🤖",
         "login_required_msg": "您的个人信用卡智能助手。\n\n👈 **请在左侧侧边栏输入邮箱登录以开始。**\n\n*(数据安全地存储在您的私人 Google Sheet 中)*",
     },
@@ -176,9 +207,24 @@ st.markdown(
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
+
+# --- 后台预热任务: 每个进程只启动一次 (季度类别、福利重置的搜索结果) ---
+@st.cache_resource
+def start_background_warmup():
+    return start_warmup_scheduler()
+
+
+start_background_warmup()
+
+
+def report_startup(stage):
+    """每个 session 只在第一次渲染完成时写一次启动耗时报告"""
+    startup_timer.mark(stage)
+    if "startup_report" not in st.session_state:
+        st.session_state.startup_report = startup_timer.report()
+
+
 # --- 初始化 Session State ---
-if "messages" not in st.session_state:
-    st.session_state.messages = []
 if "active_edit_index" not in st.session_state:
     st.session_state.active_edit_index = None
 if "language" not in st.session_state:
@@ -206,122 +252,135 @@ def get_network_icon(network):
     return icons.get(network, "❓")
 
 
-# --- 数据预设 (保持不变) ---
-POPULAR_CARDS = {
-    "Chase": [
-        "Sapphire Preferred",
-        "Sapphire Reserve",
-        "Freedom Flex",
-        "Freedom Unlimited",
-        "Ink Business Preferred",
-        "Hyatt",
-    ],
-    "Amex": ["Platinum", "Gold", "Green", "Blue Cash Preferred", "Delta SkyMiles Gold"],
-    "Citi": ["Premier", "Double Cash", "Custom Cash"],
-    "Capital One": ["Venture X", "SavorOne"],
-    "Discover": ["It Cash Back"],
-    "Bilt": ["Bilt Mastercard"],
-    "Bank of America": ["Cash Rewards"],
-    "Other": [],
-}
-
-
-def analyze_benefits_with_gemini(user_profile):
-    """调用 AI 分析当前卡片的福利，并返回结构化 JSON"""
-    client = get_gemini_client()
-    today_year = datetime.date.today().year
-
-    lang = st.session_state.get("language", "en")
-    lang_instruction = (
-        "Output the 'benefit' and 'description' values in Simplified Chinese."
-        if lang == "zh"
-        else "Output in English."
-    )
-    # 构造专门的 Prompt
-    prompt = f"""
-    Analyze the following credit cards held by the user:
-    {user_profile.get_summary()}
-    
-    Task:
-    Identify time-sensitive benefits (credits, free nights, allowances) that expire annually or monthly.
-    Return a JSON list. Do not output markdown code blocks, just raw JSON.
-    {lang_instruction}
-    
-    Format:
-    [
-        {{
-            "card": "Card Name",
-            "benefit": "Benefit Title (e.g. $50 Hotel Credit)",
-            "deadline": "YYYY-MM-DD" (Assume current year {today_year}. If monthly, use end of this month),
-            "description": "Brief instruction on how to use it."
-        }}
-    ]
+def analyze_benefits_with_gemini(user_profile, lang="en", session=None, cancel=None):
+    """
+    调用 AI 分析当前卡片的福利，并返回结构化 JSON (失败或被取消时返回空列表)。
+    在后台 job 线程中运行，不能访问 st.session_state (需要的值由调用方传入)
     """
-
     try:
-        response = client.models.generate_content(
-            model="gemini-flash-latest", contents=[prompt]
+        return analyze_benefits(
+            get_gemini_client(), user_profile, lang, session, cancel=cancel
         )
-        # 清洗数据，防止 AI 加 ```json 包裹
-        clean_text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_text)
     except Exception:
+        # 错误已由 clients.track 记录 (见 src/clients.py)
         return []
 
 
 # --- Gemini 逻辑 (保持不变) ---
 def get_gemini_client():
-    return genai.Client(api_key=api_key)
+    # 进程内复用同一个 genai.Client (连接池 + keep-alive)，见 src/clients.py
+    return clients.get("gemini")
 
 
-def generate_response_with_retry(prompt, history):
-    client = get_gemini_client()
-    user_p = st.session_state.user_profile
+def get_history_manager():
+    """每个 session 一个 ConversationHistory，超出 token 预算的旧消息折叠成滚动摘要"""
+    if "history_manager" not in st.session_state:
+        st.session_state.history_manager = ConversationHistory(
+            summarizer=make_gemini_summarizer()
+        )
+    return st.session_state.history_manager
+
+
+def stream_response(
+    prompt,
+    history,
+    user_p,
+    lang,
+    manager,
+    session=None,
+    turn=None,
+    offset=0,
+    cancel=None,
+):
+    """
+    流式生成回答 (逐块 yield 文本)，工具调用在 agent.stream_reply 中完成。
+    在后台 job 线程中运行，不能访问 st.session_state；本轮 token 统计写入 turn (dict)
+    history 是整段对话从第 offset 条开始的部分；cancel 是所在 job 的取消标志
+    """
+    model = "gemini-flash-latest"
+    with span("chat.turn", user=hash_user(session), lang=lang, model=model) as s:
+        with span("prompt.build"):
+            system_instruction = build_system_instruction(user_p, lang)
+
+            # "吃饭刷哪张卡" 这类问题由本地返现引擎直接回答 (<10ms，不调用 API)
+            direct, system_instruction = apply_local_engines(
+                user_p, prompt, system_instruction, lang
+            )
+        if direct is not None:
+            s.set(source="local")
+            yield direct
+            return
+
+        client = get_gemini_client()
+        with span("history.compact", messages=len(history)):
+            prompt_history = manager.compact(history, offset)
+        contents = build_contents(prompt_history, prompt)
+
+        usage = {}
+        try:
+            yield from cached_stream_reply(
+                client,
+                model,
+                contents,
+                system_instruction,
+                usage=usage,
+                session=session,
+                cancel=cancel,
+            )
+        except Exception as e:
+            s.set(error=str(e))
+            yield f"Error: {str(e)}"
+
+        s.set(
+            source="model",
+            cache_hit=usage.get("cache_hit", False),
+            prompt_tokens=usage.get("prompt_token_count"),
+            output_tokens=usage.get("candidates_token_count"),
+        )
+        if turn is not None:
+            turn.update(
+                manager.record_turn(
+                    prompt_history, prompt, usage.get("prompt_token_count")
+                )
+            )
 
-    # 🔥 1. 获取准确的今天日期
-    today_str = datetime.date.today().strftime("%Y-%m-%d")
 
-    lang_instruction = (
-        "Respond in English." if st.session_state.language == "en" else "请用中文回答。"
-    )
+# --- 后台任务: LLM 调用在共享线程池中执行，脚本线程只负责提交和展示进度 ---
+def submit_chat_job(prompt, history, offset=0):
+    """同一个 session 中相同的问题在生成期间只会提交一次"""
+    user_p = st.session_state.user_profile
+    lang = st.session_state.language
+    manager = get_history_manager()
+    session = st.session_state.get("user_id")
+
+    def run(job):
+        return stream_response(
+            prompt,
+            history,
+            user_p,
+            lang,
+            manager,
+            session,
+            job.info,
+            offset,
+            cancel=job.cancel_event,
+        )
 
-    # 🔥 2. 强制在 System Prompt 的最开头注入日期
-    # 注意：这里必须用 f""" ... """ 格式化字符串
-    SYSTEM_INSTRUCTION = f"""
-    [SYSTEM INFO]
-    Current Date: {today_str}
-    Role: You are Walle, an expert credit card agent.
-    
-    [USER CONTEXT]
-    {user_p.get_summary()}
-    
-    [TASK GUIDELINES]
-    1. Always SEARCH before answering about quarterly categories.
-    2. For Chase 5/24 Rule:
-       - Today is {today_str}.
-       - Check the 'Opened' date of each card in User Context.
-       - Any card opened more than 24 months ago does NOT count.
-       - Only count cards opened strictly within the last 24 months.
-       - Example: If today is 2026-01-02, a card opened on 2023-07-01 is >24 months old (30 months), so count = 0.
-    
-    {lang_instruction}
-    """
+    return job_runner.submit(session, f"chat:{prompt}", run, label="chat")
 
-    tools = [search_credit_card_info]
-    contents = [msg["content"] for msg in history]
-    contents.append(prompt)
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-flash-latest",
-            contents=contents,
-            config=types.GenerateContentConfig(
-                tools=tools, system_instruction=SYSTEM_INSTRUCTION
-            ),
-        )
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
+def submit_benefits_job():
+    user_p = st.session_state.user_profile
+    lang = st.session_state.language
+    session = st.session_state.get("user_id")
+    return job_runner.submit(
+        session,
+        "benefits",
+        lambda job: analyze_benefits_with_gemini(
+            user_p, lang, session, cancel=job.cancel_event
+        ),
+        label="benefits",
+    )
 
 
 # --- 1. 登录逻辑与侧边栏 (Sidebar) ---
@@ -363,6 +422,32 @@ def render_login_sidebar():
         # 将选中的真实 Model ID 存入 Session State
         st.session_state.selected_model_id = available_models[selected_label]
 
+        # 回答缓存命中情况 (同样的问题 + 同样的卡包会直接复用之前的回答)
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"⚡ Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses"
+        )
+        # 长连接客户端的状态 (连接时长 / 错误数)
+        st.caption(
+            "🔌 "
+            + " · ".join(
+                f"{name}: {'✅' if c['connected'] else '⚪'}"
+                + (f" {c['age_seconds'] // 60}m" if c["connected"] else "")
+                + (f" ({c['errors']} err)" if c["errors"] else "")
+                for name, c in clients.stats().items()
+            )
+        )
+        # 后台 LLM 任务 (所有 session 共享的线程池)
+        jobs = job_runner.stats()
+        st.caption(f"🧵 Jobs: {jobs['running']} running / {jobs['queued']} queued")
+        # 首屏渲染耗时 (cold = 进程启动后的第一次渲染)
+        report = st.session_state.get("startup_report")
+        if report:
+            st.caption(
+                f"⏱️ Startup ({'cold' if report['cold'] else 'warm'}): "
+                f"{max(report['marks'].values(), default=0):.2f}s"
+            )
+
         st.divider()
         # 👤 2. 登录/用户信息区域
         st.title(t("login_title"))
@@ -375,8 +460,7 @@ def render_login_sidebar():
                     if email_input:
                         user_id = email_input.strip().lower()
                         st.session_state.user_id = user_id
-                        st.success(t("welcome", user=user_id))
-                        time.sleep(0.5)
+                        st.toast(t("welcome", user=user_id))
                         st.rerun()
             return None
         else:
@@ -384,8 +468,9 @@ def render_login_sidebar():
             st.success(t("user_label", user=current_user))
             if st.button(t("logout_btn"), type="secondary"):
                 del st.session_state.user_id
-                if "user_profile" in st.session_state:
-                    del st.session_state.user_profile
+                for key in ("user_profile", "transcript", "history_manager"):
+                    if key in st.session_state:
+                        del st.session_state[key]
                 st.rerun()
             return current_user
 
@@ -398,6 +483,7 @@ if not CURRENT_USER_ID:
     # 🌟 修改：直接显示标题，不再需要右上角的语言选择列
     st.title(t("login_required_title"))
     st.markdown(t("login_required_msg"))
+    report_startup("login")
     st.stop()
 
 # ==========================================
@@ -408,12 +494,20 @@ if not CURRENT_USER_ID:
 if "user_profile" not in st.session_state:
     with st.spinner("Loading..."):
         st.session_state.user_profile = load_user_data(user_id=CURRENT_USER_ID)
+# 聊天记录: 内存中只保留最近的窗口，更早的消息在磁盘上 (重新登录后接着之前的对话)
+if "transcript" not in st.session_state:
+    st.session_state.transcript = Transcript(CURRENT_USER_ID)
+startup_timer.mark("wallet")
 
-# --- 侧边栏：卡包管理 ---
-with st.sidebar:
-    st.divider()
-    st.header(t("sidebar_title"))
+# ==========================================
+# 🧩 Fragments: 卡包、福利日历、聊天各自独立重跑
+# 交互只重跑所在的 fragment，不会重新执行整个脚本 (CSS、模型选择、其它区域)；
+# 本地状态先更新 (乐观更新)，写库由存储层在后台完成
+# ==========================================
 
+
+@st.fragment
+def render_wallet():
     # === A. My Wallet ===
     st.subheader(t("wallet_header"))
     user = st.session_state.user_profile
@@ -445,8 +539,6 @@ with st.sidebar:
                                 t("last4_label"), value=card.last_four, max_chars=4
                             )
 
-                        import datetime
-
                         default_date = None
                         if card.open_date:
                             try:
@@ -466,14 +558,19 @@ with st.sidebar:
                                 else ""
                             )
                             updated = CreditCard(
-                                new_bank, new_name, new_net, new_last4, d_str
+                                new_bank,
+                                new_name,
+                                new_net,
+                                new_last4,
+                                open_date=d_str,
+                                card_id=card.card_id,
                             )
-                            update_card_in_db(CURRENT_USER_ID, i, updated)
+                            update_card_in_db(CURRENT_USER_ID, card.card_id, updated)
                             user.cards[i] = updated
                             st.session_state.active_edit_index = None
-                            st.success(t("edit_updated"))
-                            time.sleep(0.5)
-                            st.rerun()
+                            # toast 在重跑后依然可见，不需要 sleep 等用户看到提示
+                            st.toast(t("edit_updated"))
+                            st.rerun(scope="fragment")
                 else:
                     # [查看模式]
                     st.write(f"**{t('network_label')}:** {card.network}")
@@ -485,12 +582,13 @@ with st.sidebar:
                     with ce:
                         if st.button(t("btn_edit"), key=f"btn_edit_{i}"):
                             st.session_state.active_edit_index = i
-                            st.rerun()
+                            st.rerun(scope="fragment")
                     with cd:
                         if st.button(t("btn_del"), key=f"del_{i}"):
-                            delete_card_from_db(CURRENT_USER_ID, i)
+                            delete_card_from_db(CURRENT_USER_ID, card.card_id)
                             user.cards.pop(i)
-                            st.rerun()
+                            st.session_state.active_edit_index = None
+                            st.rerun(scope="fragment")
 
     # === B. Add New Card ===
     st.divider()
@@ -525,26 +623,64 @@ with st.sidebar:
         if st.button(t("add_btn"), use_container_width=True):
             if f_bank and f_card:
                 d_str = f_date.strftime("%Y-%m-%d") if f_date else ""
-                new_c = CreditCard(f_bank, f_card, f_net, f_last4, d_str)
+                new_c = CreditCard(f_bank, f_card, f_net, f_last4, open_date=d_str)
                 save_new_card(CURRENT_USER_ID, new_c)
                 st.session_state.user_profile.add_card(new_c)
-                st.success(t("added_msg", card=f_card))
-                time.sleep(0.5)
-                st.rerun()
+                st.toast(t("added_msg", card=f_card))
+                st.rerun(scope="fragment")
             else:
                 st.error(t("missing_info"))
 
+
+@st.fragment
+def render_trace_panel():
+    """调试面板: 当前用户上一轮对话的耗时瀑布图 (WALLE_TRACING=1 时显示)"""
+    with st.expander(t("trace_title")):
+        st.button(t("refresh_btn"), key="refresh_trace")
+        trace = tracer.last_trace(
+            "chat.turn", user=hash_user(st.session_state.get("user_id"))
+        )
+        if trace is None:
+            st.caption(t("trace_empty"))
+            return
+        root = trace.root.attributes
+        st.caption(
+            " · ".join(
+                f"{k}: {root[k]}"
+                for k in ("source", "cache_hit", "prompt_tokens", "output_tokens")
+                if root.get(k) is not None
+            )
+        )
+        st.code(waterfall(trace), language=None)
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_benefits_progress():
+    """福利分析任务的进度 (定时轮询)，完成后刷新页面展示结果"""
+    job = st.session_state.get("benefits_job")
+    if job is None:
+        return
+    if job.done:
+        st.session_state.benefits_job = None
+        if job.status not in (CANCELLED, FAILED):
+            st.session_state.benefits_result = job.result
+        st.rerun()
+    st.caption(t("benefits_running", seconds=int(job.elapsed)))
+    if st.button(t("cancel_btn"), key="cancel_benefits", use_container_width=True):
+        job_runner.cancel(job)
+
+
+@st.fragment
+def render_benefit_reminders():
     # === C. Benefit Reminders (新功能区域) ===
-    st.divider()
     with st.expander("🎁 Benefit Reminders / 福利日历", expanded=False):
         st.caption("AI Auto-detects expiring credits")
 
+        # 分析在后台执行，期间聊天等操作不受影响；重复点击不会重复提交
         if st.button("🔍 Analyze & Generate Calendar", use_container_width=True):
-            with st.spinner("AI is scanning your wallet benefits..."):
-                benefits_data = analyze_benefits_with_gemini(
-                    st.session_state.user_profile
-                )
-                st.session_state.benefits_result = benefits_data
+            st.session_state.benefits_job = submit_benefits_job()
+        if st.session_state.get("benefits_job") is not None:
+            render_benefits_progress()
 
         # 显示结果
         if "benefits_result" in st.session_state and st.session_state.benefits_result:
@@ -578,54 +714,133 @@ with st.sidebar:
                 st.divider()
 
 
-# --- 主界面 Layout ---
+def close_pending_turn(transcript):
+    """
+    上一轮还没有回答完 (生成被新的输入打断) 时，取消它的后台任务，
+    并把已生成的部分作为 assistant 消息记录下来，保证 user / assistant 交替
+    """
+    job = st.session_state.get("chat_job")
+    st.session_state.chat_job = None
+    finished = job is not None and job.done and job.status not in (CANCELLED, FAILED)
+    if job is not None and not job.done:
+        job_runner.cancel(job)
+    if transcript and transcript[-1]["role"] == "user":
+        resp = job.text if job is not None else ""
+        if not finished:
+            resp = f"{resp}\n\n⏹️ _{t('cancelled')}_".strip()
+        transcript.append("assistant", resp)
+        with st.chat_message("assistant"):
+            st.markdown(resp)
+
+
+@st.fragment
+def render_chat():
+    prompt = None
+    transcript = st.session_state.transcript
+
+    # --- Hero Section (空状态) ---
+    hero = st.empty()
+    if not transcript:
+        with hero.container():
+            st.markdown(f"### {t('hero_title')}")
+            st.markdown(t("hero_subtitle"))
+
+            c1, c2 = st.columns(2)
+            with c1:
+                if st.button(t("hero_btn_dining"), use_container_width=True):
+                    prompt = t("hero_query_dining")
+                if st.button(t("hero_btn_q1"), use_container_width=True):
+                    prompt = t("hero_query_q1")
+            with c2:
+                if st.button(t("hero_btn_travel"), use_container_width=True):
+                    prompt = t("hero_query_travel")
+                if st.button(t("hero_btn_524"), use_container_width=True):
+                    prompt = t("hero_query_524")
+
+    # --- 聊天记录 (只渲染内存中的窗口，更早的消息按页从磁盘加载) ---
+    if transcript.has_earlier and st.button(
+        t("load_earlier", count=transcript.offset), key="load_earlier"
+    ):
+        transcript.load_earlier()
+        st.rerun(scope="fragment")
+    for msg in transcript:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+    # --- 输入框 ---
+    if typed := st.chat_input(t("chat_placeholder")):
+        prompt = typed
+
+    if prompt:
+        # 直接在本次运行中渲染新问题并开始生成，不需要先 st.rerun() 一次
+        hero.empty()
+        close_pending_turn(transcript)
+        transcript.append("user", prompt)
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+    if transcript and transcript[-1]["role"] == "user":
+        last = transcript[-1]["content"]
+        # 模型的上下文从摘要之后开始 (不早于本 session 开始时的窗口)
+        start = max(get_history_manager().folded, transcript.start)
+        hist = transcript.since(start)[:-1]
+        # 生成在后台线程中进行；脚本运行被打断后重新进入时，继续展示同一个任务的输出
+        job = st.session_state.get("chat_job")
+        if job is None or job.key != f"chat:{last}":
+            job = st.session_state.chat_job = submit_chat_job(last, hist, start)
+
+        with st.chat_message("assistant"):
+            status = st.status(t("thinking"), expanded=False)
+            if not job.done and st.button(t("cancel_btn"), key=f"cancel_{job.id}"):
+                job_runner.cancel(job)
+
+            def stream_with_status():
+                # 收到第一个 token 时把 "Thinking..." 标记为完成
+                for i, chunk in enumerate(job.follow()):
+                    if i == 0:
+                        status.update(label=t("done"), state="complete")
+                    yield chunk
+                if job.status == CANCELLED:
+                    status.update(label=t("cancelled"), state="error")
+                else:
+                    status.update(label=t("done"), state="complete")
+
+            # st.write_stream 逐块渲染
+            st.write_stream(stream_with_status())
+            resp = job.text or (f"Error: {job.error}" if job.error else "")
+            if job.status == CANCELLED:
+                resp += f"\n\n⏹️ _{t('cancelled')}_"
+
+            # 本轮 prompt 的 token 统计
+            turn = job.info
+            if turn:
+                tokens = turn["actual_tokens"] or f"~{turn['estimated_tokens']}"
+                st.caption(
+                    f"🧮 Prompt tokens: {tokens} · "
+                    f"{turn['verbatim_messages']} recent msgs verbatim, "
+                    f"{turn['summarized_messages']} summarized"
+                )
+        transcript.append("assistant", resp)
+        st.session_state.chat_job = None
 
-# 🌟 修改：直接显示标题，删除之前的 col_main_title / col_main_lang 分栏逻辑
-st.title(t("page_title"))
-st.caption(t("page_caption"))
 
+# --- 侧边栏：卡包管理 ---
+with st.sidebar:
+    st.divider()
+    st.header(t("sidebar_title"))
+    render_wallet()
+    st.divider()
+    render_benefit_reminders()
+    if tracer.enabled:
+        render_trace_panel()
 
-# --- Hero Section (空状态) ---
-if not st.session_state.messages:
-    st.markdown(f"### {t('hero_title')}")
-    st.markdown(t("hero_subtitle"))
 
-    c1, c2 = st.columns(2)
+# --- 主界面 Layout ---
 
-    def ask(txt):
-        st.session_state.messages.append({"role": "user", "content": txt})
+# 🌟 修改：直接显示标题，删除之前的 col_main_title / col_main_lang 分栏逻辑
+st.title(t("page_title"))
+st.caption(t("page_caption"))
 
-    with c1:
-        if st.button(t("hero_btn_dining"), use_container_width=True):
-            ask(t("hero_query_dining"))
-            st.rerun()
-        if st.button(t("hero_btn_q1"), use_container_width=True):
-            ask(t("hero_query_q1"))
-            st.rerun()
-    with c2:
-        if st.button(t("hero_btn_travel"), use_container_width=True):
-            ask(t("hero_query_travel"))
-            st.rerun()
-        if st.button(t("hero_btn_524"), use_container_width=True):
-            ask(t("hero_query_524"))
-            st.rerun()
+report_startup("main")
 
-# --- 聊天记录 ---
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
-
-# --- 输入框 ---
-if prompt := st.chat_input(t("chat_placeholder")):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    st.rerun()
-
-if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-    with st.chat_message("assistant"):
-        with st.status(t("thinking"), expanded=False) as status:
-            hist = st.session_state.messages[:-1]
-            last = st.session_state.messages[-1]["content"]
-            resp = generate_response_with_retry(last, hist)
-            status.update(label=t("done"), state="complete")
-        st.markdown(resp)
-    st.session_state.messages.append({"role": "assistant", "content": resp})
+render_chat()
@@ -0,0 +1,48 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Tuple
+
+from src.models import CreditCard, UserProfile
+
+
+class StorageBackend(ABC):
+    """
+    卡包存储后端接口。
+
+    卡片通过 CreditCard.card_id 定位，load_user_data 返回的卡片按添加顺序排列。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def load_user_data(self, user_id) -> UserProfile:
+        """读取某个用户的全部卡片"""
+
+    @abstractmethod
+    def save_new_card(self, user_id, card: CreditCard):
+        """追加一张卡片"""
+
+    @abstractmethod
+    def update_card(self, user_id, card_id, card: CreditCard):
+        """更新 card_id 对应的卡片 (card_id 保持不变)"""
+
+    @abstractmethod
+    def delete_card(self, user_id, card_id):
+        """删除 card_id 对应的卡片"""
+
+    @abstractmethod
+    def export_cards(self) -> List[Tuple[str, CreditCard]]:
+        """导出所有用户的卡片 [(user_id, card), ...]，用于后端之间的迁移"""
+
+    @abstractmethod
+    def import_cards(self, items: Iterable[Tuple[str, CreditCard]]):
+        """批量写入 [(user_id, card), ...]，用于后端之间的迁移"""
+
+    def revision(self):
+        """
+        返回代表当前数据版本的廉价标识 (数据变化时随之变化)，用于校验读缓存。
+        不支持时返回 None，此时缓存只依靠 TTL 和本地写入时的失效。
+        """
+        return None
+
+    def flush(self):
+        """把缓冲中的写入落盘 (默认无缓冲)"""
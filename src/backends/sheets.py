@@ -0,0 +1,576 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import gspread
+import streamlit as st
+from google.oauth2.service_account import Credentials
+
+from src.backends.base import StorageBackend
+from src.clients import clients
+from src.config import data_path
+from src.models import CreditCard, UserProfile, new_card_id
+from src.write_queue import WriteBehindQueue, WriteJournal
+
+logger = logging.getLogger(__name__)
+
+# 定义权限范围
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+# 表格结构: A-G 列依次为 user_id, bank, card_name, network, last_four, open_date, card_id
+LAST_COLUMN = "G"
+NUM_COLUMNS = 7
+CARD_ID_COLUMN = "G"
+
+# Write-behind 批量写入配置: 刷写间隔 (秒) 与触发立即刷写的队列长度
+WRITE_BEHIND_ENABLED = os.getenv("WALLE_WRITE_BEHIND", "1") != "0"
+WRITE_FLUSH_INTERVAL = float(os.getenv("WALLE_WRITE_FLUSH_INTERVAL", "2.0"))
+WRITE_MAX_BATCH = int(os.getenv("WALLE_WRITE_MAX_BATCH", "20"))
+
+# 行号索引的最长有效期 (秒)，过期后下一次访问时懒重建。
+# 平时靠表格的 revision 发现 App 之外的修改，这里只是兜底
+ROW_INDEX_MAX_AGE = 300
+
+
+class SheetRowIndex:
+    """
+    进程内维护的 user_id → 表格行号 (1-based) 以及 card_id → 行号 索引。
+
+    构建时只下载 A 列 (user_id) 和 G 列 (card_id)，之后在追加/删除时增量维护，
+    这样单个用户的读取只需要按行号做范围读取，修改/删除可以直接定位到行，而不必拉取整张表。
+
+    表格在 App 之外被修改 (其它 Streamlit worker、API 服务进程、手动编辑) 时，
+    表格的 revision 会变化，通过 observe_revision() 让索引失效。
+    """
+
+    def __init__(self, max_age=ROW_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._rows = {}  # user_id -> [row_number, ...] (升序)
+        self._card_rows = {}  # card_id -> row_number
+        self._built_at = None
+        self._revision = None  # 最近一次看到的表格 revision
+        self._local_write = False  # 之后的 revision 变化是否可能来自本进程的写入
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """标记索引失效，下次访问时重建"""
+        with self._lock:
+            self._built_at = None
+
+    def record_local_write(self):
+        """本进程写入表格后调用: 下一次 revision 变化由这次写入解释，索引已经增量维护过"""
+        with self._lock:
+            self._local_write = True
+
+    def observe_revision(self, revision):
+        """
+        记录表格当前的 revision。与上次看到的不同、且没有本进程的写入可以解释时，
+        说明表格在 App 之外被修改过 (可能追加了行)，索引失效后懒重建。
+        """
+        with self._lock:
+            if revision != self._revision and not self._local_write:
+                self._built_at = None
+            self._revision = revision
+            self._local_write = False
+
+    def rebuild(self, sheet):
+        """只读取 A 列和 G 列重建索引，顺便为缺少 card_id 的旧数据回填 ID"""
+        user_col, id_col = sheet.batch_get(
+            ["A:A", f"{CARD_ID_COLUMN}:{CARD_ID_COLUMN}"]
+        )
+        user_ids = [cell[0] if cell else "" for cell in user_col]
+        card_ids = [cell[0] if cell else "" for cell in id_col]
+        card_ids += [""] * (len(user_ids) - len(card_ids))
+
+        _backfill_card_ids(sheet, user_ids, card_ids)
+
+        rows, card_rows = {}, {}
+        # 第 1 行是表头，数据从第 2 行开始
+        for row_num, (uid, card_id) in enumerate(
+            zip(user_ids[1:], card_ids[1:]), start=2
+        ):
+            if uid:
+                rows.setdefault(uid, []).append(row_num)
+                card_rows[card_id] = row_num
+        with self._lock:
+            self._rows = rows
+            self._card_rows = card_rows
+            self._built_at = time.monotonic()
+
+    def _ensure(self, sheet):
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild(sheet)
+
+    def rows_for(self, sheet, user_id):
+        """返回该用户所有卡片所在的行号 (按表格顺序)"""
+        with self._lock:
+            self._ensure(sheet)
+            return list(self._rows.get(user_id, []))
+
+    def row_of(self, sheet, card_id):
+        """O(1) 返回某张卡片所在的行号，找不到时返回 None"""
+        with self._lock:
+            self._ensure(sheet)
+            return self._card_rows.get(card_id)
+
+    def record_append(self, user_id, card_id, row_num):
+        with self._lock:
+            if self._built_at is None:
+                return
+            user_rows = self._rows.setdefault(user_id, [])
+            user_rows.append(row_num)
+            user_rows.sort()
+            self._card_rows[card_id] = row_num
+
+    def record_delete(self, row_num):
+        """删除一行后，之后的所有行号都要减 1"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            for uid, user_rows in self._rows.items():
+                self._rows[uid] = [
+                    r - 1 if r > row_num else r for r in user_rows if r != row_num
+                ]
+            self._card_rows = {
+                card_id: r - 1 if r > row_num else r
+                for card_id, r in self._card_rows.items()
+                if r != row_num
+            }
+
+
+_row_index = SheetRowIndex()
+
+
+def _backfill_card_ids(sheet, user_ids, card_ids):
+    """
+    为还没有 card_id 的旧数据行生成 ID 并写回 G 列 (一次请求)。
+    user_ids / card_ids 是整列的值 (包含表头)，会被原地补全。
+    """
+    updates = []
+    if card_ids and card_ids[0] != "card_id":
+        card_ids[0] = "card_id"
+        updates.append({"range": f"{CARD_ID_COLUMN}1", "values": [["card_id"]]})
+
+    for i, (uid, card_id) in enumerate(zip(user_ids, card_ids)):
+        if i > 0 and uid and not card_id:
+            card_ids[i] = new_card_id()
+            updates.append(
+                {"range": f"{CARD_ID_COLUMN}{i + 1}", "values": [[card_ids[i]]]}
+            )
+
+    if updates:
+        logger.info(f"Backfilling {len(updates)} card_id cells")
+        sheet.batch_update(updates)
+
+
+def _parse_appended_row(response):
+    """从 append_row 的返回值 (e.g. 'Cards!A12:G12') 中解析出新行号"""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+
+def _collapse_ranges(row_nums):
+    """把行号列表合并成连续区间，减少 batch_get 请求里的 range 数量"""
+    ranges = []
+    for r in row_nums:
+        if ranges and r == ranges[-1][1] + 1:
+            ranges[-1][1] = r
+        else:
+            ranges.append([r, r])
+    return [f"A{start}:{LAST_COLUMN}{end}" for start, end in ranges]
+
+
+def _read_user_rows(sheet, user_id):
+    """
+    按索引范围读取该用户的所有行。
+    如果读到的行不属于该用户 (表格在 App 之外被修改过)，重建索引后重试一次。
+    """
+    for _ in range(2):
+        row_nums = _row_index.rows_for(sheet, user_id)
+        if not row_nums:
+            return []
+
+        values = []
+        for value_range in sheet.batch_get(_collapse_ranges(row_nums)):
+            values.extend(value_range)
+
+        # 补齐末尾被 API 省略的空单元格
+        values = [row + [""] * (NUM_COLUMNS - len(row)) for row in values]
+
+        if len(values) == len(row_nums) and all(
+            row[0] == user_id and row[6] for row in values
+        ):
+            return values
+
+        _row_index.invalidate()
+
+    return [row for row in values if row[0] == user_id and row[6]]
+
+
+def _verify_rows(sheet, card_rows):
+    """批量校验 {card_id: row_num} 中每一行的 G 列确实是对应的卡片 (一次请求)"""
+    if not card_rows:
+        return True
+    checks = list(card_rows.items())
+    cells = sheet.batch_get([f"{CARD_ID_COLUMN}{r}" for _, r in checks])
+    return all(
+        cell and cell[0] and cell[0][0] == card_id
+        for (card_id, _), cell in zip(checks, cells)
+    )
+
+
+def _resolve_ops(sheet, ops):
+    """
+    按顺序回放队列中的操作，把 card_id 解析为真实行号。
+    返回 (updates, deletes, appends):
+        updates: {row_num: row_data}
+        deletes: set(row_num)
+        appends: [row_data, ...]
+    """
+    pending = {}  # 排队中新增、尚未写入表格的卡片: card_id -> row_data
+    existing = []
+    for op in ops:
+        if op["op"] == "append":
+            pending[op["card_id"]] = op["row"]
+        elif op["card_id"] not in pending:
+            existing.append(op["card_id"])
+
+    for _ in range(2):
+        card_rows = {card_id: _row_index.row_of(sheet, card_id) for card_id in existing}
+        missing = None in card_rows.values()
+        card_rows = {k: v for k, v in card_rows.items() if v is not None}
+        if not missing and _verify_rows(sheet, card_rows):
+            break
+        _row_index.invalidate()
+
+    updates, deletes = {}, set()
+    for op in ops:
+        card_id = op["card_id"]
+        if op["op"] == "append":
+            continue
+
+        if card_id in pending:
+            if op["op"] == "update":
+                pending[card_id] = op["row"]
+            else:
+                del pending[card_id]
+            continue
+
+        row_num = card_rows.get(card_id)
+        if row_num is None:
+            logger.warning(f"Dropping {op['op']} for unknown card_id {card_id}")
+            continue
+
+        if op["op"] == "update":
+            updates[row_num] = op["row"]
+        elif op["op"] == "delete":
+            deletes.add(row_num)
+            updates.pop(row_num, None)
+
+    return updates, deletes, list(pending.values())
+
+
+def _apply_sheet_batch(ops):
+    # 失败时记录到客户端注册表，认证失效会触发重建连接
+    with clients.track("sheets"):
+        _write_sheet_batch(ops)
+
+
+def _write_sheet_batch(ops):
+    """
+    把一批排队的操作合并成最多三次 API 调用:
+    一次 values batch_update (修改)、一次 batch_update (删行)、一次 append_rows (追加)
+    """
+    # 可能在后台线程或 atexit 中执行 (没有 Streamlit 上下文): 连接失败直接抛出，
+    # 由调用方记录日志，操作留在队列中稍后重试
+    sheet = clients.get("sheets")
+
+    updates, deletes, appends = _resolve_ops(sheet, ops)
+
+    # 1. 修改必须在删行之前执行，因为行号是按删除前计算的
+    if updates:
+        sheet.batch_update(
+            [
+                {"range": f"A{r}:{LAST_COLUMN}{r}", "values": [row]}
+                for r, row in updates.items()
+            ]
+        )
+
+    # 2. 从下往上删除，避免行号移动影响后续删除
+    if deletes:
+        ordered = sorted(deletes, reverse=True)
+        sheet.spreadsheet.batch_update(
+            {
+                "requests": [
+                    {
+                        "deleteDimension": {
+                            "range": {
+                                "sheetId": sheet.id,
+                                "dimension": "ROWS",
+                                "startIndex": r - 1,
+                                "endIndex": r,
+                            }
+                        }
+                    }
+                    for r in ordered
+                ]
+            }
+        )
+        for r in ordered:
+            _row_index.record_delete(r)
+
+    # 3. 追加新卡片
+    if appends:
+        response = sheet.append_rows(appends)
+        first_row = _parse_appended_row(response)
+        if first_row is None:
+            _row_index.invalidate()
+        else:
+            for offset, row in enumerate(appends):
+                _row_index.record_append(row[0], row[6], first_row + offset)
+
+    if updates or deletes or appends:
+        _row_index.record_local_write()
+
+
+_write_queue = WriteBehindQueue(
+    _apply_sheet_batch,
+    journal=WriteJournal.for_process(data_path("write_journal")),
+    flush_interval=WRITE_FLUSH_INTERVAL,
+    max_batch=WRITE_MAX_BATCH,
+)
+
+
+def _flush_at_exit():
+    """进程正常退出时尽量把剩余写入刷掉 (失败时日志保留，由下一个启动的进程重放)"""
+    if not _write_queue.has_pending():
+        return
+    try:
+        _write_queue.flush()
+    except Exception as e:
+        logger.error(f"Write-behind flush at exit failed, journal kept: {e}")
+
+
+atexit.register(_flush_at_exit)
+
+
+def _submit(op):
+    """提交一次写操作: 开启 write-behind 时入队，否则立即同步写入"""
+    if WRITE_BEHIND_ENABLED:
+        _write_queue.start()
+        _write_queue.enqueue(op)
+    else:
+        _apply_sheet_batch([op])
+
+
+def flush_pending_writes():
+    """立即把排队中的写操作刷到表格"""
+    _write_queue.flush()
+
+
+def _sheets_credential():
+    # 1. 将 secrets 转换为普通字典 (Streamlit secrets 有时是特殊对象)
+    return json.dumps(dict(st.secrets["gcp_service_account"]), sort_keys=True)
+
+
+def _open_worksheet(credential):
+    credentials_dict = json.loads(credential)
+
+    # 2. 🚑 关键修复：处理 private_key 中的换行符
+    # TOML 读取出来的 \n 有时是字符串字面量，需要转义为真正的换行符
+    if "private_key" in credentials_dict:
+        credentials_dict["private_key"] = credentials_dict["private_key"].replace(
+            "\\n", "\n"
+        )
+
+    # 创建认证凭证
+    creds = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+
+    # 授权并打开表格
+    client = gspread.authorize(creds)
+
+    # 打开表格
+    return client.open("walle_database").worksheet("Cards")
+
+
+clients.register("sheets", _open_worksheet, _sheets_credential)
+
+
+def get_db_connection():
+    """
+    连接到 Google Sheets (由 src/clients.py 统一管理: 进程内复用同一个连接，
+    service account 轮换或认证失败后自动重建)
+    """
+    try:
+        return clients.get("sheets")
+
+    except Exception as e:
+        # 打印更详细的错误堆栈，方便调试
+        import traceback
+
+        st.error(f"❌ Database Connection Error: {e}")
+        st.code(traceback.format_exc())  # 这行能让你看到具体的报错位置
+        return None
+
+
+def _load_user_data(user_id):
+    """
+    从表格读取数据，并转换为 UserProfile 对象
+    """
+    sheet = get_db_connection()
+    if not sheet:
+        return UserProfile(user_id)
+
+    # 读己之写: 该用户还有排队中的写入时，先刷写再读
+    if _write_queue.has_pending(user_id):
+        _write_queue.flush()
+
+    user = UserProfile(user_id=user_id)
+
+    # 只读取当前用户所在的行 (通过行号索引做范围读取)
+    with clients.track("sheets"):
+        rows = _read_user_rows(sheet, user_id)
+    for row in rows:
+        user.add_card(_row_to_card(row))
+
+    return user
+
+
+def _row_to_card(row):
+    # 注意：Benefit 这里暂时留空，或者让 AI 在运行时推理
+    # 如果你想存 Benefit，需要在表格加更多列，目前 V1 保持简单
+    return CreditCard(
+        bank=str(row[1]),
+        name=str(row[2]),
+        network=str(row[3]),
+        last_four=str(row[4]),
+        open_date=str(row[5]),
+        card_id=str(row[6]),
+    )
+
+
+def _card_to_row(user_id, card: CreditCard):
+    # 格式必须与表头一致: user_id, bank, card_name, network, last_four, open_date, card_id
+    return [
+        user_id,
+        card.bank,
+        card.name,
+        card.network,
+        card.last_four,
+        card.open_date,
+        card.card_id,
+    ]
+
+
+def _save_new_card(user_id, card: CreditCard):
+    """
+    向表格追加一行新卡片 (进入 write-behind 队列，稍后批量写入)
+    """
+    _submit(
+        {
+            "op": "append",
+            "user_id": user_id,
+            "card_id": card.card_id,
+            "row": _card_to_row(user_id, card),
+        }
+    )
+
+
+def _delete_card(user_id, card_id):
+    """
+    从表格删除卡片，按 card_id 直接定位到行
+    """
+    _submit({"op": "delete", "user_id": user_id, "card_id": card_id})
+
+
+def _update_card(user_id, card_id, updated_card: CreditCard):
+    """
+    更新指定 card_id 的卡片 (整行覆盖，card_id 保持不变)
+    """
+    updated_card.card_id = card_id
+    _submit(
+        {
+            "op": "update",
+            "user_id": user_id,
+            "card_id": card_id,
+            "row": _card_to_row(user_id, updated_card),
+        }
+    )
+
+
+class SheetsBackend(StorageBackend):
+    """Google Sheets 存储 ("walle_database" 表格的 "Cards" 工作表)"""
+
+    name = "sheets"
+
+    def load_user_data(self, user_id):
+        return _load_user_data(user_id)
+
+    def save_new_card(self, user_id, card):
+        _save_new_card(user_id, card)
+
+    def update_card(self, user_id, card_id, card):
+        _update_card(user_id, card_id, card)
+
+    def delete_card(self, user_id, card_id):
+        _delete_card(user_id, card_id)
+
+    def revision(self):
+        # Drive 元数据里的 modifiedTime，只是一次很小的请求，不下载表格内容
+        sheet = get_db_connection()
+        if not sheet:
+            return None
+        with clients.track("sheets"):
+            revision = sheet.spreadsheet.get_lastUpdateTime()
+        # 存储层在 revision 变化后会重新读取，先让行号索引跟上外部的修改，
+        # 否则会按旧索引读出不完整的卡包并缓存在新 revision 下
+        _row_index.observe_revision(revision)
+        return revision
+
+    def flush(self):
+        flush_pending_writes()
+
+    def export_cards(self):
+        sheet = get_db_connection()
+        if not sheet:
+            raise RuntimeError("Database connection unavailable")
+        flush_pending_writes()
+
+        # 先为缺少 card_id 的旧数据回填 ID 并写回表格，重复运行迁移时导出的 ID 保持不变，
+        # 目标后端才能按 card_id 去重
+        _row_index.rebuild(sheet)
+
+        items = []
+        # 迁移是一次性操作，这里允许整表读取
+        for row in sheet.get_all_values()[1:]:
+            row = row + [""] * (NUM_COLUMNS - len(row))
+            if row[0]:
+                items.append((row[0], _row_to_card(row)))
+        return items
+
+    def import_cards(self, items):
+        sheet = get_db_connection()
+        if not sheet:
+            raise RuntimeError("Database connection unavailable")
+        flush_pending_writes()
+
+        # 已经存在的 card_id 跳过，重复运行迁移不会产生重复的行
+        rows = [
+            _card_to_row(user_id, card)
+            for user_id, card in items
+            if not card.card_id or _row_index.row_of(sheet, card.card_id) is None
+        ]
+        if rows:
+            sheet.append_rows(rows)
+            _row_index.invalidate()
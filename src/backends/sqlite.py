@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+
+from src.backends.base import StorageBackend
+from src.config import data_path
+from src.models import CreditCard, UserProfile, new_card_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- 插入顺序，决定卡片在列表中的位置
+    card_id TEXT NOT NULL UNIQUE,          -- 稳定的卡片 ID (CreditCard.card_id)
+    user_id TEXT NOT NULL,
+    bank TEXT NOT NULL,
+    card_name TEXT NOT NULL,
+    network TEXT NOT NULL,
+    last_four TEXT NOT NULL DEFAULT '0000',
+    open_date TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_cards_user_id ON cards (user_id, id);
+"""
+
+
+def default_db_path():
+    return os.getenv("WALLE_SQLITE_PATH") or data_path("walle.db")
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    本地 SQLite 存储 (WAL 模式)。
+    每个线程使用独立连接，Streamlit 的多个 session 线程可以并发读。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or default_db_path()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_card(row):
+        bank, name, network, last_four, open_date, card_id = row
+        return CreditCard(
+            bank=bank,
+            name=name,
+            network=network,
+            last_four=last_four,
+            open_date=open_date,
+            card_id=card_id,
+        )
+
+    def revision(self):
+        # 任何连接 (包括其它进程) 写入都会更新主库或 WAL 文件的修改时间
+        stamps = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(0)
+        return tuple(stamps)
+
+    def load_user_data(self, user_id):
+        user = UserProfile(user_id=user_id)
+        rows = self._connect().execute(
+            "SELECT bank, card_name, network, last_four, open_date, card_id "
+            "FROM cards WHERE user_id = ? ORDER BY id",
+            (user_id,),
+        )
+        for row in rows:
+            user.add_card(self._row_to_card(row))
+        return user
+
+    def save_new_card(self, user_id, card):
+        self.import_cards([(user_id, card)])
+
+    def update_card(self, user_id, card_id, card):
+        card.card_id = card_id
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE cards SET bank = ?, card_name = ?, network = ?, "
+                "last_four = ?, open_date = ? WHERE card_id = ? AND user_id = ?",
+                (
+                    card.bank,
+                    card.name,
+                    card.network,
+                    card.last_four,
+                    card.open_date,
+                    card_id,
+                    user_id,
+                ),
+            )
+
+    def delete_card(self, user_id, card_id):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM cards WHERE card_id = ? AND user_id = ?",
+                (card_id, user_id),
+            )
+
+    def export_cards(self):
+        rows = self._connect().execute(
+            "SELECT user_id, bank, card_name, network, last_four, open_date, card_id "
+            "FROM cards ORDER BY id"
+        )
+        return [(row[0], self._row_to_card(row[1:])) for row in rows]
+
+    def import_cards(self, items):
+        """按 card_id upsert: 重复运行迁移或从中断处继续都是安全的"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO cards "
+                "(card_id, user_id, bank, card_name, network, last_four, open_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(card_id) DO UPDATE SET "
+                "user_id = excluded.user_id, bank = excluded.bank, "
+                "card_name = excluded.card_name, network = excluded.network, "
+                "last_four = excluded.last_four, open_date = excluded.open_date",
+                [
+                    (
+                        card.card_id or new_card_id(),
+                        user_id,
+                        card.bank,
+                        card.name,
+                        card.network,
+                        card.last_four,
+                        card.open_date,
+                    )
+                    for user_id, card in items
+                ],
+            )
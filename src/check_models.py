@@ -1,7 +1,12 @@
 import os
+import sys
 
 from dotenv import load_dotenv
-from google import genai
+
+# --- 路径配置 ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.clients import clients
 
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
@@ -10,7 +15,7 @@ if not api_key:
     print("❌ No API Key found")
     exit(1)
 
-client = genai.Client(api_key=api_key)
+client = clients.get("gemini")
 
 print("🔍 Checking available models for your API Key...")
 try:
@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.ratelimit import RequestCancelled
+
+logger = logging.getLogger(__name__)
+
+_FATAL_MARKERS = (
+    "API key not valid",
+    "API_KEY_INVALID",
+    "UNAUTHENTICATED",
+    "PERMISSION_DENIED",
+    "invalid_grant",
+    "Unauthorized",
+    "Connection reset",
+    "Connection aborted",
+    "client has been closed",
+)
+
+
+def is_fatal(error):
+    """凭证失效 (401/403) 或底层连接已损坏: 继续用这个客户端没有意义，需要重建"""
+    code = getattr(error, "code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    if code in (401, 403):
+        return True
+    text = str(error)
+    return any(marker in text for marker in _FATAL_MARKERS)
+
+
+def _fingerprint(credential):
+    if credential is None:
+        return None
+    return hashlib.sha256(str(credential).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    def __init__(self, factory, credential):
+        self.factory = factory
+        self.credential = credential
+        self.lock = threading.Lock()
+        self.client = None
+        self.fingerprint = None
+        self.created_at = None
+        self.builds = 0
+        self.uses = 0
+        self.errors = 0
+        self.last_error = None
+        self.stale = False
+
+
+class ClientRegistry:
+    """
+    进程内共享的长连接客户端 (Gemini / Tavily / Google Sheets)。
+
+    - 每种客户端只创建一次，所有调用方复用同一个实例 (及其 HTTP 连接池)
+    - credential() 每次 get() 时都会检查；凭证轮换后自动重建客户端
+    - 调用方通过 report_error() 报告错误，致命错误 (认证失败、连接损坏) 会让下一次 get() 重建
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, credential=lambda: None):
+        """
+        factory(credential_value) -> client
+        credential() -> 当前凭证 (例如 API Key)，用于检测轮换
+        """
+        with self._lock:
+            self._entries[name] = _Entry(factory, credential)
+
+    def _entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown client: {name}")
+        return entry
+
+    def get(self, name):
+        entry = self._entry(name)
+        credential = entry.credential()
+        fingerprint = _fingerprint(credential)
+        with entry.lock:
+            if entry.client is None or entry.stale or entry.fingerprint != fingerprint:
+                if entry.client is not None:
+                    # 不主动 close 旧实例: 其它线程可能还在用它完成当前请求
+                    reason = "stale" if entry.stale else "credential rotated"
+                    logger.info(f"Rebuilding {name} client ({reason})")
+                entry.client = entry.factory(credential)
+                entry.fingerprint = fingerprint
+                entry.created_at = time.monotonic()
+                entry.builds += 1
+                entry.stale = False
+            entry.uses += 1
+            return entry.client
+
+    def report_error(self, name, error):
+        """记录一次调用失败；致命错误时标记客户端需要重建"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.errors += 1
+            entry.last_error = str(error)[:200]
+            if is_fatal(error):
+                logger.warning(f"Fatal {name} client error, will rebuild: {error}")
+                entry.stale = True
+
+    @contextmanager
+    def track(self, name):
+        """with clients.track("gemini"): ... 块内抛出的异常会被 report_error 记录后继续抛出"""
+        try:
+            yield
+        except RequestCancelled:
+            # 任务被取消不是客户端的错误
+            raise
+        except Exception as e:
+            self.report_error(name, e)
+            raise
+
+    def invalidate(self, name):
+        entry = self._entry(name)
+        with entry.lock:
+            entry.stale = True
+
+    def stats(self):
+        now = time.monotonic()
+        result = {}
+        for name, entry in list(self._entries.items()):
+            with entry.lock:
+                result[name] = {
+                    "connected": entry.client is not None and not entry.stale,
+                    "age_seconds": (
+                        round(now - entry.created_at)
+                        if entry.created_at is not None
+                        else None
+                    ),
+                    "builds": entry.builds,
+                    "uses": entry.uses,
+                    "errors": entry.errors,
+                    "last_error": entry.last_error,
+                }
+        return result
+
+
+def _require(value, name):
+    if not value:
+        raise ValueError(f"❌ {name} is missing in .env file")
+    return value
+
+
+def _gemini_client(api_key):
+    from google import genai
+
+    return genai.Client(api_key=_require(api_key, "GOOGLE_API_KEY"))
+
+
+def _tavily_client(api_key):
+    from tavily import TavilyClient
+
+    return TavilyClient(api_key=_require(api_key, "TAVILY_API_KEY"))
+
+
+clients = ClientRegistry()
+clients.register("gemini", _gemini_client, lambda: os.getenv("GOOGLE_API_KEY"))
+clients.register("tavily", _tavily_client, lambda: os.getenv("TAVILY_API_KEY"))
+# Google Sheets 的客户端在 src/backends/sheets.py 中注册 (凭证来自 st.secrets)
@@ -0,0 +1,14 @@
+import os
+
+# 项目根目录 (src 的上一级)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 本地运行时数据目录 (写入日志、缓存等)，可通过环境变量覆盖
+DATA_DIR = os.getenv("WALLE_DATA_DIR", os.path.join(PROJECT_ROOT, ".walle"))
+
+
+def data_path(*parts):
+    """返回数据目录下的文件路径，并确保目录存在"""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
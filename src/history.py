@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+
+# 发送给模型的聊天记录的 token 预算 (滚动摘要 + 最近的原文消息)
+HISTORY_TOKEN_BUDGET = int(os.getenv("WALLE_HISTORY_TOKEN_BUDGET", "3000"))
+# 无论预算多紧，最近这几条消息总是原文保留
+MIN_RECENT_MESSAGES = 2
+
+SUMMARY_PREFIX = "[Summary of our earlier conversation]"
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def estimate_tokens(text):
+    """
+    粗略估算 token 数 (不调用 API): 中日韩字符约 1 token/字，其余约 4 字符/token
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncating_summarizer(summary, messages, max_chars=200, max_total_chars=2000):
+    """
+    不依赖 LLM 的兜底摘要: 把每条被折叠的消息截断后追加到摘要里，
+    总长度超过 max_total_chars 时丢掉最旧的行
+    """
+    lines = summary.splitlines() if summary else []
+    for msg in messages:
+        text = " ".join(msg["content"].split())
+        if len(text) > max_chars:
+            text = text[:max_chars] + "…"
+        lines.append(f"- {msg['role']}: {text}")
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_total_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationHistory:
+    """
+    按 token 预算压缩聊天记录。
+
+    最近的消息原文保留；超出预算的更早消息被折叠进滚动摘要。
+    摘要是增量更新的: 每次只把新被挤出窗口的消息交给 summarizer，
+    已经折叠过的消息不会重新计算。
+
+    summarizer(previous_summary, messages) -> new_summary
+
+    compact() / record_turn() 可以在后台线程中调用 (同一个 session 的多个任务之间加锁)
+    """
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, summarizer=None):
+        self.token_budget = token_budget
+        self.summarizer = summarizer or truncating_summarizer
+        self.summary = ""
+        self.folded = 0  # messages[:folded] 已经折叠进摘要
+        self.turn_stats = []  # 每一轮的 prompt token 统计
+        self._lock = threading.RLock()
+
+    def _window_start(self, messages, budget, offset=0):
+        """从最新的消息往前数，找到预算内能原文保留的最早位置 (整段对话中的序号)"""
+        end = offset + len(messages)
+        start = end
+        used = 0
+        while start > self.folded:
+            cost = estimate_tokens(messages[start - 1 - offset]["content"])
+            if end - start >= MIN_RECENT_MESSAGES and used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def compact(self, messages, offset=0):
+        """
+        返回用于本轮 prompt 的聊天记录 (同样是 [{"role", "content"}] 格式)，
+        必要时先把窗口之外的新消息折叠进摘要。
+
+        messages 可以只是整段对话的尾部: messages[0] 是第 offset 条消息
+        (调用方应从 folded 开始提供；更早的消息已经在摘要里了)
+        """
+        with self._lock:
+            return self._compact(messages, offset)
+
+    def _compact(self, messages, offset):
+        if offset + len(messages) < self.folded:
+            # 聊天记录被清空或重置了
+            self.reset()
+        if offset > self.folded:
+            # offset 之前的消息不在上下文中 (例如之前 session 的记录)
+            self.folded = offset
+
+        budget = self.token_budget - estimate_tokens(self.summary)
+        start = self._window_start(messages, budget, offset)
+
+        if start > self.folded:
+            self.summary = self.summarizer(
+                self.summary, messages[self.folded - offset : start - offset]
+            )
+            self.folded = start
+
+        recent = list(messages[self.folded - offset :])
+        if not self.summary:
+            return recent
+        return [
+            {"role": "user", "content": f"{SUMMARY_PREFIX}\n{self.summary}"}
+        ] + recent
+
+    def record_turn(self, prompt_messages, prompt, actual_tokens=None):
+        """记录并返回本轮 prompt 的 token 统计 (actual_tokens 来自 API 的 usage_metadata)"""
+        with self._lock:
+            stats = {
+                "estimated_tokens": sum(
+                    estimate_tokens(m["content"]) for m in prompt_messages
+                )
+                + estimate_tokens(prompt),
+                "actual_tokens": actual_tokens,
+                "verbatim_messages": len(prompt_messages) - (1 if self.summary else 0),
+                "summarized_messages": self.folded,
+            }
+            self.turn_stats.append(stats)
+        return stats
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0
+        self.turn_stats = []
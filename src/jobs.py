@@ -0,0 +1,223 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 所有 session 共享的后台线程数 (聊天生成、福利分析等 LLM 任务)
+JOB_WORKERS = int(os.getenv("WALLE_JOB_WORKERS", "4"))
+# UI 轮询非流式任务进度的间隔 (秒)
+JOB_POLL_INTERVAL = float(os.getenv("WALLE_JOB_POLL_INTERVAL", "1"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """
+    一个后台任务的状态。由 JobRunner 创建，UI 线程只读取状态或调用 cancel()。
+
+    - chunks: 流式任务已经产出的文本块 (follow() 可以边生成边读取)
+    - result: 完成后的返回值 (流式任务为拼接后的完整文本)
+    - info: 任务函数可以写入的额外信息 (例如 token 统计)
+    """
+
+    def __init__(self, session, key, label=""):
+        self.id = uuid.uuid4().hex[:12]
+        self.session = session
+        self.key = key
+        self.label = label or key
+        self.status = PENDING
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.info = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        """是否已请求取消 (任务函数应在合适的时机检查并尽快退出)"""
+        return self._cancel.is_set()
+
+    @property
+    def cancel_event(self):
+        """
+        取消标志 (threading.Event)。非流式任务没有输出块可以检查取消，
+        把它传给限流器 (src/ratelimit.py) 后，等待配额或重试期间也能及时停下
+        """
+        return self._cancel
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def text(self):
+        with self._cond:
+            return "".join(self.chunks)
+
+    @property
+    def elapsed(self):
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.created_at)
+
+    def emit(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def cancel(self):
+        self._cancel.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _start(self):
+        with self._cond:
+            self.status = RUNNING
+            self.started_at = time.time()
+
+    def _finish(self, status, result=None, error=None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def follow(self):
+        """从头开始逐块 yield 已产出和新产出的文本，直到任务结束"""
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.chunks) > sent or self.done)
+                new = self.chunks[sent:]
+                finished = self.done
+            sent += len(new)
+            yield from new
+            if finished:
+                return
+
+
+class JobRunner:
+    """
+    所有 session 共享的有界线程池，把 LLM 调用移出 Streamlit 的脚本线程。
+
+    - 同一个 session 中相同 key 的任务在运行期间只会执行一次，重复提交返回同一个 Job
+    - fn(job) 可以返回普通值，也可以返回生成器 (逐块输出，每块之后检查取消)
+    - cancel(): 还在排队的任务直接取消；运行中的任务在下一个输出块时停止，
+      把 job.cancel_event 传给限流器的任务在等待配额时也会停止。
+      已经发出的单次模型请求无法中途取消
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="walle-job"
+        )
+        self._lock = threading.Lock()
+        self._inflight = {}  # (session, key) -> Job
+        self._futures = {}  # job.id -> Future
+        self.submitted = 0
+        self.deduped = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def submit(self, session, key, fn, label=""):
+        with self._lock:
+            job = self._inflight.get((session, key))
+            if job is not None and not job.done:
+                self.deduped += 1
+                return job
+            job = Job(session, key, label)
+            self._inflight[(session, key)] = job
+            self.submitted += 1
+            self._futures[job.id] = self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        status, result, error = DONE, None, None
+        try:
+            if job.cancelled:
+                status = CANCELLED
+                return
+            job._start()
+            result = fn(job)
+            if hasattr(result, "__next__"):
+                try:
+                    for chunk in result:
+                        job.emit(chunk)
+                        if job.cancelled:
+                            break
+                finally:
+                    close = getattr(result, "close", None)
+                    if close is not None:
+                        close()
+                result = job.text
+            if job.cancelled:
+                status = CANCELLED
+        except Exception as e:
+            if job.cancelled:
+                # 取消后任务函数抛出的异常 (例如 RequestCancelled) 不算失败
+                status = CANCELLED
+            else:
+                logger.error(f"Job {job.label} failed: {e}")
+                status, error = FAILED, str(e)
+        finally:
+            self._finish(job, status, result, error)
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            if self._inflight.get((job.session, job.key)) is job:
+                del self._inflight[(job.session, job.key)]
+            self._futures.pop(job.id, None)
+            if status == FAILED:
+                self.failed += 1
+            elif status == CANCELLED:
+                self.cancelled += 1
+        job._finish(status, result, error)
+
+    def cancel(self, job):
+        job.cancel()
+        with self._lock:
+            future = self._futures.get(job.id)
+        # 还没开始执行的任务直接从队列里撤下
+        if future is not None and future.cancel():
+            self._finish(job, CANCELLED)
+
+    def active(self, session):
+        with self._lock:
+            return [
+                job
+                for (s, _), job in self._inflight.items()
+                if s == session and not job.done
+            ]
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._inflight.values())
+            return {
+                "running": sum(job.status == RUNNING for job in jobs),
+                "queued": sum(job.status == PENDING for job in jobs),
+                "submitted": self.submitted,
+                "deduped": self.deduped,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+            }
+
+
+job_runner = JobRunner()
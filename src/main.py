@@ -1,18 +1,22 @@
 import logging
 import os
 import sys
-import time
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from google.genai.errors import ClientError
 
 # --- 1. 路径配置 ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from src.agent import (
+    apply_local_engines,
+    build_contents,
+    cached_stream_reply,
+    make_gemini_summarizer,
+)
+from src.clients import clients
+from src.history import ConversationHistory
 from src.models import Benefit, CreditCard, UserProfile
-from src.tools.search import search_credit_card_info
+from src.tracing import hash_user, span, tracer, waterfall
 
 # 只显示严重错误
 logging.basicConfig(level=logging.ERROR)
@@ -23,9 +27,6 @@ if not api_key:
     print("❌ Error: GOOGLE_API_KEY not found in .env file")
     exit(1)
 
-# 初始化客户端
-client = genai.Client(api_key=api_key)
-
 
 # --- 2. 模拟用户数据 ---
 def init_demo_user():
@@ -64,44 +65,23 @@ User Context: {user_summary}
 
 Tools:
 - Use `search_credit_card_info` for quarterly categories (Freedom/Discover) and specific "DPs".
-- If searching for DPs/Tricks (e.g. UA Travel Bank), try mixed English/Chinese queries.
+- When several cards need a lookup, issue one search call per card in the same turn (they run in parallel).
+- For DPs/Tricks (e.g. UA Travel Bank), pass an English `query` plus a Chinese `query_zh`; both are searched in parallel.
 
 Tone: Helpful, concise, witty.
 """
 
 
-# --- 4. 辅助函数：带重试的调用 (针对 Pro 模型优化) ---
-def generate_content_with_retry(model_name, contents, config, max_retries=3):
-    """如果遇到 429 限流，自动等待并重试"""
-    for attempt in range(max_retries):
-        try:
-            return client.models.generate_content(
-                model=model_name, contents=contents, config=config
-            )
-        except ClientError as e:
-            # 检查是否是 429 错误
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                # Pro 模型的冷却时间较长，我们将基础等待时间调大一点 (10秒起步)
-                wait_time = 10 * (attempt + 1)
-                print(
-                    f"   (⚠️ Pro Quota limit hit. Thinking deeply... Retrying in {wait_time}s...)"
-                )
-                time.sleep(wait_time)
-            else:
-                # 其他错误直接抛出
-                raise e
-    raise Exception("Max retries exceeded. The API is too busy.")
-
-
-# --- 5. 主循环 ---
+# --- 4. 主循环 ---
 def main():
     user = init_demo_user()
-    tools = [search_credit_card_info]
 
     print(f"\n🤖 Walle (v0.3 Pro Edition) | User: {len(user.cards)} Cards")
     print("-" * 50)
 
+    # 与 Streamlit 版相同的格式: [{"role": "user"/"assistant", "content": "..."}]
     chat_history = []
+    history = ConversationHistory(summarizer=make_gemini_summarizer())
 
     while True:
         try:
@@ -111,24 +91,65 @@ def main():
             if not user_input:
                 continue
 
-            print("   (Walle is thinking...) ⏳")
-
-            # 🌟 切换到 Pro 模型
-            response = generate_content_with_retry(
-                model_name="gemini-flash-latest",  # <--- 这里使用了 Pro
-                contents=chat_history + [user_input],
-                config=types.GenerateContentConfig(
-                    tools=tools,
-                    system_instruction=SYSTEM_INSTRUCTION.format(
-                        user_summary=user.get_summary()
-                    ),
-                    automatic_function_calling=types.AutomaticFunctionCallingConfig(
-                        disable=False
-                    ),
-                ),
-            )
-
-            print(f"Walle: {response.text}")
+            # 整轮对话是一条 trace 的根 span (WALLE_TRACING=1 时记录)
+            with span("chat.turn", user=hash_user("cli")) as turn_span:
+                # 本地返现引擎能确定答案时直接输出，不调用 API
+                with span("prompt.build"):
+                    direct, system_instruction = apply_local_engines(
+                        user,
+                        user_input,
+                        SYSTEM_INSTRUCTION.format(user_summary=user.get_summary()),
+                    )
+                if direct is not None:
+                    turn_span.set(source="local")
+                    print(f"Walle: {direct}")
+                    chat_history.append({"role": "user", "content": user_input})
+                    chat_history.append({"role": "assistant", "content": direct})
+                    continue
+
+                print("   (Walle is thinking...) ⏳")
+
+                # 🌟 边生成边打印
+                print("Walle: ", end="", flush=True)
+                reply = []
+                usage = {}
+                with span("history.compact", messages=len(chat_history)):
+                    prompt_history = history.compact(chat_history)
+                # 429 限流的退避重试由共享限流器 (src/ratelimit.py) 统一处理
+                for chunk in cached_stream_reply(
+                    clients.get("gemini"),
+                    "gemini-flash-latest",  # <--- 这里使用了 Pro
+                    build_contents(prompt_history, user_input),
+                    system_instruction,
+                    usage=usage,
+                    session="cli",
+                ):
+                    print(chunk, end="", flush=True)
+                    reply.append(chunk)
+                print()
+                turn_span.set(
+                    source="model",
+                    cache_hit=usage.get("cache_hit", False),
+                    prompt_tokens=usage.get("prompt_token_count"),
+                    output_tokens=usage.get("candidates_token_count"),
+                )
+
+                turn = history.record_turn(
+                    prompt_history, user_input, usage.get("prompt_token_count")
+                )
+                tokens = turn["actual_tokens"] or f"~{turn['estimated_tokens']}"
+                print(
+                    f"   (🧮 prompt tokens: {tokens}, "
+                    f"{turn['summarized_messages']} msgs summarized)"
+                )
+
+                # 完整回答生成结束后再写入历史
+                chat_history.append({"role": "user", "content": user_input})
+                chat_history.append({"role": "assistant", "content": "".join(reply)})
+
+            # 追踪开启时打印本轮的耗时瀑布图
+            if tracer.enabled:
+                print(waterfall(tracer.last_trace("chat.turn")))
 
         except Exception as e:
             print(f"❌ Error: {e}")
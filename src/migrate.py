@@ -0,0 +1,37 @@
+import argparse
+import os
+import sys
+
+# --- 路径配置 ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.storage import create_backend
+
+BACKENDS = ["sheets", "sqlite"]
+
+
+def migrate(source, target):
+    """把 source 后端中所有用户的卡片一次性复制到 target 后端，返回迁移的卡片数"""
+    items = source.export_cards()
+    target.import_cards(items)
+    target.flush()
+    return len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="One-shot migration of all wallets between storage backends."
+    )
+    parser.add_argument("source", choices=BACKENDS, help="backend to read from")
+    parser.add_argument("target", choices=BACKENDS, help="backend to write to")
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("source and target must be different backends")
+
+    count = migrate(create_backend(args.source), create_backend(args.target))
+    print(f"✅ Migrated {count} cards: {args.source} -> {args.target}")
+
+
+if __name__ == "__main__":
+    main()
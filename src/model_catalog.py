@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from src.clients import clients
+from src.config import data_path
+
+logger = logging.getLogger(__name__)
+
+# 模型列表快照的有效期 (小时)，过期后在后台刷新，期间继续使用旧快照
+MODEL_SNAPSHOT_MAX_AGE = float(os.getenv("WALLE_MODEL_SNAPSHOT_MAX_AGE", "24")) * 3600
+
+# 默认兜底
+DEFAULT_MODELS = {
+    "🚀 Fast (Gemini 1.5 Flash)": "gemini-1.5-flash",
+    "⚖️ Balanced (Gemini 1.5 Pro)": "gemini-1.5-pro",
+}
+
+
+def classify_models(model_names):
+    """
+    根据可用模型按性能分类。
+    优先使用 Gemini 3 系列 (根据你的 check_models 结果定制)
+    """
+    found_models = {}
+
+    # --- 1. 🚀 Fast: 追求速度与性价比 ---
+    # 优先用 Gemini 3 Flash Preview (兼顾速度与智商)
+    if "gemini-3-flash-preview" in model_names:
+        found_models["🚀 Fast (Gemini 3 Flash)"] = "gemini-3-flash-preview"
+    elif "gemini-2.0-flash" in model_names:
+        found_models["🚀 Fast (Gemini 2.0 Flash)"] = "gemini-2.0-flash"
+    elif "gemini-1.5-flash" in model_names:
+        found_models["🚀 Fast (Gemini 1.5 Flash)"] = "gemini-1.5-flash"
+
+    # --- 2. 🧠 Smart: 追求最强推理 (处理 5/24 或复杂分析) ---
+    # 优先用 Gemini 3 Pro Preview
+    if "gemini-3-pro-preview" in model_names:
+        found_models["🧠 Smart (Gemini 3 Pro)"] = "gemini-3-pro-preview"
+    elif "gemini-2.0-pro-exp" in model_names:  # 假如未来有
+        found_models["🧠 Smart (Gemini 2.0 Pro)"] = "gemini-2.0-pro-exp"
+    elif "gemini-1.5-pro" in model_names:
+        found_models["🧠 Smart (Gemini 1.5 Pro)"] = "gemini-1.5-pro"
+
+    # --- 3. ⚡️ Experimental: 尝鲜 Google 最新黑科技 ---
+    # 比如 2.0 Flash Exp 或 Thinking 模式
+    if "gemini-2.0-flash-thinking-exp" in model_names:
+        found_models["⚡️ Thinking (Gemini 2.0 Exp)"] = "gemini-2.0-flash-thinking-exp"
+    elif "gemini-2.0-flash-exp" in model_names:
+        found_models["⚡️ Experimental (Gemini 2.0 Flash)"] = "gemini-2.0-flash-exp"
+
+    if not found_models:
+        return dict(DEFAULT_MODELS)
+
+    # 排序：Fast -> Smart -> Experimental
+    # 使用自定义顺序，而不是字母顺序
+    order = ["🚀", "🧠", "⚡️", "⚖️"]
+    sorted_keys = sorted(
+        found_models.keys(),
+        key=lambda x: next((i for i, k in enumerate(order) if k in x), 99),
+    )
+    return {k: found_models[k] for k in sorted_keys}
+
+
+def _fingerprint(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ModelCatalog:
+    """
+    可用模型列表: 从磁盘快照读取 (不阻塞页面渲染)，快照缺失、过期或 API Key
+    变化时在后台线程刷新。还没有快照时先返回 DEFAULT_MODELS。
+
+    fetch() -> 模型名列表 (例如 ["gemini-2.0-flash", ...])
+    """
+
+    def __init__(self, path, fetch, max_age=MODEL_SNAPSHOT_MAX_AGE):
+        self.path = path
+        self.fetch = fetch
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshot = None  # {"fetched_at", "fingerprint", "models"}
+        self._loaded = False
+        self._refreshing = False
+
+    def _load(self):
+        if self._loaded:
+            return self._snapshot
+        try:
+            with open(self.path) as f:
+                self._snapshot = json.load(f)
+        except (OSError, ValueError):
+            self._snapshot = None
+        self._loaded = True
+        return self._snapshot
+
+    def get(self, api_key=None):
+        fingerprint = _fingerprint(api_key)
+        with self._lock:
+            snapshot = self._load()
+            fresh = (
+                snapshot is not None
+                and snapshot.get("fingerprint") == fingerprint
+                and time.time() - snapshot.get("fetched_at", 0) < self.max_age
+            )
+            if not fresh and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(
+                    target=self._refresh_in_background,
+                    args=(fingerprint,),
+                    name="walle-model-catalog",
+                    daemon=True,
+                ).start()
+            if snapshot is not None and snapshot.get("models"):
+                return dict(snapshot["models"])
+            return dict(DEFAULT_MODELS)
+
+    def _refresh_in_background(self, fingerprint):
+        try:
+            self.refresh(fingerprint)
+        except Exception as e:
+            logger.warning(f"Model check failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self, fingerprint=None):
+        """同步拉取模型列表并写入快照 (原子替换)，返回分类后的模型"""
+        models = classify_models(self.fetch())
+        snapshot = {
+            "fetched_at": time.time(),
+            "fingerprint": fingerprint or _fingerprint(None),
+            "models": models,
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        with self._lock:
+            self._snapshot = snapshot
+            self._loaded = True
+        return models
+
+
+def _list_gemini_models():
+    # 提取纯净的模型名 (去掉 models/ 前缀)
+    return [m.name.replace("models/", "") for m in clients.get("gemini").models.list()]
+
+
+model_catalog = ModelCatalog(data_path("models.json"), _list_gemini_models)
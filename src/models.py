@@ -1,8 +1,34 @@
 import json
+import uuid
 from dataclasses import dataclass, field
 from typing import List
 
 
+def new_card_id() -> str:
+    """生成一个新的稳定卡片 ID"""
+    return uuid.uuid4().hex
+
+
+# --- 数据预设: 常见银行及卡片 (App 的添加卡片表单、预热任务共用) ---
+POPULAR_CARDS = {
+    "Chase": [
+        "Sapphire Preferred",
+        "Sapphire Reserve",
+        "Freedom Flex",
+        "Freedom Unlimited",
+        "Ink Business Preferred",
+        "Hyatt",
+    ],
+    "Amex": ["Platinum", "Gold", "Green", "Blue Cash Preferred", "Delta SkyMiles Gold"],
+    "Citi": ["Premier", "Double Cash", "Custom Cash"],
+    "Capital One": ["Venture X", "SavorOne"],
+    "Discover": ["It Cash Back"],
+    "Bilt": ["Bilt Mastercard"],
+    "Bank of America": ["Cash Rewards"],
+    "Other": [],
+}
+
+
 @dataclass
 class Benefit:
     """定义单个信用卡福利 (例如: $10 Uber Cash, 5% Grocery)"""
@@ -29,6 +55,9 @@ class CreditCard:
     last_four: str = "0000"  # 卡号后四位，用于区分
     benefits: List[Benefit] = field(default_factory=list)
     open_date: str = ""
+    card_id: str = field(
+        default_factory=new_card_id
+    )  # 持久化的唯一 ID，用于定位存储中的行
 
     def add_benefit(self, benefit: Benefit):
         self.benefits.append(benefit)
@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# 每个模型的配额 (requests / tokens per minute)，按模型名前缀匹配，可用环境变量整体覆盖
+DEFAULT_BUDGETS = {
+    "gemini-3-pro": (5, 250_000),
+    "gemini-1.5-pro": (5, 250_000),
+    "gemini-2.0-pro": (5, 250_000),
+    "gemini": (15, 1_000_000),  # Flash 系列及其它
+}
+RPM_OVERRIDE = os.getenv("WALLE_GEMINI_RPM")
+TPM_OVERRIDE = os.getenv("WALLE_GEMINI_TPM")
+
+# 重试: 指数退避的基准/上限 (秒)，最多重试次数
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+MAX_RETRIES = 4
+
+# 带 cancel 的 acquire 检查取消标志的间隔 (秒)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class RequestCancelled(Exception):
+    """后台任务在等待配额或重试期间被取消 (见 jobs.Job.cancel)"""
+
+
+def budget_for(model):
+    rpm, tpm = next(
+        (b for prefix, b in DEFAULT_BUDGETS.items() if model.startswith(prefix)),
+        DEFAULT_BUDGETS["gemini"],
+    )
+    return int(RPM_OVERRIDE or rpm), int(TPM_OVERRIDE or tpm)
+
+
+class TokenBucket:
+    """令牌桶: capacity 为桶容量，按 capacity / 60 每秒匀速补充"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """还需要等待多少秒才能取出 amount (0 表示现在就可以)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "event", "future", "loop")
+
+    def __init__(self, tokens, future=None, loop=None):
+        self.tokens = tokens
+        self.event = threading.Event()
+        self.future = future
+        self.loop = loop
+
+    def grant(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _ModelState:
+    def __init__(self, model):
+        rpm, tpm = budget_for(model)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        # session -> deque[_Waiter]，按轮询顺序排列 (刚被服务的 session 移到末尾)
+        self.queues = OrderedDict()
+
+
+class RateLimiter:
+    """
+    进程内共享的 Gemini 限流器。
+
+    - 每个模型各有一组 RPM / TPM 令牌桶
+    - 等待中的请求按 session 轮询放行，一个 session 排了很多请求也不会饿死其它 session
+    - 等待的线程阻塞在 Event 上，由限流器在配额恢复时精确唤醒，而不是各自 sleep 固定时间
+    - pause() 让某个模型整体暂停 (用于服务端返回的 retry-after)，所有调用方一起退避
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._timer = None
+        self._timer_at = None
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(model)
+        return state
+
+    def _pump(self):
+        """在锁内调用: 尽可能多地放行等待者，并为下一次可放行的时间安排定时器"""
+        now = time.monotonic()
+        next_wake = None
+
+        for state in self._models.values():
+            while state.queues:
+                session, queue = next(iter(state.queues.items()))
+                waiter = queue[0]
+
+                wait = max(
+                    state.paused_until - now,
+                    state.requests.wait_time(1, now),
+                    state.tokens.wait_time(waiter.tokens, now),
+                )
+                if wait > 0:
+                    next_wake = wait if next_wake is None else min(next_wake, wait)
+                    break
+
+                state.requests.take(1)
+                state.tokens.take(waiter.tokens)
+                queue.popleft()
+                del state.queues[session]
+                if queue:
+                    state.queues[session] = queue  # 移到末尾，轮到下一个 session
+                waiter.grant()
+
+        if next_wake is not None:
+            self._schedule(now + next_wake)
+
+    def _schedule(self, when):
+        if self._timer is not None and self._timer_at <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = when
+        self._timer = threading.Timer(max(0.0, when - time.monotonic()), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._timer_at = None
+            self._pump()
+
+    def _enqueue(self, model, tokens, session, waiter):
+        with self._lock:
+            state = self._state(model)
+            state.queues.setdefault(session, deque()).append(waiter)
+            self._pump()
+
+    def _cancel(self, model, session, waiter):
+        with self._lock:
+            queue = self._state(model).queues.get(session)
+            if queue and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._state(model).queues[session]
+                return True
+            return False
+
+    def acquire(self, model, tokens=1, session=None, timeout=None, cancel=None):
+        """
+        阻塞直到该模型有配额；超时返回 False。
+        cancel (threading.Event) 被设置时同样放弃排队并返回 False
+        """
+        waiter = _Waiter(tokens)
+        self._enqueue(model, tokens, session, waiter)
+        if cancel is None:
+            granted = waiter.event.wait(timeout)
+        else:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                wait = CANCEL_POLL_INTERVAL
+                if deadline is not None:
+                    wait = max(0.0, min(wait, deadline - time.monotonic()))
+                granted = waiter.event.wait(wait)
+                if granted or cancel.is_set():
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        if granted:
+            return True
+        # 超时的同时恰好被放行时，视为成功
+        return not self._cancel(model, session, waiter)
+
+    async def acquire_async(self, model, tokens=1, session=None):
+        """acquire 的 asyncio 版本: 等待期间不占用线程"""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(tokens, future=loop.create_future(), loop=loop)
+        self._enqueue(model, tokens, session, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._cancel(model, session, waiter)
+            raise
+
+    def pause(self, model, seconds):
+        """让该模型的所有请求至少暂停 seconds 秒"""
+        with self._lock:
+            state = self._state(model)
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+            self._pump()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                model: {
+                    "waiting": sum(len(q) for q in state.queues.values()),
+                    "paused_for": max(0.0, round(state.paused_until - now, 1)),
+                    "requests_left": int(state.requests.level),
+                    "tokens_left": int(state.tokens.level),
+                }
+                for model, state in self._models.items()
+            }
+
+
+limiter = RateLimiter()
+
+
+# --- 重试调度 ---
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"'retryDelay':\s*'([\d.]+)s'")
+
+
+def is_retryable(error):
+    """429 限流 / 503 过载 视为可重试"""
+    code = getattr(error, "code", None)
+    if code in (429, 503):
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "UNAVAILABLE" in text
+
+
+def retry_after(error):
+    """从错误里解析服务端建议的等待时间 (RetryInfo.retryDelay 或 'retry in Ns')"""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for item in details.get("error", {}).get("details", []):
+            delay = item.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    text = str(error)
+    match = _RETRY_DELAY.search(text) or _RETRY_IN.search(text)
+    return float(match.group(1)) if match else None
+
+
+def backoff_delay(attempt, hint=None):
+    """带抖动的指数退避；服务端给了 retry-after 时不少于它"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2**attempt))
+    delay *= random.uniform(0.5, 1.5)
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
+
+
+def _cancelled(cancel):
+    return cancel is not None and cancel.is_set()
+
+
+def call_with_retry(
+    fn, model, tokens=1, session=None, max_retries=MAX_RETRIES, cancel=None
+):
+    """
+    经过限流器调用 fn()；遇到 429/503 时让该模型整体退避后重试。
+    cancel (threading.Event) 被设置后不再等待配额或重试，抛出 RequestCancelled
+    """
+    for attempt in range(max_retries + 1):
+        if _cancelled(cancel) or not limiter.acquire(
+            model, tokens, session, cancel=cancel
+        ):
+            raise RequestCancelled(model)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            logger.warning(f"{model} rate limited, backing off {delay:.1f}s: {e}")
+            limiter.pause(model, delay)
+
+
+def stream_with_retry(
+    open_stream, model, tokens=1, session=None, max_retries=MAX_RETRIES, cancel=None
+):
+    """
+    流式版本: open_stream() 返回一个可迭代的流。
+    只在还没有产出任何内容时重试，避免重复输出。
+    cancel 被设置后不再等待配额，流直接结束
+    """
+    for attempt in range(max_retries + 1):
+        if _cancelled(cancel) or not limiter.acquire(
+            model, tokens, session, cancel=cancel
+        ):
+            return
+        started = False
+        try:
+            for chunk in open_stream():
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            logger.warning(f"{model} rate limited, backing off {delay:.1f}s: {e}")
+            limiter.pause(model, delay)
+
+
+async def call_with_retry_async(
+    coro_fn, model, tokens=1, session=None, max_retries=MAX_RETRIES
+):
+    """call_with_retry 的 asyncio 版本: coro_fn() 返回一个协程"""
+    for attempt in range(max_retries + 1):
+        await limiter.acquire_async(model, tokens, session)
+        try:
+            return await coro_fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            logger.warning(f"{model} rate limited, backing off {delay:.1f}s: {e}")
+            limiter.pause(model, delay)
+
+
+async def stream_with_retry_async(
+    open_stream, model, tokens=1, session=None, max_retries=MAX_RETRIES
+):
+    """stream_with_retry 的 asyncio 版本: open_stream() 返回一个协程，其结果是异步可迭代的流"""
+    for attempt in range(max_retries + 1):
+        await limiter.acquire_async(model, tokens, session)
+        started = False
+        try:
+            async for chunk in await open_stream():
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after(e))
+            logger.warning(f"{model} rate limited, backing off {delay:.1f}s: {e}")
+            limiter.pause(model, delay)
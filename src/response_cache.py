@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from src.cache import DiskCache, TTLCache, seconds_until_midnight
+from src.config import data_path
+
+# 内存层容量；磁盘层默认关闭，设置 WALLE_RESPONSE_CACHE_DISK=1 开启
+RESPONSE_CACHE_SIZE = int(os.getenv("WALLE_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_DISK = os.getenv("WALLE_RESPONSE_CACHE_DISK", "0") == "1"
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def _content_text(content):
+    return "".join(part.text or "" for part in content.parts or [])
+
+
+def make_key(model, system_instruction, contents):
+    """
+    缓存键 = 模型 ID + System Instruction 的哈希 + 规范化后的对话
+    (System Instruction 中包含日期和 UserProfile.get_summary()，
+    所以持卡组合相同的用户会命中同一个条目)
+    """
+    conversation = [(c.role, _normalize(_content_text(c))) for c in contents]
+    payload = json.dumps(
+        {
+            "model": model,
+            "system": hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+            "conversation": conversation,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Gemini 回答缓存: 内存 LRU 层 + 可选的磁盘层。
+    条目在本地日期滚动 (零点) 时过期，因为回答依赖 "今天" 的日期。
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, disk=None):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        text = self.memory.get(key)
+        if text is None and self.disk is not None:
+            text, expires_at = self.disk.get_with_expiry(key)
+            if text is not None:
+                # 提升到内存层，剩余寿命与磁盘层保持一致
+                self.memory.set(key, text, ttl=expires_at - time.time())
+                with self._lock:
+                    self.disk_hits += 1
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def set(self, key, text):
+        ttl = seconds_until_midnight()
+        self.memory.set(key, text, ttl=ttl)
+        if self.disk is not None:
+            self.disk.set(key, text, ttl=ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_size": len(self.memory),
+            }
+
+
+response_cache = ResponseCache(
+    disk=DiskCache(data_path("response_cache.db")) if RESPONSE_CACHE_DISK else None
+)
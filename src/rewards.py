@@ -0,0 +1,450 @@
+import datetime
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from src.models import UserProfile
+
+# 消费类别
+CATEGORIES = [
+    "dining",
+    "groceries",
+    "gas",
+    "travel",
+    "flights",
+    "hotels",
+    "transit",
+    "streaming",
+    "drugstore",
+    "online_shopping",
+    "other",
+]
+
+# 识别问题中的消费类别 (中英文关键词)
+CATEGORY_KEYWORDS = {
+    "dining": [
+        "dining",
+        "dinner",
+        "lunch",
+        "restaurant",
+        "eat out",
+        "takeout",
+        "food delivery",
+        "吃饭",
+        "餐厅",
+        "餐饮",
+        "外卖",
+        "饭店",
+    ],
+    "groceries": ["grocery", "groceries", "supermarket", "买菜", "超市", "杂货"],
+    "gas": ["gas station", "gas", "fuel", "加油"],
+    "flights": ["flight", "airfare", "airline ticket", "机票", "航班"],
+    "hotels": ["hotel", "酒店"],
+    "travel": ["travel", "trip", "旅行", "旅游"],
+    "transit": ["uber", "lyft", "taxi", "subway", "transit", "打车", "地铁", "公交"],
+    "streaming": ["netflix", "spotify", "streaming", "流媒体"],
+    "drugstore": ["drugstore", "pharmacy", "cvs", "walgreens", "药店"],
+    "online_shopping": ["amazon", "online shopping", "网购", "亚马逊"],
+}
+
+
+def _keyword_pattern(keywords):
+    """英文关键词按整词匹配 (允许复数)，避免 "Vegas" 命中 "gas"；中文关键词按子串匹配"""
+    parts = [
+        (rf"\b{re.escape(k)}(?:s|es)?\b" if k.isascii() else re.escape(k))
+        for k in keywords
+    ]
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+_CATEGORY_PATTERNS = {
+    category: _keyword_pattern(keywords)
+    for category, keywords in CATEGORY_KEYWORDS.items()
+}
+
+# "哪张卡" 类问题的提示词，只有这类问题才会被本地直接回答
+BEST_CARD_PATTERNS = [
+    r"which card",
+    r"what card",
+    r"best card",
+    r"card should i use",
+    r"哪张",
+    r"刷哪",
+    r"用哪",
+    r"返现最高",
+]
+
+# 每种积分的估值 (美分/点)
+POINT_VALUES = {
+    "cash": 1.0,
+    "UR": 1.5,  # Chase Ultimate Rewards (可转点)
+    "MR": 1.5,  # Amex Membership Rewards
+    "TYP": 1.4,  # Citi ThankYou Points (可转点)
+    "C1": 1.5,  # Capital One Miles
+    "Bilt": 1.5,
+    "Delta": 1.1,
+    "Hyatt": 1.7,
+}
+
+# 没有高端卡时，返现卡的积分只能按 1¢ 兑现；持有高端卡时可以合并后转点
+POOLING = {
+    "UR_cash": (
+        "UR",
+        ["sapphire preferred", "sapphire reserve", "ink business preferred"],
+    ),
+    "TYP_cash": ("TYP", ["premier"]),
+}
+
+
+@dataclass
+class RewardRule:
+    """某个类别的返现倍率；cap 为封顶消费额，超出后按 base 计算"""
+
+    multiplier: float
+    cap: Optional[float] = None
+    period: str = ""  # cap 的周期: "month" / "quarter" / "year"
+
+
+@dataclass
+class CardRewards:
+    currency: str
+    base: float = 1.0
+    rules: Dict[str, RewardRule] = field(default_factory=dict)
+    # 季度轮换类别 (如 Freedom Flex 5%)，rotating 为该卡所属的轮换计划名
+    rotating: str = ""
+    rotating_rule: Optional[RewardRule] = None
+
+
+def _r(multiplier, cap=None, period=""):
+    return RewardRule(multiplier, cap, period)
+
+
+# 常见卡片的类别倍率表 (bank, card name 小写)
+CARD_REWARDS: Dict[Tuple[str, str], CardRewards] = {
+    ("chase", "sapphire preferred"): CardRewards(
+        "UR", rules={"dining": _r(3), "streaming": _r(3), "travel": _r(2)}
+    ),
+    ("chase", "sapphire reserve"): CardRewards(
+        "UR",
+        rules={"dining": _r(3), "travel": _r(3), "flights": _r(4), "hotels": _r(4)},
+    ),
+    ("chase", "freedom flex"): CardRewards(
+        "UR_cash",
+        rules={"dining": _r(3), "drugstore": _r(3)},
+        rotating="chase_freedom",
+        rotating_rule=_r(5, 1500, "quarter"),
+    ),
+    ("chase", "freedom unlimited"): CardRewards(
+        "UR_cash", base=1.5, rules={"dining": _r(3), "drugstore": _r(3)}
+    ),
+    ("chase", "ink business preferred"): CardRewards("UR", rules={"travel": _r(3)}),
+    ("chase", "hyatt"): CardRewards(
+        "Hyatt", rules={"dining": _r(2), "flights": _r(2), "transit": _r(2)}
+    ),
+    ("amex", "platinum"): CardRewards("MR", rules={"flights": _r(5)}),
+    ("amex", "gold"): CardRewards(
+        "MR",
+        rules={
+            "dining": _r(4, 50000, "year"),
+            "groceries": _r(4, 25000, "year"),
+            "flights": _r(3),
+        },
+    ),
+    ("amex", "green"): CardRewards(
+        "MR", rules={"dining": _r(3), "travel": _r(3), "transit": _r(3)}
+    ),
+    ("amex", "blue cash preferred"): CardRewards(
+        "cash",
+        rules={
+            "groceries": _r(6, 6000, "year"),
+            "streaming": _r(6),
+            "gas": _r(3),
+            "transit": _r(3),
+        },
+    ),
+    ("amex", "delta skymiles gold"): CardRewards(
+        "Delta", rules={"dining": _r(2), "groceries": _r(2), "flights": _r(2)}
+    ),
+    ("citi", "premier"): CardRewards(
+        "TYP",
+        rules={
+            "dining": _r(3),
+            "groceries": _r(3),
+            "gas": _r(3),
+            "travel": _r(3),
+            "flights": _r(3),
+            "hotels": _r(3),
+        },
+    ),
+    ("citi", "double cash"): CardRewards("TYP_cash", base=2.0),
+    # Custom Cash: 每个账单周期消费最高的一个类别 5% (封顶 $500)
+    ("citi", "custom cash"): CardRewards(
+        "TYP_cash",
+        rules={
+            c: _r(5, 500, "month")
+            for c in ["dining", "groceries", "gas", "drugstore", "streaming", "transit"]
+        },
+    ),
+    ("capital one", "venture x"): CardRewards("C1", base=2.0),
+    ("capital one", "savorone"): CardRewards(
+        "cash", rules={"dining": _r(3), "groceries": _r(3), "streaming": _r(3)}
+    ),
+    ("discover", "it cash back"): CardRewards(
+        "cash", rotating="discover_it", rotating_rule=_r(5, 1500, "quarter")
+    ),
+    ("bilt", "bilt mastercard"): CardRewards(
+        "Bilt", rules={"dining": _r(3), "travel": _r(2)}
+    ),
+    # Cash Rewards: 3% 自选类别 (默认按加油计算) + 2% 超市，合计每季度 $2500 封顶
+    ("bank of america", "cash rewards"): CardRewards(
+        "cash",
+        rules={"gas": _r(3, 2500, "quarter"), "groceries": _r(2, 2500, "quarter")},
+    ),
+}
+
+# 季度轮换类别: (计划, 年, 季度) -> 类别集合
+# 每个季度公布后在这里补充；未登记的季度会被当作 "不确定"，交给模型搜索确认
+ROTATING_CATEGORIES: Dict[Tuple[str, int, int], set] = {}
+
+
+def set_rotating_categories(program, year, quarter, categories):
+    ROTATING_CATEGORIES[(program, year, quarter)] = set(categories)
+    rank_wallet.cache_clear()
+
+
+@dataclass
+class CardScore:
+    card: str  # 显示名, e.g. "Amex Gold"
+    category: str
+    multiplier: float
+    currency: str
+    cents_per_dollar: float
+    cap_note: str = ""
+    uncertain: bool = False  # 轮换类别未知，结果可能偏低
+    potential_cents_per_dollar: float = 0.0  # 如果本季度轮换到该类别时的收益
+
+    def describe(self):
+        unit = "%" if self.currency == "cash" else f"x {self.currency}"
+        text = (
+            f"{self.card}: {self.multiplier:g}{unit} (≈{self.cents_per_dollar:.1f}¢/$)"
+        )
+        if self.cap_note:
+            text += f" [{self.cap_note}]"
+        return text
+
+
+# 卡名中出现这些词时通常是另一款产品 (商务卡、联名卡)，
+# 例如 "Business Gold" 不是 "Gold"，"Platinum Delta SkyMiles" 不是 "Platinum"
+PRODUCT_WORDS = {
+    "business",
+    "biz",
+    "corporate",
+    "ink",
+    "delta",
+    "skymiles",
+    "hilton",
+    "marriott",
+    "bonvoy",
+    "hyatt",
+    "ihg",
+    "united",
+    "southwest",
+    "aadvantage",
+    "amazon",
+    "costco",
+}
+
+
+def lookup_card(bank, name) -> Optional[CardRewards]:
+    """
+    按 (bank, name) 查找倍率表，允许名称中有多余的字 (e.g. 'Freedom Flex (old)')。
+    按整词匹配并优先最长的表名；多余的字可能指向另一款产品时返回 None，交给模型回答
+    """
+    bank, name = bank.strip().lower(), name.strip().lower()
+    if (bank, name) in CARD_REWARDS:
+        return CARD_REWARDS[(bank, name)]
+
+    candidates = [
+        n
+        for b, n in CARD_REWARDS
+        if b == bank and re.search(rf"\b{re.escape(n)}\b", name)
+    ]
+    if not candidates:
+        return None
+    best = max(candidates, key=len)
+    extra = set(re.findall(r"\w+", name)) - set(best.split())
+    if extra & PRODUCT_WORDS:
+        return None
+    return CARD_REWARDS[(bank, best)]
+
+
+def _quarter(today):
+    return today.year, (today.month - 1) // 3 + 1
+
+
+def _point_value(currency, wallet_names):
+    if currency in POOLING:
+        pooled, premium_cards = POOLING[currency]
+        if any(p in n for n in wallet_names for p in premium_cards):
+            return pooled, POINT_VALUES[pooled]
+        return pooled, POINT_VALUES["cash"]
+    return currency, POINT_VALUES[currency]
+
+
+@lru_cache(maxsize=1024)
+def rank_wallet(wallet: Tuple[Tuple[str, str], ...], today: datetime.date):
+    """
+    一次性计算 卡片 × 类别 的收益矩阵，并对每一列 (类别) 排序。
+    wallet 是 ((bank, name), ...) 元组，便于按卡包组合做 memoize。
+
+    返回 (ranking, unknown_cards):
+        ranking: {category: [CardScore, ...] (收益从高到低)}
+        unknown_cards: 倍率表中没有的卡片
+    """
+    year, quarter = _quarter(today)
+    wallet_names = [name.lower() for _, name in wallet]
+
+    known, unknown_cards = [], []
+    for bank, name in wallet:
+        rewards = lookup_card(bank, name)
+        if rewards is None:
+            unknown_cards.append(f"{bank} {name}")
+        else:
+            known.append((f"{bank} {name}", rewards))
+
+    # 矩阵的一行是一张卡在所有类别上的得分
+    matrix = []
+    for display, rewards in known:
+        currency, cpp = _point_value(rewards.currency, wallet_names)
+        rotating = (
+            ROTATING_CATEGORIES.get((rewards.rotating, year, quarter))
+            if rewards.rotating
+            else None
+        )
+        row = []
+        for category in CATEGORIES:
+            rule = rewards.rules.get(category)
+            uncertain = False
+            if rewards.rotating:
+                if rotating is None:
+                    uncertain = True
+                elif category in rotating:
+                    rule = rewards.rotating_rule
+            multiplier = max(rule.multiplier if rule else 0, rewards.base)
+            potential = (
+                rewards.rotating_rule.multiplier * cpp
+                if uncertain
+                else multiplier * cpp
+            )
+            # 封顶额只作为说明展示，不参与排序 (不知道用户在该类别的实际消费额)
+            cap_note = (
+                f"up to ${rule.cap:,.0f}/{rule.period}"
+                if rule and rule.cap and multiplier == rule.multiplier
+                else ""
+            )
+            row.append(
+                CardScore(
+                    display,
+                    category,
+                    multiplier,
+                    currency,
+                    multiplier * cpp,
+                    cap_note,
+                    uncertain,
+                    potential,
+                )
+            )
+        matrix.append(row)
+
+    # 按列排序
+    ranking = {
+        category: sorted(
+            (row[j] for row in matrix), key=lambda s: s.cents_per_dollar, reverse=True
+        )
+        for j, category in enumerate(CATEGORIES)
+    }
+    return ranking, tuple(unknown_cards)
+
+
+def wallet_key(user_profile: UserProfile):
+    return tuple((card.bank, card.name) for card in user_profile.cards)
+
+
+def best_cards(
+    user_profile: UserProfile, category, top=3, today=None
+) -> List[CardScore]:
+    ranking, _ = rank_wallet(wallet_key(user_profile), today or datetime.date.today())
+    return ranking.get(category, [])[:top]
+
+
+def detect_category(text) -> Optional[str]:
+    for category, pattern in _CATEGORY_PATTERNS.items():
+        if pattern.search(text):
+            return category
+    return None
+
+
+def is_best_card_question(text):
+    lowered = text.lower()
+    return any(re.search(p, lowered) for p in BEST_CARD_PATTERNS)
+
+
+def grounding_context(user_profile: UserProfile, category, today=None) -> str:
+    """给模型的事实: 本地计算出的该类别卡片排名"""
+    ranking, unknown = rank_wallet(
+        wallet_key(user_profile), today or datetime.date.today()
+    )
+    lines = [
+        f"[LOCAL REWARD ENGINE] Best cards for {category} (computed, not guessed):"
+    ]
+    for score in ranking.get(category, []):
+        note = (
+            " (rotating 5% categories for this quarter unknown)"
+            if score.uncertain
+            else ""
+        )
+        lines.append(f"- {score.describe()}{note}")
+    if unknown:
+        lines.append(f"- Rates unknown for: {', '.join(unknown)}")
+    return "\n".join(lines)
+
+
+def answer_best_card(user_profile: UserProfile, text, lang="en", today=None):
+    """
+    如果问题是 "某类消费刷哪张卡"，并且本地数据足够确定，直接返回答案 (不调用 API)。
+    否则返回 None，由调用方把 grounding_context 交给模型。
+    """
+    category = detect_category(text)
+    if category is None or not is_best_card_question(text):
+        return None
+
+    ranking, unknown = rank_wallet(
+        wallet_key(user_profile), today or datetime.date.today()
+    )
+    scores = ranking.get(category, [])
+    if not scores or unknown:
+        return None
+
+    # 轮换类别未知的卡片如果 "可能" 比最优卡更好，就不能直接下结论
+    best = scores[0]
+    if any(
+        s.uncertain and s.potential_cents_per_dollar > best.cents_per_dollar
+        for s in scores
+    ):
+        return None
+
+    others = "\n".join(f"- {s.describe()}" for s in scores[1:3])
+    if lang == "zh":
+        answer = f"**{category}** 消费推荐刷 **{best.card}**：{best.describe()}"
+        if others:
+            answer += f"\n\n其它选择：\n{others}"
+        return answer + "\n\n*(本地返现引擎计算，积分按估值折算为美分/美元)*"
+
+    answer = f"For **{category}**, use **{best.card}**: {best.describe()}"
+    if others:
+        answer += f"\n\nRunners-up:\n{others}"
+    return (
+        answer
+        + "\n\n*(Computed locally by the reward engine; points valued in ¢ per $.)*"
+    )
@@ -0,0 +1,212 @@
+import calendar
+import datetime
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from src.models import UserProfile
+
+# 常用的申卡速度统计窗口 (月)
+VELOCITY_WINDOWS = (6, 12, 24)
+
+# 不计入 5/24 的商业卡 (按卡名关键字判断)
+BUSINESS_KEYWORDS = ("business", "ink")
+
+_524_PATTERN = re.compile(r"5\s*/\s*24")
+# 只有询问 "我自己的" 5/24 状态时才由本地直接回答；
+# 其它提到 5/24 的问题 (申请策略、规则细节等) 交给模型，本地状态作为事实附在 prompt 中
+_524_STATUS_PATTERN = re.compile(
+    r"\b(am|are)\s+(i|we)\s+(still\s+)?(under|below|over|at|affected|subject|eligible)\b"
+    r"|\bmy\s+(chase\s+)?5\s*/\s*24\b"
+    r"|\bmy\s+(5\s*/\s*24\s+)?status\b"
+    r"|\bwhere\s+(do|am)\s+i\s+stand\b"
+    r"|\bcheck\s+(if|whether)\s+i\b"
+    r"|我.{0,6}(受|被).{0,4}限制"
+    r"|我.{0,6}(在|是否在|还在).{0,8}以下"
+    r"|我的.{0,6}5\s*/\s*24"
+    r"|我.{0,4}(现在|目前).{0,6}(几|多少)",
+    re.IGNORECASE,
+)
+
+
+def add_months(date, months):
+    """日期加减整月，月末自动对齐 (e.g. 01-31 + 1 个月 = 02-28/29)"""
+    month_index = date.month - 1 + months
+    year = date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return datetime.date(year, month, day)
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_business_card(name):
+    lowered = name.lower()
+    return any(k in lowered for k in BUSINESS_KEYWORDS)
+
+
+@dataclass(frozen=True)
+class ChaseStatus:
+    today: datetime.date
+    count: int  # 过去 24 个月内开的个人卡数量
+    counted_cards: Tuple[Tuple[str, datetime.date], ...]  # (卡名, 开卡日期)，按日期升序
+    velocity: Tuple[Tuple[int, int], ...]  # ((月数, 开卡数), ...)
+    next_drop_off: Optional[datetime.date]  # 下一张卡不再计入的日期
+    eligible_on: Optional[
+        datetime.date
+    ]  # 重新回到 4/24 以下的日期 (已在 5/24 以下时为 None)
+    missing_dates: Tuple[str, ...]  # 没有填写开卡日期的卡片
+    business_cards: Tuple[str, ...]
+
+    @property
+    def under_524(self):
+        return self.count < 5
+
+
+@lru_cache(maxsize=1024)
+def _compute(cards: Tuple[Tuple[str, str], ...], today: datetime.date) -> ChaseStatus:
+    window_start = add_months(today, -24)
+
+    counted, missing, business = [], [], []
+    dated_personal = []
+    for name, open_date in cards:
+        if is_business_card(name):
+            business.append(name)
+            continue
+        opened = parse_date(open_date)
+        if opened is None:
+            missing.append(name)
+            continue
+        dated_personal.append((name, opened))
+        if window_start < opened <= today:
+            counted.append((name, opened))
+
+    counted.sort(key=lambda item: item[1])
+
+    velocity = tuple(
+        (
+            months,
+            sum(
+                1 for _, d in dated_personal if add_months(today, -months) < d <= today
+            ),
+        )
+        for months in VELOCITY_WINDOWS
+    )
+
+    # 一张卡在开卡 24 个月后不再计入
+    drop_offs = [add_months(d, 24) for _, d in counted]
+    next_drop_off = drop_offs[0] if drop_offs else None
+    eligible_on = drop_offs[len(counted) - 5] if len(counted) >= 5 else None
+
+    return ChaseStatus(
+        today=today,
+        count=len(counted),
+        counted_cards=tuple(counted),
+        velocity=velocity,
+        next_drop_off=next_drop_off,
+        eligible_on=eligible_on,
+        missing_dates=tuple(missing),
+        business_cards=tuple(business),
+    )
+
+
+def chase_524_status(user_profile: UserProfile, today=None) -> ChaseStatus:
+    """计算 5/24 状态；按卡包内容 + 日期 memoize，卡包不变时不会重复计算"""
+    cards = tuple(
+        (f"{card.bank} {card.name}", card.open_date) for card in user_profile.cards
+    )
+    return _compute(cards, today or datetime.date.today())
+
+
+def prompt_facts(status: ChaseStatus) -> str:
+    """写进 System Prompt 的确定性事实，模型不需要再自己做日期计算"""
+    lines = [
+        "[LOCAL 5/24 CALCULATOR] (computed, use these numbers as facts)",
+        f"- Personal cards opened in the last 24 months: {status.count}/24 "
+        f"({'UNDER' if status.under_524 else 'AT/OVER'} 5/24)",
+    ]
+    for name, opened in status.counted_cards:
+        lines.append(
+            f"  * {name}: opened {opened}, stops counting {add_months(opened, 24)}"
+        )
+    lines.append(
+        "- Cards opened per trailing window: "
+        + ", ".join(f"{m} months: {n}" for m, n in status.velocity)
+    )
+    if status.eligible_on:
+        lines.append(f"- Back under 5/24 on: {status.eligible_on}")
+    elif status.next_drop_off:
+        lines.append(f"- Next slot frees up on: {status.next_drop_off}")
+    if status.business_cards:
+        lines.append(
+            f"- Business cards (not counted): {', '.join(status.business_cards)}"
+        )
+    if status.missing_dates:
+        lines.append(
+            f"- Open date unknown (not counted): {', '.join(status.missing_dates)}"
+        )
+    return "\n".join(lines)
+
+
+def is_524_question(text):
+    """是否在问自己当前的 5/24 状态 (可以用 answer_524 直接回答)"""
+    return bool(_524_PATTERN.search(text) and _524_STATUS_PATTERN.search(text))
+
+
+def answer_524(status: ChaseStatus, lang="en") -> str:
+    """5/24 问题的本地回答 (规则解释 + 当前状态)"""
+    counted: List[str] = [
+        f"- {name} ({opened})" for name, opened in status.counted_cards
+    ]
+
+    if lang == "zh":
+        parts = [
+            "**Chase 5/24 规则**：如果过去 24 个月内新开了 5 张或以上个人信用卡"
+            "(任何银行，大部分商业卡不算)，Chase 会拒绝大多数新卡申请。",
+            f"**您的状态**：过去 24 个月内开了 **{status.count}** 张个人卡，"
+            + (
+                "目前 **在 5/24 以下** ✅"
+                if status.under_524
+                else "目前 **受 5/24 限制** ❌"
+            ),
+        ]
+        if counted:
+            parts.append("计入的卡片：\n" + "\n".join(counted))
+        if status.eligible_on:
+            parts.append(f"📅 预计 **{status.eligible_on}** 回到 5/24 以下。")
+        elif status.next_drop_off:
+            parts.append(f"📅 下一张卡在 **{status.next_drop_off}** 不再计入。")
+        if status.missing_dates:
+            parts.append(
+                f"⚠️ 以下卡片没有开卡日期，未计入：{', '.join(status.missing_dates)}"
+            )
+        return "\n\n".join(parts)
+
+    parts = [
+        "**Chase 5/24 rule**: if you have opened 5 or more personal credit cards "
+        "(from any bank; most business cards don't count) in the past 24 months, "
+        "Chase will deny most new card applications.",
+        f"**Your status**: **{status.count}** personal cards opened in the last 24 months, "
+        + (
+            "so you are **under 5/24** ✅"
+            if status.under_524
+            else "so you are **at/over 5/24** ❌"
+        ),
+    ]
+    if counted:
+        parts.append("Cards that count:\n" + "\n".join(counted))
+    if status.eligible_on:
+        parts.append(f"📅 You drop back under 5/24 on **{status.eligible_on}**.")
+    elif status.next_drop_off:
+        parts.append(f"📅 Your next card stops counting on **{status.next_drop_off}**.")
+    if status.missing_dates:
+        parts.append(
+            f"⚠️ No open date on file (not counted): {', '.join(status.missing_dates)}"
+        )
+    return "\n\n".join(parts)
@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求: 同一个 key 同时只有一个调用在执行 (leader)，
+    其它调用 (followers) 等待它的 Future 并共享结果或异常。
+
+    - followers 的等待时间有上限 (timeout)，超时或 leader 被取消时各自执行 fn，
+      不会因为一个卡住的请求把所有人都挂住
+    - do() 用于普通线程 (例如 Streamlit 的脚本线程)，do_async() 用于 asyncio，
+      两者共享同一张 in-flight 表，可以互相合并
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> concurrent.futures.Future
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def _join(self, key):
+        """返回 (future, is_leader)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if not future.done():
+            # leader 被中断 (例如协程被取消)，让 followers 各自重试
+            future.cancel()
+
+    def _fallback(self, key, reason):
+        with self._lock:
+            self.timeouts += 1
+        logger.warning(f"Single-flight wait for {key[:12]} {reason}, calling directly")
+
+    def do(self, key, fn, timeout=None):
+        future, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._finish(key, future)
+
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self._fallback(key, "timed out")
+        except concurrent.futures.CancelledError:
+            self._fallback(key, "was cancelled")
+        return fn()
+
+    async def do_async(self, key, fn, timeout=None):
+        """fn 是同步函数，leader 会在线程池中执行它，不阻塞事件循环"""
+        future, leader = self._join(key)
+        if leader:
+            try:
+                result = await asyncio.to_thread(fn)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._finish(key, future)
+
+        try:
+            # shield: 超时只放弃等待，不能取消其它调用方也在等的 Future
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout
+            )
+        except asyncio.TimeoutError:
+            self._fallback(key, "timed out")
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # 是调用方自己被取消
+            self._fallback(key, "was cancelled")
+        return await asyncio.to_thread(fn)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,43 @@
+import json
+import logging
+import threading
+import time
+
+from src.config import data_path
+
+logger = logging.getLogger(__name__)
+
+# 进程内第一次脚本运行 (冷启动) 还没有报告过
+_cold = True
+_cold_lock = threading.Lock()
+
+
+class StartupTimer:
+    """
+    记录一次脚本运行中各阶段完成的时间点 (相对脚本开始)，
+    用于发现启动变慢的回归: 每个 session 的第一次运行写一行到 startup_timings.jsonl
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, label):
+        self.marks[label] = round(time.perf_counter() - self.started, 3)
+
+    def report(self, path=None):
+        """写入日志和 JSONL 文件，返回本次的报告"""
+        global _cold
+        with _cold_lock:
+            cold, _cold = _cold, False
+        report = {"at": time.time(), "cold": cold, "marks": dict(self.marks)}
+        logger.info(
+            f"⏱️ Startup ({'cold' if cold else 'warm'}): "
+            + ", ".join(f"{k} {v:.2f}s" for k, v in self.marks.items())
+        )
+        try:
+            with open(path or data_path("startup_timings.jsonl"), "a") as f:
+                f.write(json.dumps(report) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write startup timings: {e}")
+        return report
@@ -1,158 +1,135 @@
-import gspread
-import streamlit as st
-from google.oauth2.service_account import Credentials
+import copy
+import logging
+import os
+import threading
 
+from src.cache import TTLCache
 from src.models import CreditCard, UserProfile
+from src.tracing import span
 
-# 定义权限范围
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+logger = logging.getLogger(__name__)
 
+# 存储后端: "sheets" (Google Sheets，默认) 或 "sqlite" (本地文件，无网络依赖)
+STORAGE_BACKEND = os.getenv("WALLE_STORAGE_BACKEND", "sheets")
 
-@st.cache_resource
-def get_db_connection():
-    """
-    连接到 Google Sheets (带缓存，避免每次刷新都重新连接)
-    """
-    try:
-        # 1. 将 secrets 转换为普通字典 (Streamlit secrets 有时是特殊对象)
-        credentials_dict = dict(st.secrets["gcp_service_account"])
+# 卡包读缓存: 按 user_id 缓存，TTL (秒) + LRU 容量
+WALLET_CACHE_TTL = float(os.getenv("WALLE_WALLET_CACHE_TTL", "600"))
+WALLET_CACHE_SIZE = int(os.getenv("WALLE_WALLET_CACHE_SIZE", "1024"))
 
-        # 2. 🚑 关键修复：处理 private_key 中的换行符
-        # TOML 读取出来的 \n 有时是字符串字面量，需要转义为真正的换行符
-        if "private_key" in credentials_dict:
-            credentials_dict["private_key"] = credentials_dict["private_key"].replace(
-                "\\n", "\n"
-            )
+_wallet_cache = TTLCache(maxsize=WALLET_CACHE_SIZE, ttl=WALLET_CACHE_TTL)
 
-        # 创建认证凭证
-        creds = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+_backend = None
+_backend_lock = threading.Lock()
 
-        # 授权并打开表格
-        client = gspread.authorize(creds)
 
-        # 打开表格
-        sheet = client.open("walle_database").worksheet("Cards")
-        return sheet
+def create_backend(name):
+    """按名称创建存储后端 (按需导入，使用 SQLite 时不会加载 gspread)"""
+    if name == "sheets":
+        from src.backends.sheets import SheetsBackend
 
-    except Exception as e:
-        # 打印更详细的错误堆栈，方便调试
-        import traceback
+        return SheetsBackend()
+    if name == "sqlite":
+        from src.backends.sqlite import SQLiteBackend
 
-        st.error(f"❌ Database Connection Error: {e}")
-        st.code(traceback.format_exc())  # 这行能让你看到具体的报错位置
-        return None
+        return SQLiteBackend()
+    raise ValueError(f"Unknown storage backend: {name}")
 
 
-def load_user_data(user_id="owner_001"):
-    """
-    从表格读取数据，并转换为 UserProfile 对象
-    """
-    sheet = get_db_connection()
-    if not sheet:
-        return UserProfile(user_id)
+def get_backend():
+    """返回进程内共享的存储后端实例"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(STORAGE_BACKEND)
+    return _backend
 
-    # 读取所有记录 (返回 list of dicts)
-    records = sheet.get_all_records()
 
-    user = UserProfile(user_id=user_id)
+# revision 查询失败时的哨兵值，保证不会与任何缓存条目匹配
+_REVISION_UNKNOWN = object()
 
-    # 过滤出当前用户的数据
-    for row in records:
-        if row.get("user_id") == user_id:
-            # 重建 CreditCard 对象
-            card = CreditCard(
-                bank=str(row["bank"]),
-                name=str(row["card_name"]),
-                network=str(row["network"]),
-                last_four=str(row["last_four"]),
-                open_date=str(row.get("open_date", "")),
-            )
-            # 注意：Benefit 这里暂时留空，或者让 AI 在运行时推理
-            # 如果你想存 Benefit，需要在表格加更多列，目前 V1 保持简单
-            user.add_card(card)
+# 每个用户的写入代数: 读取期间发生本地写入时，不把旧数据放进缓存
+_write_generation = {}
+_generation_lock = threading.Lock()
 
-    return user
 
+def _current_revision(backend):
+    try:
+        return backend.revision()
+    except Exception as e:
+        logger.warning(f"Revision check failed, bypassing wallet cache: {e}")
+        return _REVISION_UNKNOWN
 
-def save_new_card(user_id, card: CreditCard):
+
+def load_user_data(user_id="owner_001") -> UserProfile:
     """
-    向表格追加一行新卡片
+    读取数据，并转换为 UserProfile 对象 (read-through 缓存)
+
+    缓存命中时先用后端的 revision (例如表格的修改时间) 校验，
+    数据没有变化就直接返回缓存副本，不再重新下载。
     """
-    sheet = get_db_connection()
-    if sheet:
-        # 构造一行数据 [user_id, bank, card_name, network, last_four]
-        row_data = [
-            user_id,
-            card.bank,
-            card.name,
-            card.network,
-            card.last_four,
-            card.open_date,
-        ]
-        sheet.append_row(row_data)
-
-
-def delete_card_from_db(user_id, card_index):
+    with span("storage.load_wallet", backend=STORAGE_BACKEND) as s:
+        backend = get_backend()
+        generation = _write_generation.get(user_id, 0)
+        with span("storage.revision"):
+            revision = _current_revision(backend)
+
+        cached = _wallet_cache.get(user_id)
+        if cached is not None and cached[0] == revision:
+            s.set(cache_hit=True)
+            # 返回副本，避免不同 session 修改同一个对象
+            return copy.deepcopy(cached[1])
+
+        s.set(cache_hit=False)
+        user = backend.load_user_data(user_id)
+        with _generation_lock:
+            if (
+                revision is not _REVISION_UNKNOWN
+                and _write_generation.get(user_id, 0) == generation
+            ):
+                _wallet_cache.set(user_id, (revision, copy.deepcopy(user)))
+        s.set(cards=len(user.cards))
+        return user
+
+
+def invalidate_wallet_cache(user_id=None):
+    """本地写入后让缓存失效；不传 user_id 时清空全部"""
+    with _generation_lock:
+        if user_id is None:
+            for uid in _write_generation:
+                _write_generation[uid] += 1
+            _wallet_cache.clear()
+        else:
+            _write_generation[user_id] = _write_generation.get(user_id, 0) + 1
+            _wallet_cache.invalidate(user_id)
+
+
+def wallet_cache_stats():
+    return _wallet_cache.stats()
+
+
+def save_new_card(user_id, card: CreditCard):
     """
-    从表格删除卡片
-    注意：这比较 tricky，我们假设表格里的顺序和 UI 顺序一致。
+    追加一张新卡片
     """
-    sheet = get_db_connection()
-    if sheet:
-        # 获取所有数据以找到对应的行号
-        # 表头是第1行，数据从第2行开始
-        # 这是一个简单的实现，假设 owner_001 的数据是连续的
-        # 为了生产环境稳健性，通常需要唯一的 card_id，但在 V1 我们用简单逻辑
-
-        all_values = sheet.get_all_values()  # 包含表头
+    with span("storage.save_card", backend=STORAGE_BACKEND):
+        get_backend().save_new_card(user_id, card)
+    invalidate_wallet_cache(user_id)
 
-        current_user_rows = []
-        for i, row in enumerate(all_values):
-            if i == 0:
-                continue  # 跳过表头
-            if row[0] == user_id:  # row[0] 是 user_id 列
-                current_user_rows.append(i + 1)  # 记录真实的行号 (1-based)
 
-        if card_index < len(current_user_rows):
-            row_to_delete = current_user_rows[card_index]
-            sheet.delete_rows(row_to_delete)
+def delete_card_from_db(user_id, card_id):
+    """
+    删除 card_id 对应的卡片
+    """
+    with span("storage.delete_card", backend=STORAGE_BACKEND):
+        get_backend().delete_card(user_id, card_id)
+    invalidate_wallet_cache(user_id)
 
 
-def update_card_in_db(user_id, card_index, updated_card: CreditCard):
+def update_card_in_db(user_id, card_id, updated_card: CreditCard):
     """
-    更新指定用户的第 card_index 张卡片
-    注意：这里的 card_index 是指在该用户所有卡片列表中的索引 (0, 1, 2...)
+    更新 card_id 对应的卡片，updated_card 会沿用原来的 card_id
     """
-    sheet = get_db_connection()
-    if sheet:
-        # 1. 获取所有数据来定位行号
-        all_values = sheet.get_all_values()
-
-        current_user_rows = []
-        for i, row in enumerate(all_values):
-            if i == 0:
-                continue  # 跳过表头
-            if row[0] == user_id:
-                current_user_rows.append(i + 1)  # 记录真实的行号 (1-based)
-
-        # 2. 确保索引有效
-        if card_index < len(current_user_rows):
-            row_num = current_user_rows[card_index]
-
-            # 3. 构造更新后的数据行
-            # 格式必须与表头一致: user_id, bank, card_name, network, last_four, open_date
-            row_data = [
-                user_id,
-                updated_card.bank,
-                updated_card.name,
-                updated_card.network,
-                updated_card.last_four,
-                updated_card.open_date,
-            ]
-
-            # 4. 执行更新 (更新 A到F列)
-            # gspread 的 update 方法可以直接指定范围
-            sheet.update(range_name=f"A{row_num}:F{row_num}", values=[row_data])
+    with span("storage.update_card", backend=STORAGE_BACKEND):
+        get_backend().update_card(user_id, card_id, updated_card)
+    invalidate_wallet_cache(user_id)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from src.tracing import bind, span
+
+logger = logging.getLogger(__name__)
+
+# 单个工具调用的默认超时 (秒)，可按工具名单独配置
+TOOL_TIMEOUT = float(os.getenv("WALLE_TOOL_TIMEOUT", "30"))
+TOOL_WORKERS = int(os.getenv("WALLE_TOOL_WORKERS", "8"))
+
+
+class ToolRunner:
+    """
+    并行执行同一轮中的多个函数调用。
+
+    - 每个调用有自己的超时 (从提交时开始计时)，总耗时约等于最慢的那个调用
+    - 超时或出错的调用返回 {"error": ...}，不影响其它调用的结果
+    - 结果顺序与调用顺序一致
+    - 调用方中途放弃时 (例如生成器被关闭)，还没开始执行的调用会被取消
+    - run_async() 在事件循环中执行: async_registry 中有协程版本的工具直接 await，
+      其余工具放到线程池中执行
+    """
+
+    def __init__(
+        self, registry, timeouts=None, default_timeout=TOOL_TIMEOUT, async_registry=None
+    ):
+        self.registry = registry
+        self.async_registry = async_registry or {}
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=TOOL_WORKERS, thread_name_prefix="walle-tool"
+        )
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.timed_out = 0
+
+    def _invoke(self, name, args):
+        fn = self.registry.get(name)
+        if fn is None:
+            return {"error": f"Unknown tool: {name}"}
+        with span(f"tool.{name}") as s:
+            try:
+                return {"result": fn(**(args or {}))}
+            except Exception as e:
+                logger.error(f"Tool {name} failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                s.set(error=str(e))
+                return {"error": str(e)}
+
+    def run(self, calls):
+        """calls: [(name, args), ...] -> [{"result": ...} 或 {"error": ...}, ...]"""
+        started = time.monotonic()
+        futures = [
+            self._pool.submit(bind(self._invoke), name, args) for name, args in calls
+        ]
+        with self._lock:
+            self.calls += len(calls)
+
+        results = []
+        try:
+            for (name, _), future in zip(calls, futures):
+                timeout = self.timeouts.get(name, self.default_timeout)
+                remaining = max(0.0, started + timeout - time.monotonic())
+                try:
+                    results.append(future.result(timeout=remaining))
+                except FutureTimeout:
+                    future.cancel()
+                    logger.warning(f"Tool {name} timed out after {timeout:g}s")
+                    with self._lock:
+                        self.timed_out += 1
+                    results.append({"error": f"Tool timed out after {timeout:g}s"})
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    async def _invoke_async(self, name, args):
+        fn = self.async_registry.get(name)
+        if fn is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._pool, bind(self._invoke), name, args
+            )
+        with span(f"tool.{name}") as s:
+            try:
+                return {"result": await fn(**(args or {}))}
+            except Exception as e:
+                logger.error(f"Tool {name} failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                s.set(error=str(e))
+                return {"error": str(e)}
+
+    async def _run_one_async(self, name, args):
+        timeout = self.timeouts.get(name, self.default_timeout)
+        try:
+            return await asyncio.wait_for(self._invoke_async(name, args), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool {name} timed out after {timeout:g}s")
+            with self._lock:
+                self.timed_out += 1
+            return {"error": f"Tool timed out after {timeout:g}s"}
+
+    async def run_async(self, calls):
+        """run() 的 asyncio 版本，返回值格式相同"""
+        with self._lock:
+            self.calls += len(calls)
+        return list(
+            await asyncio.gather(
+                *(self._run_one_async(name, args) for name, args in calls)
+            )
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "timed_out": self.timed_out,
+            }
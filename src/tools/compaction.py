@@ -0,0 +1,282 @@
+import datetime
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import zip_longest
+from typing import List, Optional
+
+from src.history import estimate_tokens
+
+# 搜索结果交给模型之前的 token 预算 (不含标题/来源等格式开销)
+SEARCH_TOKEN_BUDGET = int(os.getenv("WALLE_SEARCH_TOKEN_BUDGET", "1200"))
+# 估计 Jaccard 相似度超过该值的段落视为重复 (镜像站、转帖)
+DUPLICATE_THRESHOLD = 0.7
+# 段落切分的目标长度 (字符)
+PASSAGE_CHARS = 400
+
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 5
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (1 + 2 * zlib.crc32(f"a{i}".encode()), zlib.crc32(f"b{i}".encode()))
+    for i in range(NUM_PERMUTATIONS)
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+|(?<=[。！？])|\n{2,}")
+_WORD = re.compile(r"[a-z0-9]+(?:[.'/][a-z0-9]+)*")
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+STOPWORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "for",
+    "how",
+    "in",
+    "is",
+    "it",
+    "of",
+    "on",
+    "or",
+    "the",
+    "to",
+    "what",
+    "which",
+    "with",
+}
+
+
+def source_tag_for(url):
+    # 简单的标记，让 Agent 知道这是中文源还是英文源
+    return "[CN]" if "uscard" in url or "guide" in url else "[EN]"
+
+
+def terms(text):
+    """英文按词 (去停用词)，中日韩文字按相邻两字 (bigram)"""
+    text = text.casefold()
+    words = [w for w in _WORD.findall(text) if w not in STOPWORDS]
+    for run in _CJK_RUN.findall(text):
+        words.extend(run[i : i + 2] for i in range(max(1, len(run) - 1)))
+    return words
+
+
+def split_passages(text, max_chars=PASSAGE_CHARS):
+    """按句子切分，再合并成不超过 max_chars 的段落"""
+    passages, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+def minhash(text):
+    """基于字符 shingle 的 MinHash 签名，两个签名相同位置的比例近似 Jaccard 相似度"""
+    normalized = " ".join(text.casefold().split())
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {
+            normalized[i : i + SHINGLE_SIZE]
+            for i in range(len(normalized) - SHINGLE_SIZE + 1)
+        }
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+@dataclass
+class Passage:
+    text: str
+    title: str
+    url: str
+    source_tag: str
+    fetched_at: Optional[float] = None
+    rank: int = 0  # 来源在原始结果中的位置
+    score: float = 0.0
+    tokens: int = 0
+
+
+@dataclass
+class SearchResult:
+    """
+    压缩后的搜索结果。format() (以及 str()) 在第一次需要时才生成给模型看的文本，
+    to_dict() 用于需要结构化数据的调用方。
+    """
+
+    query: str
+    answer: Optional[str] = None
+    passages: List[Passage] = field(default_factory=list)
+    stale: bool = False
+    local: bool = False
+    duplicates_removed: int = 0
+    passages_dropped: int = 0
+    tokens: int = 0
+
+    @cached_property
+    def text(self):
+        context = (
+            "Search Results from Trusted Community (USCreditCardGuide/DoC/Reddit):\n\n"
+        )
+        if self.stale:
+            context += (
+                "⚠️ Live search is unavailable. These are previously fetched results "
+                "and may be outdated.\n\n"
+            )
+        if self.answer:
+            context += f"Direct Answer: {self.answer}\n\n"
+
+        # 同一来源的段落放在一起，来源按原始排名排列
+        by_source = {}
+        for passage in sorted(self.passages, key=lambda p: p.rank):
+            by_source.setdefault(passage.url, []).append(passage)
+
+        for url, passages in by_source.items():
+            first = passages[0]
+            fetched = ""
+            if first.fetched_at:
+                fetched = f" (fetched {datetime.date.fromtimestamp(first.fetched_at)})"
+            context += (
+                f"--- Source {first.source_tag}: [{first.title}]({url}){fetched} ---\n"
+            )
+            context += "Content: " + " … ".join(p.text for p in passages) + "\n\n"
+        return context
+
+    def format(self):
+        return self.text
+
+    def __str__(self):
+        return self.text
+
+    def to_dict(self):
+        return {
+            "query": self.query,
+            "answer": self.answer,
+            "stale": self.stale,
+            "sources": [
+                {
+                    "title": p.title,
+                    "url": p.url,
+                    "source_tag": p.source_tag,
+                    "text": p.text,
+                    "score": round(p.score, 3),
+                }
+                for p in self.passages
+            ],
+        }
+
+
+def _score(passages, query):
+    """BM25 风格的打分 (以段落为文档)，标题中出现的查询词额外加分"""
+    query_terms = set(terms(query))
+    if not query_terms:
+        return
+    docs = [terms(p.text) for p in passages]
+    avg_len = sum(len(d) for d in docs) / max(1, len(docs)) or 1
+    doc_freq = Counter(t for d in docs for t in set(d) & query_terms)
+    n = len(docs)
+
+    for passage, doc in zip(passages, docs):
+        counts = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(doc) / avg_len))
+        title_terms = set(terms(passage.title))
+        score += 0.5 * len(query_terms & title_terms) / len(query_terms)
+        # 排名靠前的来源略微加权
+        passage.score = score / (1 + 0.05 * passage.rank)
+
+
+def merge_responses(responses):
+    """
+    合并多个并行搜索的结果: 按 url 去重，各组结果轮流排列
+    (每组的第一名都排在前面，某一组的结果不会把其它组挤掉)
+    """
+    answers = list(dict.fromkeys(r["answer"] for r in responses if r.get("answer")))
+    seen = set()
+    merged = []
+    for row in zip_longest(*(r.get("results", []) for r in responses)):
+        for res in row:
+            if res is None or res.get("url") in seen:
+                continue
+            seen.add(res.get("url"))
+            merged.append(res)
+    return {
+        "answer": "\n".join(answers) or None,
+        "results": merged,
+        "local": bool(responses) and all(r.get("local") for r in responses),
+        "stale": any(r.get("stale") for r in responses),
+    }
+
+
+def compact_results(query, response, token_budget=SEARCH_TOKEN_BUDGET):
+    """
+    把 Tavily 返回的 JSON 压缩成 SearchResult:
+    1. 切分段落并按与查询的相关度打分
+    2. 用 MinHash 去掉近似重复的段落 (保留得分高的)
+    3. 按得分依次放入，直到用完 token 预算 (至少保留一段)
+    """
+    answer = response.get("answer")
+    passages = []
+    for rank, res in enumerate(response.get("results", [])):
+        url = res.get("url", "")
+        for text in split_passages(res.get("content") or ""):
+            passages.append(
+                Passage(
+                    text=text,
+                    title=res.get("title") or "No Title",
+                    url=url,
+                    source_tag=res.get("source_tag") or source_tag_for(url),
+                    fetched_at=res.get("fetched_at"),
+                    rank=rank,
+                    tokens=estimate_tokens(text),
+                )
+            )
+
+    _score(passages, query)
+    ranked = sorted(passages, key=lambda p: (-p.score, p.rank))
+    # 有相关段落时，完全不相关的段落不再放进 prompt
+    if any(p.score > 0 for p in ranked):
+        ranked = [p for p in ranked if p.score > 0]
+
+    result = SearchResult(
+        query=query,
+        answer=answer,
+        stale=bool(response.get("stale")),
+        local=bool(response.get("local")),
+    )
+    budget = token_budget - (estimate_tokens(answer) if answer else 0)
+    signatures = []
+    for passage in ranked:
+        signature = minhash(passage.text)
+        if any(similarity(signature, s) >= DUPLICATE_THRESHOLD for s in signatures):
+            result.duplicates_removed += 1
+            continue
+        if result.passages and result.tokens + passage.tokens > budget:
+            continue
+        signatures.append(signature)
+        result.passages.append(passage)
+        result.tokens += passage.tokens
+
+    result.passages_dropped = (
+        len(passages) - len(result.passages) - result.duplicates_removed
+    )
+    return result
@@ -1,81 +1,261 @@
+import asyncio
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
-from tavily import TavilyClient
+
+from src.clients import clients
+from src.singleflight import SingleFlight
+from src.tools.compaction import SearchResult, compact_results, merge_responses
+from src.tools.search_cache import get_search_cache, make_search_key, max_result_age
+from src.tools.search_index import MIN_LOCAL_RESULTS, get_search_index
+from src.tracing import bind, span
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 并发的相同搜索只发一次请求；跟随者最多等待这么多秒，之后各自请求
+SEARCH_WAIT_TIMEOUT = float(os.getenv("WALLE_SEARCH_WAIT_TIMEOUT", "30"))
+inflight_searches = SingleFlight()
+
+# 中英文、分站点组并行搜索 (WALLE_SEARCH_FANOUT=0 时退回单次搜索)
+SEARCH_FANOUT = os.getenv("WALLE_SEARCH_FANOUT", "1") == "1"
+# 并行搜索的共同截止时间 (秒)，到时只合并已经返回的结果
+SEARCH_DEADLINE = float(os.getenv("WALLE_SEARCH_DEADLINE", "20"))
+_fanout_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="walle-search")
+
 
 class TavilySearchTool:
-    # 🌟 定义核心信源白名单 (中英混合)
-    TRUSTED_DOMAINS = [
-        "doctorofcredit.com",  # 英文：最快的新闻和羊毛
-        "uscreditcardguide.com",  # 中文：美卡指南 (攻略)
-        "uscardforum.com",  # 中文：美卡论坛 (DP/讨论)
-        "thepointsguy.com",  # 英文：主流评测
-        "reddit.com",  # 英文：r/churning
-        "frequentmiler.com",  # 英文：深度分析
-    ]
-
-    def __init__(self):
-        api_key = os.getenv("TAVILY_API_KEY")
-        if not api_key:
-            raise ValueError("❌ TAVILY_API_KEY is missing in .env file")
-
-        self.client = TavilyClient(api_key=api_key)
-
-    def search(self, query: str) -> str:
-        logger.info(f"🔍 Searching with Tavily (Trusted Sources): {query}")
-
-        try:
-            # 💡 技巧：如果用户用中文提问，Tavily 在中文站点的搜索效果会更好
-            # 我们通过 include_domains 强行让它关注这些特定网站
+    # 🌟 定义核心信源白名单 (中英混合)，按站点组划分以便并行搜索
+    DOMAIN_GROUPS = {
+        "en_news": [
+            "doctorofcredit.com",  # 英文：最快的新闻和羊毛
+            "thepointsguy.com",  # 英文：主流评测
+            "frequentmiler.com",  # 英文：深度分析
+        ],
+        "en_community": [
+            "reddit.com",  # 英文：r/churning
+        ],
+        "cn": [
+            "uscreditcardguide.com",  # 中文：美卡指南 (攻略)
+            "uscardforum.com",  # 中文：美卡论坛 (DP/讨论)
+        ],
+    }
+    TRUSTED_DOMAINS = [d for group in DOMAIN_GROUPS.values() for d in group]
+
+    @property
+    def client(self):
+        # TavilyClient 由 src/clients.py 统一管理 (进程内复用，API Key 轮换后自动重建)
+        return clients.get("tavily")
+
+    # 搜索参数 (同时也是缓存键的一部分)
+    SEARCH_PARAMS = {
+        "search_depth": "advanced",
+        "max_results": 5,  # 稍微增加结果数，因为现在源变多了
+        "include_answer": True,
+    }
+
+    def _key(self, query, domains):
+        return make_search_key(query, domains, **self.SEARCH_PARAMS)
+
+    def _local(self, key, query, domains):
+        """先查完全相同查询的缓存，再查本地全文索引；都没有时返回 None"""
+        search_cache, search_index = get_search_cache(), get_search_index()
+        if search_cache is not None:
+            cached = search_cache.get(key)
+            if cached is not None:
+                logger.info(f"⚡ Search cache hit: {query}")
+                return cached
+
+        if search_index is not None:
+            results = search_index.search(
+                query, max_age=max_result_age(query), domains=domains
+            )
+            if len(results) >= MIN_LOCAL_RESULTS:
+                logger.info(f"📚 Answered from local index: {query}")
+                return {"results": results, "local": True}
+        return None
+
+    def _offline(self, query, domains, error):
+        """Tavily 不可用时的降级模式: 用本地索引里最相关的结果 (不论新旧)"""
+        search_index = get_search_index()
+        if search_index is not None:
+            results = search_index.search(query, operator="OR", domains=domains)
+            if results:
+                logger.warning(f"Tavily unavailable, using local index: {error}")
+                return {"results": results, "local": True, "stale": True}
+        raise error
+
+    def _request(self, query, domains, key):
+        logger.info(f"🔍 Searching with Tavily ({', '.join(domains)}): {query}")
+        # 💡 技巧：如果用户用中文提问，Tavily 在中文站点的搜索效果会更好
+        # 我们通过 include_domains 强行让它关注这些特定网站
+        with clients.track("tavily"), span("tavily.request"):
             response = self.client.search(
                 query=query,
-                search_depth="advanced",
-                max_results=5,  # 稍微增加结果数，因为现在源变多了
-                include_answer=True,
-                include_domains=self.TRUSTED_DOMAINS,  # 👈 关键修改：只搜这些高质量站点
+                include_domains=domains,  # 👈 关键修改：只搜这些高质量站点
+                **self.SEARCH_PARAMS,
             )
+        search_cache, search_index = get_search_cache(), get_search_index()
+        if search_cache is not None:
+            search_cache.set(key, query, response)
+        if search_index is not None:
+            search_index.add_results(response.get("results", []))
+        return response
+
+    def fetch(self, query: str, domains=None) -> dict:
+        """
+        返回搜索结果 JSON: 依次尝试查询缓存、本地全文索引，最后才请求 Tavily；
+        多个 session 同时发起的相同查询合并为一次请求
+        """
+        domains = domains or self.TRUSTED_DOMAINS
+        key = self._key(query, domains)
+        with span("search.fetch", query=query, domains=",".join(domains)) as s:
+            local = self._local(key, query, domains)
+            if local is not None:
+                s.set(source="index" if local.get("local") else "cache")
+                return local
+            s.set(source="tavily")
+            try:
+                return inflight_searches.do(
+                    key,
+                    lambda: self._request(query, domains, key),
+                    timeout=SEARCH_WAIT_TIMEOUT,
+                )
+            except Exception as e:
+                s.set(source="offline")
+                return self._offline(query, domains, e)
+
+    async def fetch_async(self, query: str, domains=None) -> dict:
+        """fetch 的 asyncio 版本，与线程中的调用共享同一张 in-flight 表"""
+        domains = domains or self.TRUSTED_DOMAINS
+        key = self._key(query, domains)
+        with span("search.fetch", query=query, domains=",".join(domains)) as s:
+            local = await asyncio.to_thread(self._local, key, query, domains)
+            if local is not None:
+                s.set(source="index" if local.get("local") else "cache")
+                return local
+            s.set(source="tavily")
+            try:
+                return await inflight_searches.do_async(
+                    key,
+                    lambda: self._request(query, domains, key),
+                    timeout=SEARCH_WAIT_TIMEOUT,
+                )
+            except Exception as e:
+                s.set(source="offline")
+                return await asyncio.to_thread(self._offline, query, domains, e)
+
+    def plan(self, query, query_zh=""):
+        """
+        并行搜索计划 [(query, domains), ...]:
+        英文查询搜英文站点组，中文查询 (没有提供时用原查询) 搜中文站点组
+        """
+        if not SEARCH_FANOUT:
+            return [(" ".join(filter(None, [query, query_zh])), self.TRUSTED_DOMAINS)]
+        return [
+            (query_zh or query if name == "cn" else query, domains)
+            for name, domains in self.DOMAIN_GROUPS.items()
+        ]
 
-            results_context = "Search Results from Trusted Community (USCreditCardGuide/DoC/Reddit):\n\n"
+    def _merge(self, query, query_zh, responses, errors):
+        if not responses:
+            raise errors[0] if errors else TimeoutError("Search deadline exceeded")
+        return compact_results(
+            " ".join(filter(None, [query, query_zh])), merge_responses(responses)
+        )
 
-            if response.get("answer"):
-                results_context += f"Direct Answer: {response['answer']}\n\n"
+    def search(self, query: str, query_zh: str = "") -> SearchResult:
+        """
+        并行执行 plan() 中的所有搜索，在共同的截止时间内合并已返回的结果，
+        再做压缩 (相关度排序、去重、按 token 预算截断)。
+        总耗时约等于最慢的一次搜索，而不是所有搜索之和。
+        """
+        with span("search", query=query, query_zh=query_zh) as s:
+            futures = [
+                _fanout_pool.submit(bind(self.fetch), q, domains)
+                for q, domains in self.plan(query, query_zh)
+            ]
+            done, not_done = wait(futures, timeout=SEARCH_DEADLINE)
+            if not_done:
+                # 超时的搜索继续在后台完成，结果会进入缓存和本地索引
+                logger.warning(f"{len(not_done)} searches missed the deadline: {query}")
 
-            for res in response.get("results", []):
-                title = res.get("title", "No Title")
-                url = res.get("url", "")
-                content = res.get("content", "")
+            responses, errors = [], []
+            for future in futures:
+                if future not in done:
+                    continue
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                else:
+                    responses.append(future.result())
+            s.set(fanout=len(futures), missed=len(not_done), failed=len(errors))
+            return self._merge(query, query_zh, responses, errors)
 
-                # 简单的标记，让 Agent 知道这是中文源还是英文源
-                source_tag = "[CN]" if "uscard" in url or "guide" in url else "[EN]"
+    async def search_async(self, query: str, query_zh: str = "") -> SearchResult:
+        with span("search", query=query, query_zh=query_zh) as s:
+            tasks = [
+                asyncio.ensure_future(self.fetch_async(q, domains))
+                for q, domains in self.plan(query, query_zh)
+            ]
+            done, not_done = await asyncio.wait(tasks, timeout=SEARCH_DEADLINE)
+            if not_done:
+                logger.warning(f"{len(not_done)} searches missed the deadline: {query}")
 
-                results_context += f"--- Source {source_tag}: [{title}]({url}) ---\n"
-                results_context += f"Content: {content}\n\n"
+            responses, errors = [], []
+            for task in tasks:
+                if task not in done:
+                    continue
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                else:
+                    responses.append(task.result())
+            s.set(fanout=len(tasks), missed=len(not_done), failed=len(errors))
+            return self._merge(query, query_zh, responses, errors)
 
-            return results_context
 
-        except Exception as e:
-            logger.error(f"Tavily search failed: {e}")
-            return f"Error searching web: {str(e)}"
+_tool = None
+_tool_lock = threading.Lock()
 
 
-# 下面的 search_credit_card_info 函数保持不变...
-def search_credit_card_info(query: str):
+def get_search_tool() -> TavilySearchTool:
+    """进程内共享一个 TavilySearchTool，不再每次调用都新建"""
+    global _tool
+    if _tool is None:
+        with _tool_lock:
+            if _tool is None:
+                _tool = TavilySearchTool()
+    return _tool
+
+
+def search_credit_card_info(query: str, query_zh: str = ""):
     """
     Use this tool to search for real-time credit card benefits, quarterly categories,
     and latest data points.
 
-    IMPORTANT: This tool searches both English sources (Doctor of Credit, Reddit)
-    and Chinese sources (USCreditCardGuide, USCardForum).
-    For best results, you can use mixed English/Chinese queries like "Amex Airline Credit 报销".
+    IMPORTANT: This tool searches English sources (Doctor of Credit, Reddit, TPG)
+    and Chinese sources (USCreditCardGuide, USCardForum) in parallel.
+    Write `query` in English and, when Chinese sources may help (DPs, 羊毛, 攻略),
+    also pass the same question in Chinese as `query_zh`.
 
     Args:
-        query: The search query string.
+        query: The search query in English.
+        query_zh: Optional Chinese version of the query for Chinese sources.
     """
-    tool = TavilySearchTool()
-    return tool.search(query)
+    try:
+        return get_search_tool().search(query, query_zh).format()
+    except Exception as e:
+        logger.error(f"Tavily search failed: {e}")
+        return f"Error searching web: {str(e)}"
+
+
+async def search_credit_card_info_async(query: str, query_zh: str = ""):
+    """search_credit_card_info 的 asyncio 版本"""
+    try:
+        return (await get_search_tool().search_async(query, query_zh)).format()
+    except Exception as e:
+        logger.error(f"Tavily search failed: {e}")
+        return f"Error searching web: {str(e)}"
@@ -0,0 +1,158 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+
+from src.cache import DiskCache
+from src.config import data_path
+
+# 搜索结果缓存 (磁盘，进程内所有 session 共享)，设置 WALLE_SEARCH_CACHE=0 关闭
+SEARCH_CACHE_ENABLED = os.getenv("WALLE_SEARCH_CACHE", "1") == "1"
+
+# 不同类型查询的有效期 (秒)
+NEWS_TTL = 6 * 3600  # 最新 offer / DP，变化快
+GENERAL_TTL = 7 * 86400  # 卡片权益等相对稳定的信息
+UPCOMING_QUARTER_TTL = 86400  # 还没开始的季度，类别可能尚未公布，每天刷新
+PAST_QUARTER_TTL = 30 * 86400  # 已经结束的季度不会再变
+MIN_TTL = 3600
+
+_QUARTERLY = re.compile(
+    r"quarter|quarterly|rotating|\bq[1-4]\b|5\s*%|季度|轮换", re.IGNORECASE
+)
+_NEWS = re.compile(
+    r"\b(?:latest|new|offers?|bonus|promo|dps?|data points?|targeted)\b|"
+    r"最新|开卡奖励|活动|羊毛|福利",
+    re.IGNORECASE,
+)
+_QUARTER_NUMBER = re.compile(r"\bq([1-4])\b|第\s*([一二三四1-4])\s*季度", re.IGNORECASE)
+_YEAR = re.compile(r"\b(20\d\d)\b|(20\d\d)\s*年")
+_CN_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4}
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+def make_search_key(query, domains, **params):
+    """缓存键 = 规范化后的查询 + 排序后的域名列表 + 其它搜索参数"""
+    payload = json.dumps(
+        {
+            "query": normalize_query(query),
+            "domains": sorted(domains or []),
+            "params": params,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def quarter_of(date):
+    return date.year, (date.month - 1) // 3 + 1
+
+
+def quarter_end(year, quarter):
+    """该季度结束的时刻 (下一季度第一天零点)"""
+    if quarter == 4:
+        return datetime.datetime(year + 1, 1, 1)
+    return datetime.datetime(year, quarter * 3 + 1, 1)
+
+
+def _target_quarter(query, today):
+    """
+    查询中提到的季度 (year, quarter)；没有明确提到时视为本季度。
+    只提到季度没写年份时，早于本季度的季度视为明年 (例如 11 月问 "Q1" 指的是明年一季度)
+    """
+    year, quarter = quarter_of(today)
+    match = _QUARTER_NUMBER.search(query)
+    if match:
+        q = match.group(1) or match.group(2)
+        target = int(q) if q.isdigit() else _CN_DIGITS[q]
+        year_match = _YEAR.search(query)
+        if year_match:
+            year = int(year_match.group(1) or year_match.group(2))
+        elif target < quarter:
+            year += 1
+        quarter = target
+    return year, quarter
+
+
+def query_ttl(query, now=None):
+    """
+    按查询类型决定缓存有效期:
+    - 季度类别: 本季度的结果一直有效到季度结束；未来季度每天刷新；过去季度长期有效
+    - 最新 offer / DP: 数小时
+    - 其它: 数天
+    """
+    now = now or datetime.datetime.now()
+    if _QUARTERLY.search(query):
+        target = _target_quarter(query, now.date())
+        current = quarter_of(now.date())
+        if target > current:
+            return UPCOMING_QUARTER_TTL
+        if target < current:
+            return PAST_QUARTER_TTL
+        return max(MIN_TTL, (quarter_end(*current) - now).total_seconds())
+    if _NEWS.search(query):
+        return NEWS_TTL
+    return GENERAL_TTL
+
+
+def max_result_age(query, now=None):
+    """
+    与 query_ttl 对应的 "多旧的结果还算新鲜" (秒)，用于判断本地索引里的结果能否直接使用:
+    本季度的类别查询只接受本季度内抓取的结果
+    """
+    now = now or datetime.datetime.now()
+    if _QUARTERLY.search(query):
+        target = _target_quarter(query, now.date())
+        current = quarter_of(now.date())
+        if target == current:
+            year, quarter = current
+            started = datetime.datetime(year, quarter * 3 - 2, 1)
+            return (now - started).total_seconds()
+    return query_ttl(query, now)
+
+
+class SearchCache:
+    """持久化的搜索结果缓存，值为搜索 API 返回的原始 JSON"""
+
+    def __init__(self, disk):
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, query, value, now=None):
+        self.disk.set(key, value, ttl=query_ttl(query, now))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """进程内共享的搜索缓存，第一次使用时才打开数据库；关闭缓存时返回 None"""
+    global _search_cache
+    if not SEARCH_CACHE_ENABLED:
+        return None
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache(DiskCache(data_path("search_cache.db")))
+    return _search_cache
@@ -0,0 +1,189 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from src.config import data_path
+from src.tools.compaction import source_tag_for
+
+# 本地全文索引 (保存所有抓取过的搜索结果)，设置 WALLE_SEARCH_INDEX=0 关闭
+SEARCH_INDEX_ENABLED = os.getenv("WALLE_SEARCH_INDEX", "1") == "1"
+# 本地至少有这么多条新鲜且匹配的结果时，才不去请求 Tavily
+MIN_LOCAL_RESULTS = int(os.getenv("WALLE_SEARCH_INDEX_MIN_RESULTS", "2"))
+
+_CJK = re.compile(r"([぀-ヿ㐀-䶿一-鿿가-힯])")
+_TERM = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+|[a-z0-9]+(?:[.'/][a-z0-9]+)*")
+
+STOPWORDS = {
+    "a",
+    "about",
+    "an",
+    "and",
+    "are",
+    "do",
+    "does",
+    "for",
+    "how",
+    "i",
+    "in",
+    "is",
+    "it",
+    "me",
+    "my",
+    "of",
+    "on",
+    "or",
+    "the",
+    "to",
+    "what",
+    "which",
+    "with",
+}
+
+
+def segment(text):
+    """FTS5 的 unicode61 分词器不切分中日韩文字，这里在每个字之间插入空格"""
+    return _CJK.sub(r" \1 ", text)
+
+
+def build_match_query(query, operator="AND"):
+    """
+    把自然语言查询转换为 FTS5 MATCH 表达式:
+    英文词逐个加引号 (避免 AND/NOT 等被当成运算符)，连续的中文作为短语
+    """
+    terms = []
+    for term in _TERM.findall(query.casefold()):
+        if term in STOPWORDS:
+            continue
+        phrase = segment(term).split() if _CJK.match(term) else [term]
+        terms.append('"' + " ".join(phrase).replace('"', "") + '"')
+    return f" {operator} ".join(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    """
+    抓取过的搜索结果的本地全文索引 (SQLite FTS5 + BM25 排序)。
+
+    docs 表保存原文 (以 url 去重，重复抓取时更新内容和抓取时间)，
+    docs_fts 表保存分好词的标题和正文，rowid 与 docs 一一对应。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        source_tag TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_docs_fetched_at ON docs (fetched_at);
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+        title, content, tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add_results(self, results, fetched_at=None):
+        """写入一批 Tavily 结果 ({"title", "url", "content"} ...)"""
+        fetched_at = fetched_at or time.time()
+        with self._write_lock, self._connect() as conn:
+            for res in results:
+                url = res.get("url")
+                if not url:
+                    continue
+                title = res.get("title") or "No Title"
+                content = res.get("content") or ""
+                source_tag = res.get("source_tag") or source_tag_for(url)
+                row = conn.execute(
+                    "SELECT id FROM docs WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None:
+                    doc_id = conn.execute(
+                        "INSERT INTO docs (url, title, content, source_tag, fetched_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (url, title, content, source_tag, fetched_at),
+                    ).lastrowid
+                else:
+                    doc_id = row[0]
+                    conn.execute(
+                        "UPDATE docs SET title = ?, content = ?, source_tag = ?, "
+                        "fetched_at = ? WHERE id = ?",
+                        (title, content, source_tag, fetched_at, doc_id),
+                    )
+                    conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+                conn.execute(
+                    "INSERT INTO docs_fts (rowid, title, content) VALUES (?, ?, ?)",
+                    (doc_id, segment(title), segment(content)),
+                )
+
+    def search(self, query, limit=5, max_age=None, operator="AND", domains=None):
+        """
+        按 BM25 返回最相关的结果 (标题权重高于正文)；
+        max_age (秒) 不为 None 时只返回这段时间内抓取的结果，
+        domains 不为 None 时只返回这些站点的结果
+        """
+        match = build_match_query(query, operator)
+        if not match:
+            return []
+        min_fetched_at = time.time() - max_age if max_age is not None else 0
+        rows = (
+            self._connect()
+            .execute(
+                """
+                SELECT d.title, d.url, d.content, d.source_tag, d.fetched_at,
+                       bm25(docs_fts, 5.0, 1.0) AS score
+                FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid
+                WHERE docs_fts MATCH ? AND d.fetched_at >= ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match, min_fetched_at, limit if domains is None else -1),
+            )
+            .fetchall()
+        )
+        keys = ("title", "url", "content", "source_tag", "fetched_at", "score")
+        results = [dict(zip(keys, row)) for row in rows]
+        if domains is not None:
+            results = [r for r in results if domain_of(r["url"], domains)][:limit]
+        return results
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+def domain_of(url, domains):
+    """url 属于 domains 中的哪个站点 (包括子域名)，不属于时返回 None"""
+    host = urlparse(url).hostname or ""
+    return next((d for d in domains if host == d or host.endswith("." + d)), None)
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """进程内共享的全文索引，第一次使用时才打开数据库；关闭索引时返回 None"""
+    global _search_index
+    if not SEARCH_INDEX_ENABLED:
+        return None
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index = SearchIndex(data_path("search_index.db"))
+    return _search_index
@@ -0,0 +1,332 @@
+"""
+轻量的延迟追踪 (span)，用来定位一轮对话慢在哪里: 读卡包、构建 prompt、Gemini 生成、工具调用、Tavily 搜索。
+
+    with span("chat.turn", user=hash_user(user_id)) as s:
+        ...
+        s.set(cache_hit=True)
+
+- 同一线程 / 协程中嵌套的 span 自动组成父子关系；提交到线程池的函数用 bind() 包一层以继承当前 span
+- 根 span 结束时，整条 trace 写入滚动的 .walle/traces.jsonl (每行一个 span)，
+  配置了 WALLE_OTLP_ENDPOINT 时同时以 OTLP/HTTP JSON 格式在后台发送
+- 默认关闭 (WALLE_TRACING=1 开启)；关闭时 span() 返回一个共享的空对象，几乎没有开销
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+
+from src.config import data_path
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("WALLE_TRACING", "0") == "1"
+# 本地 JSONL 文件超过这个大小 (MB) 时滚动，保留 TRACE_BACKUPS 个旧文件
+TRACE_MAX_BYTES = int(float(os.getenv("WALLE_TRACE_MAX_MB", "5")) * 1024 * 1024)
+TRACE_BACKUPS = 3
+# 可选: OTLP/HTTP 接收端，例如 http://localhost:4318/v1/traces
+OTLP_ENDPOINT = os.getenv("WALLE_OTLP_ENDPOINT", "")
+# 内存中保留最近多少条 trace (用于侧边栏的调试面板)
+RECENT_TRACES = 50
+
+_current = contextvars.ContextVar("walle_span", default=None)
+
+
+def hash_user(user_id):
+    """trace 中不记录原始用户 ID (邮箱)，只记录哈希"""
+    return hashlib.sha256(str(user_id or "").encode("utf-8")).hexdigest()[:12]
+
+
+class _NoopSpan:
+    """关闭追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        return self
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []  # 已结束的 span
+        self.root = None
+
+
+class Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = _current.get()
+        self.trace = self.parent.trace if self.parent is not None else Trace()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start_ns = None
+        self.end_ns = None
+        self.status = "ok"
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self):
+        if self.parent is None:
+            self.trace.root = self
+        self.start_ns = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"[:300]
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # 生成器在另一个上下文中被关闭时，token 无法 reset
+            _current.set(self.parent)
+        self.trace.spans.append(self)
+        if self.trace.root is self:
+            self.tracer.finish(self.trace)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 2),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class JSONLExporter:
+    """把 span 追加到本地 JSONL 文件，文件过大时滚动 (traces.jsonl.1, .2, ...)"""
+
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def export(self, spans):
+        lines = "".join(
+            json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n"
+            for s in spans
+        )
+        with self._lock:
+            try:
+                if (
+                    os.path.exists(self.path)
+                    and os.path.getsize(self.path) >= self.max_bytes
+                ):
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(f"Could not write traces: {e}")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans, service="walle"):
+    """OTLP/HTTP JSON (ExportTraceServiceRequest) 格式"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "walle"},
+                        "spans": [
+                            {
+                                "traceId": s.trace.trace_id,
+                                "spanId": s.span_id,
+                                "parentSpanId": (
+                                    s.parent.span_id if s.parent is not None else ""
+                                ),
+                                "name": s.name,
+                                "kind": 1,
+                                "startTimeUnixNano": str(s.start_ns),
+                                "endTimeUnixNano": str(s.end_ns),
+                                "attributes": [
+                                    {"key": k, "value": _otlp_value(v)}
+                                    for k, v in s.attributes.items()
+                                    if v is not None
+                                ],
+                                "status": (
+                                    {"code": 2, "message": s.error}
+                                    if s.status == "error"
+                                    else {"code": 1}
+                                ),
+                            }
+                            for s in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class OTLPExporter:
+    """后台线程批量发送到 OTLP/HTTP 接收端；发送失败只记录日志，不影响请求"""
+
+    def __init__(self, endpoint, timeout=5, max_queue=1000):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._loop, name="walle-otlp", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning("OTLP export queue full, dropping trace")
+
+    def _loop(self):
+        while True:
+            batch = list(self._queue.get())
+            while not self._queue.empty() and len(batch) < 512:
+                batch.extend(self._queue.get_nowait())
+            request = urllib.request.Request(
+                self.endpoint,
+                data=json.dumps(otlp_payload(batch), default=str).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                logger.warning(f"OTLP export failed: {e}")
+
+
+class Tracer:
+    def __init__(self, enabled=TRACING_ENABLED, exporters=None):
+        self.enabled = enabled
+        self.exporters = exporters if exporters is not None else []
+        self.recent = deque(maxlen=RECENT_TRACES)
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def finish(self, trace):
+        self.recent.append(trace)
+        for exporter in self.exporters:
+            exporter.export(list(trace.spans))
+
+    def last_trace(self, name=None, **attributes):
+        """最近一条根 span 名称 (和属性) 匹配的 trace"""
+        for trace in reversed(self.recent):
+            root = trace.root
+            if name is not None and root.name != name:
+                continue
+            if all(root.attributes.get(k) == v for k, v in attributes.items()):
+                return trace
+        return None
+
+
+def _default_exporters():
+    if not TRACING_ENABLED:
+        return []
+    exporters = [JSONLExporter(data_path("traces.jsonl"))]
+    if OTLP_ENDPOINT:
+        exporters.append(OTLPExporter(OTLP_ENDPOINT))
+    return exporters
+
+
+tracer = Tracer(exporters=_default_exporters())
+
+
+def span(name, **attributes):
+    """开始一个 span (用作 with 语句)；追踪关闭时返回空对象"""
+    return tracer.span(name, **attributes)
+
+
+def bind(fn):
+    """让提交到线程池的函数继承当前的 span (追踪关闭时原样返回)"""
+    if not tracer.enabled or _current.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def waterfall(trace, width=24):
+    """
+    把一条 trace 格式化成文本瀑布图 (按开始时间排序，按层级缩进):
+        chat.turn              0ms  1830ms  ████████████████████████
+          storage.load_wallet  0ms    12ms  ▏
+    """
+    if trace is None or trace.root is None:
+        return ""
+    root = trace.root
+    total = max(root.end_ns - root.start_ns, 1)
+    depth = {}
+
+    def level(s):
+        if s.span_id not in depth:
+            depth[s.span_id] = 0 if s.parent is None else level(s.parent) + 1
+        return depth[s.span_id]
+
+    spans = sorted(trace.spans, key=lambda s: (s.start_ns, level(s)))
+    labels = ["  " * level(s) + s.name for s in spans]
+    label_width = max(len(label) for label in labels)
+    lines = []
+    for s, label in zip(spans, labels):
+        start = int((s.start_ns - root.start_ns) / total * width)
+        length = max(1, round((s.end_ns - s.start_ns) / total * width))
+        bar = " " * start + "█" * length
+        mark = " ❌" if s.status == "error" else ""
+        lines.append(
+            f"{label:<{label_width}} {(s.start_ns - root.start_ns) / 1e6:6.0f}ms "
+            f"{s.duration_ms:6.0f}ms  {bar[:width]}{mark}"
+        )
+    return "\n".join(lines)
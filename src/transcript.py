@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from src.config import data_path
+
+# 每个 session 在内存中保留的最近消息条数，更早的消息只在磁盘上
+TRANSCRIPT_WINDOW = int(os.getenv("WALLE_TRANSCRIPT_WINDOW", "40"))
+# "加载更早的消息" 每次读取的条数
+TRANSCRIPT_PAGE_SIZE = int(os.getenv("WALLE_TRANSCRIPT_PAGE_SIZE", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,          -- 该用户对话中的第几条 (从 0 开始)
+    role TEXT NOT NULL,
+    content BLOB NOT NULL,         -- zlib 压缩的 UTF-8 文本
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class TranscriptStore:
+    """
+    按用户持久化的聊天记录 (SQLite，内容压缩存储)，所有 session 共享。
+    每个线程使用独立连接。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self, user_id):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE user_id = ?",
+                (user_id,),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def append(self, user_id, role, content):
+        """追加一条消息，返回它的序号"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            seq = self.count(user_id)
+            conn.execute(
+                "INSERT INTO messages (user_id, seq, role, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    seq,
+                    role,
+                    zlib.compress(content.encode("utf-8")),
+                    time.time(),
+                ),
+            )
+        return seq
+
+    def range(self, user_id, start, end):
+        """返回序号在 [start, end) 之间的消息 ([{"role", "content"}]，按时间顺序)"""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT role, content FROM messages "
+                "WHERE user_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (user_id, start, end),
+            )
+            .fetchall()
+        )
+        return [
+            {"role": role, "content": zlib.decompress(content).decode("utf-8")}
+            for role, content in rows
+        ]
+
+    def clear(self, user_id):
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+
+
+class Transcript:
+    """
+    一个 session 的聊天记录视图: 内存中只保留最近 window 条，更早的消息按需从磁盘分页读取。
+
+    用法与消息列表相同 (len / 迭代 / 下标 / 切片)，下标只针对内存中的窗口；
+    offset 是窗口中第一条消息在整段对话中的序号。
+    登录时只读取最近的窗口，之前 session 的更早消息要通过 load_earlier() 查看。
+    """
+
+    def __init__(
+        self,
+        user_id,
+        store=None,
+        window=TRANSCRIPT_WINDOW,
+        page_size=TRANSCRIPT_PAGE_SIZE,
+    ):
+        self.user_id = user_id
+        self.store = store or get_transcript_store()
+        self.window = window
+        self.page_size = page_size
+        self.total = self.store.count(user_id)
+        self.offset = max(0, self.total - window)
+        # 本 session 开始时窗口的起点: 更早的消息不再作为模型的上下文
+        self.start = self.offset
+        self.messages = self.store.range(user_id, self.offset, self.total)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def has_earlier(self):
+        return self.offset > 0
+
+    def append(self, role, content):
+        self.store.append(self.user_id, role, content)
+        self.messages.append({"role": role, "content": content})
+        self.total += 1
+        # 超出窗口的旧消息 (包括之前翻页加载的) 从内存中移除
+        overflow = len(self.messages) - self.window
+        if overflow > 0:
+            del self.messages[:overflow]
+            self.offset += overflow
+
+    def load_earlier(self):
+        """把更早的一页消息加载到窗口前面，返回加载的条数"""
+        start = max(0, self.offset - self.page_size)
+        earlier = self.store.range(self.user_id, start, self.offset)
+        self.messages[:0] = earlier
+        self.offset = start
+        return len(earlier)
+
+    def since(self, index):
+        """返回序号 >= index 的所有消息 (不在内存中的部分从磁盘读取)"""
+        if index >= self.offset:
+            return list(self.messages[index - self.offset :])
+        return self.store.range(self.user_id, index, self.offset) + self.messages
+
+    def clear(self):
+        self.store.clear(self.user_id)
+        self.messages = []
+        self.total = self.offset = self.start = 0
+
+
+_transcript_store = None
+_transcript_store_lock = threading.Lock()
+
+
+def get_transcript_store():
+    """所有 session 共享的聊天记录库，第一次使用时才打开数据库"""
+    global _transcript_store
+    if _transcript_store is None:
+        with _transcript_store_lock:
+            if _transcript_store is None:
+                _transcript_store = TranscriptStore(data_path("transcripts.db"))
+    return _transcript_store
@@ -0,0 +1,250 @@
+"""
+季节性数据预热: 在季度切换前后提前搜索 POPULAR_CARDS 的轮换类别和福利重置信息，
+让结果进入搜索缓存和本地全文索引，每季度的第一个用户也能拿到 "热" 的回答。
+
+手动运行:
+    python -m src.warmup            # 预热一次
+    python -m src.warmup --dry-run  # 只打印要预热的查询
+    python -m src.warmup --loop     # 按计划持续运行
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+# --- 路径配置 ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.config import data_path
+from src.models import POPULAR_CARDS
+from src.rewards import lookup_card
+from src.tools.search_cache import quarter_end, quarter_of
+
+logger = logging.getLogger(__name__)
+
+# App 启动时在后台预热 (默认关闭，WALLE_WARMUP=1 开启)，之后每隔 WALLE_WARMUP_INTERVAL 小时再跑一次。
+# 多个进程共享 .walle/warmup_last_run: 间隔内已经有进程跑过时直接跳过
+WARMUP_ENABLED = os.getenv("WALLE_WARMUP", "0") == "1"
+WARMUP_INTERVAL = float(os.getenv("WALLE_WARMUP_INTERVAL", "6")) * 3600
+# 启动后等待这么多秒再开始第一次预热，避免与首屏渲染抢资源
+WARMUP_START_DELAY = float(os.getenv("WALLE_WARMUP_START_DELAY", "30"))
+# 距离季度切换不到这么多天时，同时预热下一季度的类别
+NEXT_QUARTER_LEAD_DAYS = 14
+# 季度切换后稍等一会再跑，让新季度的文章先被收录
+ROLLOVER_DELAY = 600
+# 检查 / 更新 last-run 标记时的锁文件超过这么多秒视为残留 (持有锁的进程崩溃了)
+STALE_LOCK_SECONDS = 600
+
+_CN_QUARTERS = {1: "一", 2: "二", 3: "三", 4: "四"}
+
+
+def _next_quarter(year, quarter):
+    return (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+
+
+def _popular_cards():
+    return [(bank, name) for bank, names in POPULAR_CARDS.items() for name in names]
+
+
+def warmup_queries(today=None, include_benefits=True):
+    """
+    需要预热的搜索 [(query, query_zh), ...]:
+    - 有季度轮换类别的卡 (Freedom Flex / Discover it): 本季度，临近切换时加上下季度
+    - 所有常见卡片: 年度/月度福利的重置规则
+    """
+    today = today or datetime.date.today()
+    current = quarter_of(today)
+    quarters = [current]
+    days_left = (quarter_end(*current).date() - today).days
+    if days_left <= NEXT_QUARTER_LEAD_DAYS:
+        quarters.append(_next_quarter(*current))
+
+    queries = []
+    for bank, name in _popular_cards():
+        rewards = lookup_card(bank, name)
+        if rewards is None or not rewards.rotating:
+            continue
+        for year, quarter in quarters:
+            queries.append(
+                (
+                    f"{bank} {name} 5% quarterly categories Q{quarter} {year}",
+                    f"{year}年第{_CN_QUARTERS[quarter]}季度 {bank} {name} 5% 类别",
+                )
+            )
+
+    if include_benefits:
+        for bank, name in _popular_cards():
+            queries.append(
+                (
+                    f"{bank} {name} annual credits and benefits reset {today.year}",
+                    f"{bank} {name} 年度报销 权益 刷新 {today.year}",
+                )
+            )
+    return queries
+
+
+def seconds_until_next_run(now=None, interval=WARMUP_INTERVAL):
+    """下一次运行的等待时间: 固定间隔，但不会错过季度切换的时刻"""
+    now = now or datetime.datetime.now()
+    rollover = quarter_end(*quarter_of(now.date())) + datetime.timedelta(
+        seconds=ROLLOVER_DELAY
+    )
+    return max(1.0, min(interval, (rollover - now).total_seconds()))
+
+
+def min_gap_between_runs(interval=WARMUP_INTERVAL, now=None):
+    """
+    跨进程去重的最小间隔: 略小于 interval (容忍各进程定时器的误差)，
+    但季度切换之前的运行不算数，新季度的类别总会重新预热
+    """
+    now = now or datetime.datetime.now()
+    year, quarter = quarter_of(now.date())
+    started = datetime.datetime(year, quarter * 3 - 2, 1)
+    since_rollover = (now - started).total_seconds() - ROLLOVER_DELAY
+    return max(0.0, min(interval * 0.9, since_rollover))
+
+
+def claim_run(min_gap, marker=None, now=None):
+    """
+    多进程协调: 距离任何进程上一次预热不足 min_gap 秒时返回 False；
+    否则把标记更新为 now 并返回 True (检查和更新在锁文件保护下进行)
+    """
+    marker = marker or data_path("warmup_last_run")
+    now = now if now is not None else time.time()
+    lock = f"{marker}.lock"
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # 另一个进程正在检查；残留的锁清掉，下一次再试
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.remove(lock)
+        except OSError:
+            pass
+        return False
+    os.close(fd)
+    try:
+        try:
+            with open(marker) as f:
+                last = float(f.read().strip() or 0)
+        except (OSError, ValueError):
+            last = 0.0
+        if now - last < min_gap:
+            return False
+        tmp = f"{marker}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(now))
+        os.replace(tmp, marker)
+        return True
+    finally:
+        os.remove(lock)
+
+
+def run_warmup(queries=None):
+    """执行一轮预热，返回 {"queries", "failed", "seconds"}"""
+    from src.tools.search import get_search_tool
+
+    queries = queries if queries is not None else warmup_queries()
+    tool = get_search_tool()
+    started = time.perf_counter()
+    failed = 0
+    for query, query_zh in queries:
+        try:
+            tool.search(query, query_zh)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Warm-up search failed for {query!r}: {e}")
+    stats = {
+        "queries": len(queries),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    logger.info(f"🔥 Warm-up finished: {stats}")
+    return stats
+
+
+class WarmupScheduler:
+    """后台线程: 启动后 (延迟 start_delay 秒) 预热一次，之后按 seconds_until_next_run() 的计划重复"""
+
+    def __init__(self, interval=WARMUP_INTERVAL, start_delay=WARMUP_START_DELAY):
+        self.interval = interval
+        self.start_delay = start_delay
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name="walle-warmup", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        if self._stop.wait(self.start_delay):
+            return
+        while not self._stop.is_set():
+            try:
+                if claim_run(min_gap_between_runs(self.interval)):
+                    self.last_run = run_warmup()
+                else:
+                    logger.info("Warm-up already ran in another process, skipping")
+            except Exception as e:
+                logger.error(f"Warm-up job failed: {e}")
+            self._stop.wait(seconds_until_next_run(interval=self.interval))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_warmup_scheduler():
+    """进程内只启动一个预热线程；没有设置 WALLE_WARMUP=1 时不启动"""
+    global _scheduler
+    if not WARMUP_ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WarmupScheduler().start()
+    return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm seasonal card searches")
+    parser.add_argument("--dry-run", action="store_true", help="print the queries only")
+    parser.add_argument(
+        "--categories-only",
+        action="store_true",
+        help="skip the benefit-reset queries",
+    )
+    parser.add_argument(
+        "--loop", action="store_true", help="keep running on the schedule"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    queries = warmup_queries(include_benefits=not args.categories_only)
+    if args.dry_run:
+        for query, query_zh in queries:
+            print(f"{query}  |  {query_zh}")
+        return
+
+    if args.loop:
+        while True:
+            run_warmup(warmup_queries(include_benefits=not args.categories_only))
+            time.sleep(seconds_until_next_run())
+    stats = run_warmup(queries)
+    print(
+        f"✅ Warmed up {stats['queries'] - stats['failed']}/{stats['queries']} "
+        f"searches in {stats['seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import glob
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但没有权限发信号 (属于其他用户)
+        return True
+    return True
+
+
+class WriteJournal:
+    """
+    写入操作的本地持久化日志 (JSONL)。
+    每条操作在入队前先落盘，进程重启后可以重放，保证排队中的写入不丢失。
+
+    rewrite() 会整体替换文件，所以多个进程不能共用同一个日志:
+    用 for_process() 为每个进程创建 {prefix}.{pid}.jsonl，
+    已退出进程留下的日志由下一个启动的进程通过 adopt_orphans() 接管。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.prefix = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_process(cls, prefix):
+        journal = cls(f"{prefix}.{os.getpid()}.jsonl")
+        journal.prefix = prefix
+        return journal
+
+    def _orphans(self):
+        paths = glob.glob(f"{glob.escape(self.prefix)}.*.jsonl")
+        # 旧版本所有进程共用的日志文件也一并接管
+        paths.append(f"{self.prefix}.jsonl")
+        for path in paths:
+            if path == self.path or not os.path.exists(path):
+                continue
+            pid = path[len(self.prefix) + 1 : -len(".jsonl")]
+            if pid.isdigit() and _pid_alive(int(pid)):
+                continue
+            yield path
+
+    def adopt_orphans(self):
+        """把已退出进程的日志并入本进程的日志，返回其中的操作"""
+        if self.prefix is None:
+            return []
+        adopted = []
+        for path in self._orphans():
+            # 先原子地改名占有，避免两个新进程同时接管同一个日志
+            claimed = f"{path}.adopting.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            ops = WriteJournal(claimed).load()
+            for op in ops:
+                self.append(op)
+            os.remove(claimed)
+            if ops:
+                logger.info(f"Adopted {len(ops)} queued writes from {path}")
+            adopted.extend(ops)
+        return adopted
+
+    def append(self, op):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        ops = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 进程崩溃时可能留下写了一半的最后一行，直接跳过
+                    logger.warning("Skipping corrupt journal line: %r", line)
+        return ops
+
+    def rewrite(self, ops):
+        """用当前仍在排队的操作原子地替换日志 (没有排队的操作时删除日志文件)"""
+        with self._lock:
+            if not ops:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for op in ops:
+                    f.write(json.dumps(op, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+class WriteBehindQueue:
+    """
+    卡片写操作的 write-behind 队列。
+
+    - enqueue() 立即返回，不等待远端写入
+    - 对同一张卡片的连续修改会在队列中合并
+    - 后台线程按时间间隔或队列长度阈值调用 apply_batch(ops) 批量刷写
+
+    操作格式 (dict):
+        {"op": "append", "user_id": ..., "card_id": ..., "row": [...]}
+        {"op": "update", "user_id": ..., "card_id": ..., "row": [...]}
+        {"op": "delete", "user_id": ..., "card_id": ...}
+    """
+
+    def __init__(self, apply_batch, journal=None, flush_interval=2.0, max_batch=20):
+        self.apply_batch = apply_batch
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._ops = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+        # 重放上次进程退出前没有刷写完成的操作
+        if self.journal:
+            for op in self.journal.load() + self.journal.adopt_orphans():
+                self._merge(op)
+
+    def start(self):
+        """启动后台刷写线程 (幂等)"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="walle-write-behind", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {e}")
+
+    def _merge(self, op):
+        """把操作放进队列，并与队尾针对同一张卡片的操作合并"""
+        last = self._ops[-1] if self._ops else None
+        same_card = (
+            last is not None
+            and last["op"] == "update"
+            and op["op"] in ("update", "delete")
+            and last.get("card_id") == op.get("card_id")
+        )
+        if same_card:
+            # update → update: 只保留最后一次; update → delete: 只需删除
+            self._ops[-1] = op
+        else:
+            self._ops.append(op)
+
+    def enqueue(self, op):
+        with self._lock:
+            if self.journal:
+                self.journal.append(op)
+            self._merge(op)
+            pending = len(self._ops)
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def has_pending(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                return bool(self._ops)
+            return any(op["user_id"] == user_id for op in self._ops)
+
+    def flush(self):
+        """把当前队列中的操作一次性交给 apply_batch；失败时操作保留在队列中"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._ops = self._ops, []
+            if not batch:
+                return
+
+            try:
+                self.apply_batch(batch)
+            except Exception:
+                with self._lock:
+                    self._ops = batch + self._ops
+                raise
+
+            if self.journal:
+                with self._lock:
+                    self.journal.rewrite(self._ops)
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 测试产生的运行时文件 (缓存、索引、聊天记录等) 不写进仓库的 .walle/:
+# 在导入任何 src 模块之前先把数据目录指向临时目录
+os.environ["WALLE_DATA_DIR"] = tempfile.mkdtemp(prefix="walle-tests-")
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import config, transcript
+from src.tools import search_cache, search_index
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """每个测试使用独立的数据目录，按需创建的共享数据库也在测试之间重置"""
+    monkeypatch.setenv("WALLE_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(search_cache, "_search_cache", None)
+    monkeypatch.setattr(search_index, "_search_index", None)
+    monkeypatch.setattr(transcript, "_transcript_store", None)
+    return tmp_path
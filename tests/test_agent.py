@@ -0,0 +1,143 @@
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+pytest.importorskip("dotenv")  # src.tools.search 在导入时读取 .env
+types = pytest.importorskip("google.genai.types")
+
+from src import agent, ratelimit
+from src.ratelimit import RateLimiter
+from src.tool_runner import ToolRunner
+
+
+def chunk(*parts, prompt_tokens=None, output_tokens=None):
+    usage = None
+    if prompt_tokens is not None:
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens, candidates_token_count=output_tokens
+        )
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(content=types.Content(role="model", parts=list(parts)))
+        ],
+        usage_metadata=usage,
+    )
+
+
+class StubClient:
+    """按顺序返回预先准备好的每一轮流式响应，并记录每一轮请求的 contents"""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+        self.requests = []
+        self.models = SimpleNamespace(generate_content_stream=self._stream)
+
+    def _stream(self, model, contents, config):
+        self.requests.append(list(contents))
+        return iter(self.rounds.pop(0))
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter())
+
+
+def test_stream_reply_runs_a_tool_round_then_streams_text(monkeypatch):
+    searches = []
+
+    def search(query, query_zh=""):
+        searches.append((query, query_zh))
+        return "Q1 2026: grocery stores, fitness clubs"
+
+    monkeypatch.setattr(
+        agent, "tool_runner", ToolRunner({"search_credit_card_info": search})
+    )
+    call = types.FunctionCall(
+        name="search_credit_card_info",
+        args={"query": "Chase Freedom Q1 2026", "query_zh": "Chase 第一季度"},
+    )
+    client = StubClient(
+        [
+            [
+                chunk(types.Part(text="Let me check.", thought=True)),
+                chunk(
+                    types.Part(function_call=call),
+                    prompt_tokens=100,
+                    output_tokens=5,
+                ),
+            ],
+            [
+                chunk(types.Part(text="Q1 is ")),
+                chunk(
+                    types.Part(text="groceries."),
+                    prompt_tokens=160,
+                    output_tokens=7,
+                ),
+            ],
+        ]
+    )
+
+    usage = {}
+    contents = agent.build_contents([], "Freedom Flex categories?")
+    pieces = list(
+        agent.stream_reply(client, "m", contents, "system", usage=usage, session="s")
+    )
+
+    # 思考过程不输出；文本按块流式产出
+    assert pieces == ["Q1 is ", "groceries."]
+    assert searches == [("Chase Freedom Q1 2026", "Chase 第一季度")]
+    assert usage == {"prompt_token_count": 100, "candidates_token_count": 12}
+
+    # 第二轮请求带上了模型的函数调用和工具结果
+    assert len(client.requests) == 2
+    model_turn, tool_turn = client.requests[1][-2:]
+    assert model_turn.role == "model"
+    assert model_turn.parts[0].function_call.name == "search_credit_card_info"
+    response = tool_turn.parts[0].function_response
+    assert response.name == "search_credit_card_info"
+    assert response.response == {"result": "Q1 2026: grocery stores, fitness clubs"}
+    # 调用方传入的 contents 不会被修改
+    assert len(contents) == 1
+
+
+def test_stream_reply_stops_after_max_tool_rounds(monkeypatch):
+    monkeypatch.setattr(
+        agent, "tool_runner", ToolRunner({"search_credit_card_info": lambda **_: ""})
+    )
+    call = types.FunctionCall(name="search_credit_card_info", args={"query": "x"})
+    client = StubClient(
+        [[chunk(types.Part(function_call=call))]] * (agent.MAX_TOOL_ROUNDS + 1)
+    )
+    contents = agent.build_contents([], "loop forever")
+    assert list(agent.stream_reply(client, "m", contents, "system")) == []
+    assert len(client.requests) == agent.MAX_TOOL_ROUNDS + 1
+
+
+def test_stream_reply_stops_between_tool_rounds_when_cancelled(monkeypatch):
+    searches = []
+    monkeypatch.setattr(
+        agent,
+        "tool_runner",
+        ToolRunner({"search_credit_card_info": lambda **kw: searches.append(kw)}),
+    )
+    cancel = threading.Event()
+    call = types.FunctionCall(name="search_credit_card_info", args={"query": "x"})
+
+    def first_round():
+        yield chunk(types.Part(text="Checking. "))
+        cancel.set()  # 用户在这时发送了新的问题
+        yield chunk(types.Part(function_call=call))
+
+    client = StubClient([first_round(), [chunk(types.Part(text="never"))]])
+    contents = agent.build_contents([], "Freedom Flex categories?")
+    pieces = list(agent.stream_reply(client, "m", contents, "system", cancel=cancel))
+
+    assert pieces == ["Checking. "]
+    assert searches == []
+    assert len(client.requests) == 1
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+pytest.importorskip("dotenv")  # src.tools.search 在导入时读取 .env
+
+from src import api as api_module
+from src import storage, tracing
+from src.api import HTTPError, UserConcurrency, WalleAPI
+from src.backends.sqlite import SQLiteBackend
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", SQLiteBackend(str(tmp_path / "walle.db")))
+    storage.invalidate_wallet_cache()
+    return WalleAPI()
+
+
+def call(app, method, path, body=None, user="alice@example.com"):
+    """直接调用 ASGI 应用，返回 (status, body bytes)"""
+
+    async def run():
+        messages = []
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                data = b"" if body is None else json.dumps(body).encode()
+                return {"type": "http.request", "body": data, "more_body": False}
+            await asyncio.sleep(3600)  # 客户端一直保持连接
+
+        async def send(message):
+            messages.append(message)
+
+        headers = [(b"x-user-id", user.encode())] if user else []
+        scope = {"type": "http", "method": method, "path": path, "headers": headers}
+        await app(scope, receive, send)
+        return messages
+
+    messages = asyncio.run(run())
+    return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_wallet_crud(api):
+    status, body = call(
+        api,
+        "POST",
+        "/v1/wallet/cards",
+        {"bank": "Chase", "name": "Sapphire Preferred", "network": "Visa"},
+    )
+    assert status == 201
+    card_id = json.loads(body)["card_id"]
+
+    status, body = call(
+        api, "PUT", f"/v1/wallet/cards/{card_id}", {"open_date": "2025-01-15"}
+    )
+    assert status == 200
+    assert json.loads(body)["open_date"] == "2025-01-15"
+
+    status, body = call(api, "GET", "/v1/wallet")
+    cards = json.loads(body)["cards"]
+    assert [(c["name"], c["open_date"]) for c in cards] == [
+        ("Sapphire Preferred", "2025-01-15")
+    ]
+    # 其它用户看不到
+    assert json.loads(call(api, "GET", "/v1/wallet", user="bob")[1])["cards"] == []
+
+    assert call(api, "DELETE", f"/v1/wallet/cards/{card_id}")[0] == 204
+    assert call(api, "DELETE", f"/v1/wallet/cards/{card_id}")[0] == 404
+
+
+def test_request_errors(api):
+    assert call(api, "GET", "/v1/wallet", user="")[0] == 401
+    assert call(api, "POST", "/v1/wallet/cards", {"bank": "Chase"})[0] == 400
+    status, body = call(
+        api,
+        "POST",
+        "/v1/wallet/cards",
+        {"bank": "Chase", "name": "X", "last_four": "12"},
+    )
+    assert status == 400 and b"last_four" in body
+    assert call(api, "GET", "/v1/nope")[0] == 404
+    assert call(api, "DELETE", "/v1/wallet")[0] == 405
+
+
+def test_chat_streams_server_sent_events(api):
+    call(
+        api,
+        "POST",
+        "/v1/wallet/cards",
+        {"bank": "Chase", "name": "Freedom Flex", "open_date": "2025-06-01"},
+    )
+    # 5/24 问题由本地引擎回答，不需要调用模型
+    status, body = call(api, "POST", "/v1/chat", {"message": "Am I under 5/24?"})
+    assert status == 200
+
+    events = [chunk.split("\n", 1) for chunk in body.decode().strip().split("\n\n")]
+    names = [name for name, _ in events]
+    assert names[0] == "event: delta" and names[-1] == "event: done"
+    done = json.loads(events[-1][1][len("data: ") :])
+    assert "Chase Freedom Flex (2025-06-01)" in done["text"]
+    assert done["usage"]["source"] == "local"
+
+
+def test_chat_stops_when_client_disconnects_before_first_token(api, monkeypatch):
+    closed = asyncio.Event()
+
+    async def slow_reply(user_id, message, history, lang, usage):
+        try:
+            await asyncio.sleep(3600)  # 例如正在执行工具调用
+            yield "never"
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(api_module, "reply_stream", slow_reply)
+
+    async def run():
+        messages = []
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                body = json.dumps({"message": "hi"}).encode()
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/v1/chat",
+            "headers": [(b"x-user-id", b"alice")],
+        }
+        await asyncio.wait_for(api(scope, receive, send), timeout=5)
+        return messages
+
+    messages = asyncio.run(run())
+    assert messages[0]["status"] == 200
+    assert closed.is_set()
+    assert api.concurrency.active("alice") == 0
+
+
+def test_streamed_turn_with_a_tool_round_exports_one_trace(api, monkeypatch):
+    class MemoryExporter:
+        def __init__(self):
+            self.traces = []
+
+        def export(self, spans):
+            self.traces.append(spans)
+
+    exporter = MemoryExporter()
+    monkeypatch.setattr(
+        tracing, "tracer", tracing.Tracer(enabled=True, exporters=[exporter])
+    )
+    monkeypatch.setattr(api_module.clients, "get", lambda name: None)
+
+    async def model_reply(client, model, contents, system_instruction, **kwargs):
+        # 模型先输出一段文本，再发起工具调用，然后进入下一轮
+        yield "Let me look that up. "
+        with tracing.span("tools.run"):
+            await asyncio.sleep(0)
+        with tracing.span("gemini.generate", round=1):
+            yield "Done."
+
+    monkeypatch.setattr(api_module, "cached_stream_reply_async", model_reply)
+
+    status, body = call(api, "POST", "/v1/chat", {"message": "Tell me a joke"})
+    assert status == 200
+    assert b"event: done" in body
+
+    assert len(exporter.traces) == 1
+    spans = {s.name: s for s in exporter.traces[0]}
+    assert spans["tools.run"].parent is spans["chat.turn"]
+    assert spans["gemini.generate"].parent is spans["chat.turn"]
+
+
+def test_user_concurrency_limit():
+    limiter = UserConcurrency(limit=1)
+
+    async def main():
+        async with limiter.slot("alice"):
+            with pytest.raises(HTTPError) as e:
+                async with limiter.slot("alice"):
+                    pass
+            assert e.value.status == 429
+            async with limiter.slot("bob"):
+                assert limiter.active("bob") == 1
+        assert limiter.active("alice") == 0
+
+    asyncio.run(main())
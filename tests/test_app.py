@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from streamlit.testing.v1 import AppTest
+
+from src import storage
+from src.backends.sqlite import SQLiteBackend
+from src.models import CreditCard
+
+APP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "app.py"))
+USER = "alice@example.com"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "walle.db"))
+    backend.save_new_card(
+        USER, CreditCard("Chase", "Freedom Flex", "Mastercard", open_date="2025-06-01")
+    )
+    monkeypatch.setattr(storage, "_backend", backend)
+    storage.invalidate_wallet_cache()
+
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.session_state["user_id"] = USER
+    return at.run()
+
+
+def test_logged_in_page_renders_wallet_and_chat(app):
+    assert not app.exception
+    assert any("Chase Freedom Flex" in e.label for e in app.expander)
+    assert len(app.chat_input) == 1
+
+
+def test_local_answer_is_streamed_into_the_chat(app):
+    next(b for b in app.button if b.label == "🔍 Chase 5/24 Rule").click().run()
+    assert not app.exception
+
+    messages = [(m.name, m.markdown[-1].value) for m in app.chat_message]
+    assert [role for role, _ in messages] == ["user", "assistant"]
+    # 5/24 状态由本地规则引擎回答，不需要调用模型
+    assert "Chase Freedom Flex (2025-06-01)" in messages[1][1]
+    assert app.session_state["chat_job"] is None
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import storage
+from src.backends.sqlite import SQLiteBackend
+from src.cache import TTLCache
+from src.models import CreditCard
+
+
+def test_ttl_and_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变成最近使用
+    cache.set("c", 3)  # 淘汰最久未使用的 b
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.stats() == {"size": 1, "hits": 2, "misses": 2, "evictions": 2}
+
+
+def test_wallet_cache_is_read_through_and_invalidated(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "walle.db"))
+    monkeypatch.setattr(storage, "_backend", backend)
+    storage.invalidate_wallet_cache()
+
+    loads = []
+    original_load = backend.load_user_data
+    monkeypatch.setattr(
+        backend, "load_user_data", lambda uid: loads.append(uid) or original_load(uid)
+    )
+
+    storage.save_new_card("u1", CreditCard("Chase", "Freedom Flex", "Mastercard"))
+    first = storage.load_user_data("u1")
+    first.cards.clear()  # 调用方修改返回值不会影响缓存
+    second = storage.load_user_data("u1")
+    assert len(loads) == 1
+    assert [c.name for c in second.cards] == ["Freedom Flex"]
+
+    storage.save_new_card("u1", CreditCard("Amex", "Gold", "Amex"))
+    assert len(storage.load_user_data("u1").cards) == 2
+    assert len(loads) == 2
+
+
+def test_response_cache_key_and_disk_tier(tmp_path):
+    from types import SimpleNamespace
+
+    from src.cache import DiskCache
+    from src.response_cache import ResponseCache, make_key
+
+    def content(role, text):
+        return SimpleNamespace(role=role, parts=[SimpleNamespace(text=text)])
+
+    key = make_key(
+        "gemini-flash-latest", "sys", [content("user", "Which  card for Dining?")]
+    )
+    # 空白和大小写差异不影响缓存键
+    assert key == make_key(
+        "gemini-flash-latest", "sys", [content("user", " which card for dining? ")]
+    )
+    assert key != make_key("gemini-flash-latest", "sys2", [content("user", "x")])
+
+    disk = DiskCache(str(tmp_path / "responses.db"))
+    ResponseCache(disk=disk).set(key, "Use Amex Gold.")
+
+    # 新进程 (新的内存层) 仍能从磁盘层命中
+    fresh = ResponseCache(disk=disk)
+    assert fresh.get(key) == "Use Amex Gold."
+    assert fresh.get("missing") is None
+    assert fresh.stats() == {"hits": 1, "disk_hits": 1, "misses": 1, "memory_size": 1}
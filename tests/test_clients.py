@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.clients import ClientRegistry, is_fatal
+
+
+class FakeClient:
+    def __init__(self, key):
+        self.key = key
+
+
+class HttpError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message or f"HTTP {code}")
+        self.code = code
+
+
+def make_registry(credential):
+    registry = ClientRegistry()
+    registry.register("fake", FakeClient, lambda: credential["key"])
+    return registry
+
+
+def test_client_is_reused_across_threads():
+    registry = make_registry({"key": "k1"})
+    seen = []
+    threads = [
+        threading.Thread(target=lambda: seen.append(registry.get("fake")))
+        for _ in range(10)
+    ]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert len({id(c) for c in seen}) == 1
+    stats = registry.stats()["fake"]
+    assert stats["builds"] == 1
+    assert stats["uses"] == 10
+    assert stats["connected"]
+
+
+def test_credential_rotation_rebuilds_client():
+    credential = {"key": "k1"}
+    registry = make_registry(credential)
+    first = registry.get("fake")
+
+    credential["key"] = "k2"
+    second = registry.get("fake")
+    assert second is not first
+    assert second.key == "k2"
+    assert registry.stats()["fake"]["builds"] == 2
+
+
+def test_only_fatal_errors_trigger_rebuild():
+    registry = make_registry({"key": "k1"})
+    first = registry.get("fake")
+
+    registry.report_error("fake", HttpError(429, "RESOURCE_EXHAUSTED"))
+    assert registry.get("fake") is first
+
+    with pytest.raises(HttpError):
+        with registry.track("fake"):
+            raise HttpError(401)
+    assert registry.stats()["fake"]["connected"] is False
+    assert registry.get("fake") is not first
+    assert registry.stats()["fake"]["errors"] == 2
+
+
+def test_is_fatal():
+    assert is_fatal(HttpError(403))
+    assert is_fatal(ValueError("400 API key not valid. Please pass a valid API key."))
+    assert not is_fatal(HttpError(503, "UNAVAILABLE"))
@@ -0,0 +1,109 @@
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.tools import compaction
+
+ARTICLE = (
+    "Chase has announced the Freedom Flex 5% categories for Q1 2026. "
+    "Cardholders earn 5% at grocery stores and fitness clubs after activation. "
+    "The quarterly cap is $1,500 in combined purchases."
+)
+
+RESPONSE = {
+    "answer": "Grocery stores and fitness clubs.",
+    "results": [
+        {
+            "title": "Chase Freedom Q1 2026 categories",
+            "url": "https://www.doctorofcredit.com/freedom-q1",
+            "content": ARTICLE,
+        },
+        {
+            "title": "Re: Chase Freedom Q1 2026 categories",
+            "url": "https://www.reddit.com/r/churning/mirror",
+            "content": ARTICLE.replace("Chase has", "So Chase has"),
+        },
+        {
+            "title": "Best hotel cards",
+            "url": "https://thepointsguy.com/hotels",
+            "content": "Hotel cards give free night certificates every year.",
+        },
+    ],
+}
+
+
+def test_near_duplicates_are_removed_and_sources_kept():
+    result = compaction.compact_results("Chase Freedom Q1 2026 categories", RESPONSE)
+    urls = {p.url for p in result.passages}
+    assert urls == {"https://www.doctorofcredit.com/freedom-q1"}
+    assert result.duplicates_removed == 1
+    # 不相关的结果不会进入 prompt
+    assert result.passages_dropped == 1
+
+    text = str(result)
+    assert "Direct Answer: Grocery stores" in text
+    assert "--- Source [EN]: [Chase Freedom Q1 2026 categories]" in text
+    assert "hotel" not in text.lower()
+
+
+def test_token_budget_keeps_best_passages():
+    content = " ".join(
+        f"Sentence {i} talks about something unrelated to the question." * 3
+        for i in range(20)
+    )
+    content += " The Amex Gold dining multiplier is 4x at restaurants worldwide."
+    response = {"results": [{"title": "t", "url": "https://a.com", "content": content}]}
+
+    result = compaction.compact_results("amex gold dining", response, token_budget=50)
+    assert result.tokens <= 50
+    assert "4x at restaurants" in result.passages[0].text
+
+
+def test_minhash_estimates_similarity():
+    a = compaction.minhash(ARTICLE)
+    b = compaction.minhash(ARTICLE + " Thanks!")
+    c = compaction.minhash("Completely different text about airline lounges.")
+    assert compaction.similarity(a, b) > 0.8
+    assert compaction.similarity(a, c) < 0.2
+
+
+def test_chinese_passages_are_scored():
+    response = {
+        "results": [
+            {
+                "title": "美卡指南",
+                "url": "https://www.uscreditcardguide.com/a",
+                "content": "第一季度的 5% 类别是超市。酒店卡每年送免费房晚。",
+            }
+        ]
+    }
+    result = compaction.compact_results("第一季度 类别", response)
+    assert result.passages[0].source_tag == "[CN]"
+    assert result.to_dict()["sources"][0]["score"] > 0
+
+
+def test_merge_interleaves_groups_and_dedupes_urls():
+    en = {
+        "answer": "5% on groceries",
+        "results": [
+            {"url": "https://doctorofcredit.com/a", "content": "x"},
+            {"url": "https://thepointsguy.com/b", "content": "y"},
+        ],
+    }
+    cn = {
+        "answer": "超市 5%",
+        "results": [
+            {"url": "https://www.uscardforum.com/c", "content": "z"},
+            {"url": "https://doctorofcredit.com/a", "content": "x"},
+        ],
+    }
+    merged = compaction.merge_responses([en, cn])
+    assert [r["url"] for r in merged["results"]] == [
+        "https://doctorofcredit.com/a",
+        "https://www.uscardforum.com/c",
+        "https://thepointsguy.com/b",
+    ]
+    assert merged["answer"] == "5% on groceries\n超市 5%"
+    assert not merged["stale"]
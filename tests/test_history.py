@@ -0,0 +1,48 @@
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.history import SUMMARY_PREFIX, ConversationHistory, estimate_tokens
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("吃饭刷哪张") == 5
+
+
+def test_old_turns_fold_into_incremental_summary():
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append(len(messages))
+        return (summary + " " if summary else "") + "|".join(
+            m["content"][:3] for m in messages
+        )
+
+    history = ConversationHistory(token_budget=60, summarizer=summarizer)
+    messages = []
+    for i in range(6):
+        messages.append({"role": "user", "content": f"q{i} " + "x" * 80})
+        messages.append({"role": "assistant", "content": f"a{i} " + "y" * 80})
+
+        prompt_history = history.compact(messages)
+        history.record_turn(prompt_history, "next question")
+
+    # 最近的消息原文保留，更早的进入摘要
+    assert prompt_history[0]["content"].startswith(SUMMARY_PREFIX)
+    assert prompt_history[-1] == messages[-1]
+    assert history.folded == len(messages) - (len(prompt_history) - 1)
+
+    # 增量更新: 每条消息只被 summarizer 处理一次
+    assert sum(calls) == history.folded
+    assert history.turn_stats[-1]["summarized_messages"] == history.folded
+
+
+def test_short_history_is_untouched():
+    history = ConversationHistory(token_budget=1000)
+    messages = [{"role": "user", "content": "hi"}]
+    assert history.compact(messages) == messages
+    assert history.summary == ""
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.jobs import CANCELLED, DONE, FAILED, JobRunner
+from src.ratelimit import RateLimiter, call_with_retry
+
+
+def test_identical_jobs_in_a_session_are_deduped():
+    runner = JobRunner(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def work(job):
+        calls.append(job.session)
+        release.wait(2)
+        return "ok"
+
+    first = runner.submit("alice", "benefits", work)
+    second = runner.submit("alice", "benefits", work)
+    other = runner.submit("bob", "benefits", work)
+    assert second is first
+    assert other is not first
+
+    release.set()
+    assert first.wait(2) and other.wait(2)
+    assert first.status == DONE and first.result == "ok"
+    assert sorted(calls) == ["alice", "bob"]
+    assert runner.stats()["deduped"] == 1
+
+    # 完成之后再提交会重新执行
+    assert runner.submit("alice", "benefits", work) is not first
+
+
+def test_follow_streams_chunks_as_they_are_produced():
+    runner = JobRunner(max_workers=1)
+    step = threading.Event()
+
+    def work(job):
+        yield "Hello"
+        step.wait(2)
+        yield ", world"
+
+    job = runner.submit("alice", "chat", work)
+    stream = job.follow()
+    assert next(stream) == "Hello"
+    assert not job.done
+    step.set()
+    assert list(stream) == [", world"]
+    assert job.status == DONE
+    assert job.result == "Hello, world"
+
+
+def test_cancel_stops_a_running_stream_and_a_queued_job():
+    runner = JobRunner(max_workers=1)
+    closed = threading.Event()
+
+    def work(job):
+        try:
+            while True:
+                yield "."
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    running = runner.submit("alice", "chat", work)
+    queued = runner.submit("alice", "benefits", lambda job: "never")
+    time.sleep(0.05)
+
+    runner.cancel(queued)
+    assert queued.status == CANCELLED
+
+    runner.cancel(running)
+    assert running.wait(2)
+    assert running.status == CANCELLED
+    assert closed.is_set()
+    assert runner.stats()["cancelled"] == 2
+
+
+def test_cancel_stops_a_non_streaming_job_waiting_for_quota(monkeypatch):
+    runner = JobRunner(max_workers=1)
+    limiter = RateLimiter()
+    limiter.pause("gemini-flash-latest", 60)
+    monkeypatch.setattr("src.ratelimit.limiter", limiter)
+    calls = []
+
+    def work(job):
+        return call_with_retry(
+            lambda: calls.append(1), "gemini-flash-latest", cancel=job.cancel_event
+        )
+
+    job = runner.submit("alice", "benefits", work)
+    time.sleep(0.05)
+    runner.cancel(job)
+    assert job.wait(2)
+    assert job.status == CANCELLED
+    assert job.error is None
+    assert calls == []
+
+
+def test_failed_job_records_the_error():
+    runner = JobRunner(max_workers=1)
+
+    def work(job):
+        raise RuntimeError("quota exhausted")
+
+    job = runner.submit("alice", "benefits", work)
+    assert job.wait(2)
+    assert job.status == FAILED
+    assert job.error == "quota exhausted"
+    assert runner.active("alice") == []
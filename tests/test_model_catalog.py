@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.model_catalog import (
+    DEFAULT_MODELS,
+    ModelCatalog,
+    _fingerprint,
+    classify_models,
+)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_classify_models_orders_fast_smart_experimental():
+    models = classify_models(
+        ["gemini-2.0-flash-exp", "gemini-1.5-pro", "gemini-3-flash-preview"]
+    )
+    assert list(models.values()) == [
+        "gemini-3-flash-preview",
+        "gemini-1.5-pro",
+        "gemini-2.0-flash-exp",
+    ]
+    assert classify_models(["text-embedding-004"]) == DEFAULT_MODELS
+
+
+def test_fresh_snapshot_is_served_without_fetching(tmp_path):
+    path = tmp_path / "models.json"
+    path.write_text(
+        json.dumps(
+            {
+                "fetched_at": time.time(),
+                "fingerprint": _fingerprint("key"),
+                "models": {"🚀 Fast (Gemini 3 Flash)": "gemini-3-flash-preview"},
+            }
+        )
+    )
+
+    def fetch():
+        raise AssertionError("should not hit the network")
+
+    catalog = ModelCatalog(str(path), fetch)
+    assert catalog.get("key") == {"🚀 Fast (Gemini 3 Flash)": "gemini-3-flash-preview"}
+    assert not catalog._refreshing
+
+
+def test_missing_snapshot_returns_defaults_and_refreshes_in_background(tmp_path):
+    path = tmp_path / "models.json"
+    release = threading.Event()
+
+    def fetch():
+        release.wait(2)
+        return ["gemini-2.0-flash"]
+
+    catalog = ModelCatalog(str(path), fetch)
+    # 首次调用不等网络，直接返回兜底模型
+    assert catalog.get("key") == DEFAULT_MODELS
+    release.set()
+
+    assert wait_for(lambda: path.exists() and not catalog._refreshing)
+    assert catalog.get("key") == {"🚀 Fast (Gemini 2.0 Flash)": "gemini-2.0-flash"}
+    assert json.loads(path.read_text())["fingerprint"] == _fingerprint("key")
+
+
+def test_failed_refresh_keeps_stale_snapshot(tmp_path):
+    path = tmp_path / "models.json"
+    stale = {"⚖️ Balanced (Gemini 1.5 Pro)": "gemini-1.5-pro"}
+    path.write_text(
+        json.dumps(
+            {"fetched_at": 0, "fingerprint": _fingerprint("key"), "models": stale}
+        )
+    )
+
+    def fetch():
+        raise RuntimeError("offline")
+
+    catalog = ModelCatalog(str(path), fetch)
+    assert catalog.get("key") == stale
+    assert wait_for(lambda: not catalog._refreshing)
+    assert catalog.get("key") == stale
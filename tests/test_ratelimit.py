@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import ratelimit
+from src.ratelimit import (
+    RateLimiter,
+    RequestCancelled,
+    TokenBucket,
+    call_with_retry,
+    retry_after,
+)
+
+
+class FakeQuotaError(Exception):
+    code = 429
+
+    def __init__(self, delay):
+        super().__init__("429 RESOURCE_EXHAUSTED")
+        self.details = {
+            "error": {
+                "details": [
+                    {
+                        "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                        "retryDelay": f"{delay}s",
+                    }
+                ]
+            }
+        }
+
+
+def _drained_limiter(model, per_minute=600):
+    limiter = RateLimiter()
+    state = limiter._state(model)
+    state.requests = TokenBucket(per_minute)  # 每秒补充 per_minute / 60 个
+    state.requests.level = 0
+    return limiter
+
+
+def test_waiters_are_served_round_robin_across_sessions():
+    limiter = _drained_limiter("m")
+    order = []
+
+    def worker(session, tag):
+        limiter.acquire("m", session=session)
+        order.append(tag)
+
+    threads = []
+    for session, tag in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        thread = threading.Thread(target=worker, args=(session, tag))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)  # 保证入队顺序
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_pause_delays_all_callers_and_acquire_times_out():
+    limiter = RateLimiter()
+    limiter.pause("m", 0.2)
+    assert limiter.acquire("m", timeout=0.05) is False
+
+    started = time.monotonic()
+    assert limiter.acquire("m", timeout=2)
+    assert time.monotonic() - started >= 0.1
+
+
+def test_cancel_stops_waiting_for_quota(monkeypatch):
+    limiter = RateLimiter()
+    limiter.pause("m", 60)
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+
+    started = time.monotonic()
+    assert limiter.acquire("m", cancel=cancel) is False
+    assert time.monotonic() - started < 1
+    assert limiter.stats()["m"]["waiting"] == 0
+
+    # 已取消的任务不再发出请求
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter())
+    with pytest.raises(RequestCancelled):
+        call_with_retry(lambda: "called", "gemini-flash-latest", cancel=cancel)
+
+
+def test_async_acquire():
+    limiter = _drained_limiter("m", per_minute=1200)
+
+    async def main():
+        await asyncio.gather(*(limiter.acquire_async("m") for _ in range(3)))
+
+    started = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - started >= 0.1
+
+
+def test_call_with_retry_honors_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter())
+    monkeypatch.setattr(ratelimit, "BACKOFF_BASE", 0.001)
+    assert retry_after(FakeQuotaError(0.1)) == 0.1
+
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 2:
+            raise FakeQuotaError(0.1)
+        return "ok"
+
+    assert call_with_retry(flaky, "gemini-flash-latest") == "ok"
+    assert attempts[1] - attempts[0] >= 0.09
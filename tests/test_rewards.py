@@ -0,0 +1,110 @@
+import datetime
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import rewards
+from src.models import CreditCard, UserProfile
+
+TODAY = datetime.date(2026, 1, 15)
+
+
+def make_wallet(*cards):
+    user = UserProfile(user_id="u1")
+    for bank, name in cards:
+        user.add_card(CreditCard(bank=bank, name=name, network="Visa"))
+    return user
+
+
+def test_best_card_for_dining_and_groceries():
+    user = make_wallet(
+        ("Chase", "Sapphire Preferred"),
+        ("Amex", "Gold"),
+        ("Amex", "Blue Cash Preferred"),
+    )
+    assert rewards.best_cards(user, "dining", today=TODAY)[0].card == "Amex Gold"
+
+    user.cards.pop(1)  # 去掉 Gold 后，超市消费由 BCP 的 6% 胜出
+    groceries = rewards.best_cards(user, "groceries", today=TODAY)
+    assert groceries[0].card == "Amex Blue Cash Preferred"
+    assert groceries[0].cap_note == "up to $6,000/year"
+
+
+def test_freedom_points_pool_with_sapphire():
+    alone = make_wallet(("Chase", "Freedom Unlimited"))
+    pooled = make_wallet(("Chase", "Freedom Unlimited"), ("Chase", "Sapphire Reserve"))
+
+    alone_score = rewards.best_cards(alone, "other", today=TODAY)[0]
+    pooled_score = [
+        s
+        for s in rewards.best_cards(pooled, "other", today=TODAY)
+        if s.card == "Chase Freedom Unlimited"
+    ][0]
+    assert alone_score.cents_per_dollar == 1.5
+    assert pooled_score.cents_per_dollar == 2.25
+
+
+def test_rotating_categories_block_direct_answer_until_known():
+    user = make_wallet(("Chase", "Freedom Flex"), ("Citi", "Double Cash"))
+    question = "Which card should I use for groceries?"
+
+    # 本季度轮换类别未知，Freedom Flex 可能有 5%，交给模型
+    assert rewards.answer_best_card(user, question, today=TODAY) is None
+
+    rewards.set_rotating_categories("chase_freedom", 2026, 1, ["groceries"])
+    try:
+        answer = rewards.answer_best_card(user, question, today=TODAY)
+        assert "Chase Freedom Flex" in answer
+        assert "up to $1,500/quarter" in answer
+    finally:
+        rewards.ROTATING_CATEGORIES.clear()
+        rewards.rank_wallet.cache_clear()
+
+
+def test_only_best_card_questions_are_answered_locally():
+    user = make_wallet(("Amex", "Gold"))
+    assert rewards.detect_category("我今晚要出去吃饭，刷哪张卡返现最高？") == "dining"
+    assert rewards.answer_best_card(user, "我今晚要出去吃饭，刷哪张卡？", "zh")
+    assert rewards.answer_best_card(user, "Tell me about dining trends") is None
+    # 倍率表中没有的卡片会让结果不确定
+    user.add_card(CreditCard(bank="Other", name="Mystery", network="Visa"))
+    assert rewards.answer_best_card(user, "Which card for dinner?") is None
+
+
+def test_keywords_match_whole_words():
+    assert (
+        rewards.detect_category("Which card for my Las Vegas trip hotel?") == "hotels"
+    )
+    assert rewards.detect_category("Which card for gas?") == "gas"
+    assert rewards.detect_category("Best card for flights to Tokyo") == "flights"
+    assert rewards.detect_category("Tell me about Vegas") is None
+
+
+def test_lookup_card_does_not_guess_other_products():
+    assert (
+        rewards.lookup_card("Chase", "Freedom Flex (old)")
+        is rewards.CARD_REWARDS[("chase", "freedom flex")]
+    )
+    # 最长的表名优先
+    assert (
+        rewards.lookup_card("Amex", "Delta SkyMiles Gold Card")
+        is rewards.CARD_REWARDS[("amex", "delta skymiles gold")]
+    )
+    # 联名卡 / 商务卡不是同名的个人卡，倍率表里没有时交给模型
+    assert rewards.lookup_card("Amex", "Platinum Delta SkyMiles") is None
+    assert rewards.lookup_card("Amex", "Business Gold") is None
+    assert rewards.lookup_card("Amex", "Goldfinch") is None
+
+    user = make_wallet(("Amex", "Business Gold"))
+    assert rewards.answer_best_card(user, "Which card for dinner?") is None
+
+
+def test_ranking_is_memoized_per_wallet():
+    user = make_wallet(*[(b, n) for (b, n) in rewards.CARD_REWARDS][:12])
+    rewards.rank_wallet.cache_clear()
+    rewards.grounding_context(user, "dining", today=TODAY)
+    rewards.answer_best_card(user, "Which card for groceries?", today=TODAY)
+    info = rewards.rank_wallet.cache_info()
+    assert info.misses == 1 and info.hits == 1
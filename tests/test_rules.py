@@ -0,0 +1,99 @@
+import datetime
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import rules
+from src.models import CreditCard, UserProfile
+
+TODAY = datetime.date(2026, 1, 2)
+
+
+def make_wallet(*cards):
+    user = UserProfile(user_id="u1")
+    for bank, name, open_date in cards:
+        user.add_card(
+            CreditCard(bank=bank, name=name, network="Visa", open_date=open_date)
+        )
+    return user
+
+
+def test_old_and_business_cards_do_not_count():
+    user = make_wallet(
+        ("Chase", "Sapphire Preferred", "2023-07-01"),  # 30 个月前
+        ("Chase", "Ink Business Preferred", "2025-06-01"),
+        ("Amex", "Gold", "2025-10-01"),
+        ("Citi", "Double Cash", None),
+    )
+    status = rules.chase_524_status(user, today=TODAY)
+    assert status.count == 1
+    assert status.under_524
+    assert status.business_cards == ("Chase Ink Business Preferred",)
+    assert status.missing_dates == ("Citi Double Cash",)
+    assert dict(status.velocity) == {6: 1, 12: 1, 24: 1}
+    assert status.next_drop_off == datetime.date(2027, 10, 1)
+
+
+def test_eligible_date_when_over_524():
+    user = make_wallet(
+        ("Amex", "Gold", "2024-02-10"),
+        ("Citi", "Premier", "2024-05-01"),
+        ("Capital One", "Venture X", "2024-08-31"),
+        ("Chase", "Freedom Flex", "2025-03-01"),
+        ("Amex", "Platinum", "2025-09-15"),
+        ("Bilt", "Bilt Mastercard", "2025-12-01"),
+    )
+    status = rules.chase_524_status(user, today=TODAY)
+    assert status.count == 6
+    assert not status.under_524
+    # 需要掉出两张卡才能回到 4/24
+    assert status.eligible_on == datetime.date(2026, 5, 1)
+    assert dict(status.velocity) == {6: 2, 12: 3, 24: 6}
+    assert "Back under 5/24 on: 2026-05-01" in rules.prompt_facts(status)
+
+
+def test_status_is_memoized_per_wallet():
+    user = make_wallet(("Amex", "Gold", "2025-10-01"))
+    first = rules.chase_524_status(user, today=TODAY)
+    assert rules.chase_524_status(user, today=TODAY) is first
+
+    user.add_card(CreditCard(bank="Citi", name="Premier", network="Visa"))
+    assert rules.chase_524_status(user, today=TODAY) is not first
+
+
+def test_add_months_clamps_to_month_end():
+    assert rules.add_months(datetime.date(2024, 2, 29), 24) == datetime.date(
+        2026, 2, 28
+    )
+    assert rules.add_months(datetime.date(2026, 1, 31), -2) == datetime.date(
+        2025, 11, 30
+    )
+
+
+def test_524_question_answered_locally():
+    user = make_wallet(("Amex", "Gold", "2025-10-01"))
+    status = rules.chase_524_status(user, today=TODAY)
+    assert rules.is_524_question("Am I under 5/24?")
+    assert rules.is_524_question(
+        "Explain the Chase 5/24 rule and check if I am affected based on my cards."
+    )
+    assert rules.is_524_question("What is my 5/24 status?")
+    assert rules.is_524_question(
+        "解释一下 Chase 5 / 24 规则，并根据我的持卡情况看看我受限制了吗。"
+    )
+    assert rules.is_524_question("我现在在 5/24 以下吗？")
+    assert not rules.is_524_question("Which card for dining?")
+    assert "under 5/24" in rules.answer_524(status)
+    assert "5/24 以下" in rules.answer_524(status, "zh")
+
+
+def test_524_strategy_questions_go_to_the_model():
+    assert not rules.is_524_question("Explain the Chase 5/24 rule")
+    assert not rules.is_524_question(
+        "Should I apply for the Sapphire Preferred now or wait until "
+        "I drop below 5/24 next year?"
+    )
+    assert not rules.is_524_question("Does the Ink Business card count toward 5/24?")
+    assert not rules.is_524_question("5/24 之后应该先申请哪张卡？")
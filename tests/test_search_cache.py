@@ -0,0 +1,63 @@
+import datetime
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.cache import DiskCache
+from src.tools import search_cache as sc
+
+NOW = datetime.datetime(2026, 2, 15, 12, 0)  # 2026 Q1
+
+
+def test_key_ignores_case_whitespace_and_domain_order():
+    a = sc.make_search_key("Chase  Freedom Q1", ["b.com", "a.com"], max_results=5)
+    b = sc.make_search_key("chase freedom q1 ", ["a.com", "b.com"], max_results=5)
+    c = sc.make_search_key("chase freedom q1", ["a.com"], max_results=5)
+    assert a == b
+    assert a != c
+
+
+def test_quarterly_results_expire_at_quarter_end():
+    ttl = sc.query_ttl("Chase Freedom quarterly categories", NOW)
+    assert NOW + datetime.timedelta(seconds=ttl) == datetime.datetime(2026, 4, 1)
+    assert sc.query_ttl("2026年第一季度 Chase Freedom 的 5% 类别", NOW) == ttl
+
+    # 下个季度的类别可能还没公布，过去的季度不会再变
+    assert sc.query_ttl("Discover Q2 2026 categories", NOW) == sc.UPCOMING_QUARTER_TTL
+    assert sc.query_ttl("Discover Q4 2025 categories", NOW) == sc.PAST_QUARTER_TTL
+
+
+def test_quarter_without_a_year_is_the_upcoming_one():
+    november = datetime.datetime(2026, 11, 20, 12, 0)  # 2026 Q4
+    # 11 月问 "Q1" 指的是 2027 年一季度，不能当成已经结束的 2026 年一季度
+    assert sc.query_ttl("Freedom Flex Q1 categories", november) == (
+        sc.UPCOMING_QUARTER_TTL
+    )
+    assert sc.max_result_age("Freedom Flex Q1 categories", november) == (
+        sc.query_ttl("Freedom Flex Q1 2027 categories", november)
+    )
+    assert sc.query_ttl("第一季度 Freedom Flex 5% 类别", november) == (
+        sc.UPCOMING_QUARTER_TTL
+    )
+    # 明确写了年份时按年份算
+    assert sc.query_ttl("Freedom Flex Q1 2026 categories", november) == (
+        sc.PAST_QUARTER_TTL
+    )
+
+
+def test_news_and_general_ttl():
+    assert sc.query_ttl("Amex Platinum latest offer", NOW) == sc.NEWS_TTL
+    assert sc.query_ttl("美卡论坛 开卡奖励", NOW) == sc.NEWS_TTL
+    assert sc.query_ttl("Amex Gold renewal airline credit", NOW) == sc.GENERAL_TTL
+
+
+def test_search_cache_roundtrip(tmp_path):
+    cache = sc.SearchCache(DiskCache(str(tmp_path / "search.db")))
+    key = sc.make_search_key("amex gold", ["a.com"])
+    assert cache.get(key) is None
+
+    cache.set(key, "amex gold", {"answer": "4x dining", "results": []})
+    assert cache.get(key) == {"answer": "4x dining", "results": []}
+    assert cache.stats() == {"hits": 1, "misses": 1}
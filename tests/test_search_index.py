@@ -0,0 +1,81 @@
+import datetime
+import os
+import sys
+import time
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.tools import search_cache
+from src.tools.search_index import SearchIndex, build_match_query
+
+RESULTS = [
+    {
+        "title": "Chase Freedom Flex Q1 2026 categories: grocery stores",
+        "url": "https://www.doctorofcredit.com/chase-freedom-q1-2026",
+        "content": "Chase announced 5% categories for Q1 2026: grocery stores and fitness.",
+    },
+    {
+        "title": "Amex Gold dining credit",
+        "url": "https://thepointsguy.com/amex-gold",
+        "content": "The Amex Gold card earns 4x at restaurants.",
+    },
+    {
+        "title": "Chase Freedom 第一季度 5% 类别",
+        "url": "https://www.uscreditcardguide.com/chase-freedom-q1",
+        "content": "2026年第一季度 Chase Freedom 的 5% 类别是超市。",
+    },
+]
+
+
+def make_index(tmp_path):
+    index = SearchIndex(str(tmp_path / "index.db"))
+    index.add_results(RESULTS)
+    return index
+
+
+def test_bm25_ranks_matching_documents(tmp_path):
+    index = make_index(tmp_path)
+    hits = index.search("What are the Chase Freedom Q1 2026 categories?")
+    assert [h["url"] for h in hits][:1] == [RESULTS[0]["url"]]
+    assert all("amex" not in h["url"] for h in hits)
+    assert hits[0]["source_tag"] == "[EN]"
+
+
+def test_chinese_queries_match_phrases(tmp_path):
+    index = make_index(tmp_path)
+    hits = index.search("Chase Freedom 第一季度 类别")
+    assert [h["url"] for h in hits] == [RESULTS[2]["url"]]
+    assert hits[0]["source_tag"] == "[CN]"
+
+
+def test_refetch_replaces_document_and_age_filter(tmp_path):
+    index = make_index(tmp_path)
+    old = time.time() - 10 * 86400
+    index.add_results([dict(RESULTS[1], content="Gold earns 4x on dining")], old)
+    assert len(index) == 3
+
+    assert index.search("amex gold dining", max_age=86400) == []
+    assert len(index.search("amex gold dining")) == 1
+    # 旧内容已经从全文索引里删除
+    assert index.search("amex gold restaurants") == []
+
+
+def test_match_query_quotes_terms():
+    assert build_match_query("NOT the card") == '"not" AND "card"'
+    assert build_match_query("the a of") == ""
+
+
+def test_current_quarter_results_must_be_fetched_this_quarter():
+    now = datetime.datetime(2026, 2, 15)
+    age = search_cache.max_result_age("Chase Freedom Q1 2026 categories", now)
+    assert now - datetime.timedelta(seconds=age) == datetime.datetime(2026, 1, 1)
+    assert (
+        search_cache.max_result_age("Amex Gold review", now) == search_cache.GENERAL_TTL
+    )
+
+
+def test_domain_filter(tmp_path):
+    index = make_index(tmp_path)
+    hits = index.search("chase freedom", domains=["uscreditcardguide.com"])
+    assert [h["url"] for h in hits] == [RESULTS[2]["url"]]
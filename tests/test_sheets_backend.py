@@ -0,0 +1,253 @@
+import os
+import re
+import sys
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+pytest.importorskip("gspread")
+pytest.importorskip("streamlit")
+
+from src.backends import sheets
+from src.backends.sqlite import SQLiteBackend
+from src.migrate import migrate
+
+HEADER = [
+    "user_id",
+    "bank",
+    "card_name",
+    "network",
+    "last_four",
+    "open_date",
+    "card_id",
+]
+_CELL = re.compile(r"([A-Z]+)(\d*)")
+
+
+def row(user_id, card_id, name="Card"):
+    return [user_id, "Bank", name, "Visa", "0000", "", card_id]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.revision = "r1"
+
+    def get_lastUpdateTime(self):
+        return self.revision
+
+    def batch_update(self, body):
+        # 和 Sheets API 一样按顺序执行每个删除请求
+        for request in body["requests"]:
+            r = request["deleteDimension"]["range"]
+            del self.worksheet.rows[r["startIndex"] : r["endIndex"]]
+        self.worksheet.calls.append("delete")
+
+
+class FakeWorksheet:
+    """只实现 sheets 后端用到的 A1 读写接口的内存表格"""
+
+    id = 0
+
+    def __init__(self, rows):
+        self.rows = [list(r) for r in rows]
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.calls = []
+
+    @staticmethod
+    def _parse(a1):
+        start, _, end = a1.partition(":")
+        (c1, r1), (c2, r2) = (
+            _CELL.fullmatch(start).groups(),
+            _CELL.fullmatch(end or start).groups(),
+        )
+        return ord(c1) - 65, ord(c2) - 65, int(r1 or 1), int(r2) if r2 else None
+
+    def batch_get(self, ranges):
+        result = []
+        for a1 in ranges:
+            c1, c2, r1, r2 = self._parse(a1)
+            rows = self.rows[r1 - 1 : r2]
+            values = [[v for v in r[c1 : c2 + 1]] for r in rows]
+            # API 会省略末尾的空单元格和空行
+            values = [
+                v[: max((i + 1 for i, x in enumerate(v) if x), default=0)]
+                for v in values
+            ]
+            while values and not values[-1]:
+                values.pop()
+            result.append(values)
+        self.calls.append("get")
+        return result
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+    def batch_update(self, updates):
+        for update in updates:
+            c1, _, r1, _ = self._parse(update["range"])
+            for i, values in enumerate(update["values"]):
+                target = self.rows[r1 - 1 + i]
+                target[c1 : c1 + len(values)] = values
+        self.calls.append("update")
+
+    def append_rows(self, rows):
+        first = len(self.rows) + 1
+        self.rows.extend(list(r) for r in rows)
+        last = len(self.rows)
+        self.calls.append("append")
+        return {"updates": {"updatedRange": f"Cards!A{first}:G{last}"}}
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    ws = FakeWorksheet(
+        [
+            HEADER,
+            row("u1", "c1"),
+            row("u2", "c2"),
+            row("u1", "c3"),
+            row("u2", "c4"),
+            row("u1", "c5"),
+        ]
+    )
+    monkeypatch.setattr(sheets, "_row_index", sheets.SheetRowIndex())
+    monkeypatch.setattr(sheets.clients, "get", lambda name: ws)
+    return ws
+
+
+def assert_index_matches(ws):
+    """增量维护的索引必须和从头重建的结果一致"""
+    fresh = sheets.SheetRowIndex()
+    fresh.rebuild(ws)
+    for uid in ("u1", "u2", "u3"):
+        assert sheets._row_index.rows_for(ws, uid) == fresh.rows_for(ws, uid)
+    for r, values in enumerate(ws.rows[1:], start=2):
+        assert sheets._row_index.row_of(ws, values[6]) == r
+
+
+def test_resolve_ops_maps_card_ids_to_rows(sheet):
+    ops = [
+        {"op": "update", "user_id": "u1", "card_id": "c3", "row": row("u1", "c3", "X")},
+        {"op": "delete", "user_id": "u1", "card_id": "c1"},
+        {"op": "append", "user_id": "u3", "card_id": "c6", "row": row("u3", "c6")},
+        # 对排队中新卡片的修改直接合并进待追加的行
+        {"op": "update", "user_id": "u3", "card_id": "c6", "row": row("u3", "c6", "Y")},
+        {"op": "append", "user_id": "u3", "card_id": "c7", "row": row("u3", "c7")},
+        {"op": "delete", "user_id": "u3", "card_id": "c7"},
+        # 修改后又删除的行只删除，不再修改
+        {"op": "update", "user_id": "u2", "card_id": "c4", "row": row("u2", "c4", "Z")},
+        {"op": "delete", "user_id": "u2", "card_id": "c4"},
+    ]
+    updates, deletes, appends = sheets._resolve_ops(sheet, ops)
+    assert updates == {4: row("u1", "c3", "X")}
+    assert deletes == {2, 5}
+    assert appends == [row("u3", "c6", "Y")]
+
+
+def test_resolve_ops_rebuilds_a_stale_index(sheet):
+    sheets._row_index.rebuild(sheet)
+    # 在 App 之外插入了一行，之后的行号全部后移
+    sheet.rows.insert(1, row("u9", "c0"))
+    updates, _, _ = sheets._resolve_ops(
+        sheet,
+        [{"op": "update", "user_id": "u1", "card_id": "c5", "row": row("u1", "c5")}],
+    )
+    assert list(updates) == [7]
+
+
+def test_write_batch_deletes_bottom_up_and_keeps_index_in_sync(sheet):
+    sheets._write_sheet_batch(
+        [
+            {"op": "delete", "user_id": "u1", "card_id": "c1"},
+            {
+                "op": "update",
+                "user_id": "u2",
+                "card_id": "c4",
+                "row": row("u2", "c4", "Z"),
+            },
+            {"op": "delete", "user_id": "u1", "card_id": "c3"},
+            {"op": "append", "user_id": "u3", "card_id": "c6", "row": row("u3", "c6")},
+        ]
+    )
+    assert [r[6] for r in sheet.rows[1:]] == ["c2", "c4", "c5", "c6"]
+    assert sheet.rows[2][2] == "Z"
+    # 一批操作最多: 修改、删行、追加各一次写请求
+    assert [c for c in sheet.calls if c != "get"] == ["update", "delete", "append"]
+    assert_index_matches(sheet)
+
+    # 下一批直接使用增量维护的行号
+    sheets._write_sheet_batch(
+        [
+            {
+                "op": "update",
+                "user_id": "u3",
+                "card_id": "c6",
+                "row": row("u3", "c6", "W"),
+            },
+            {"op": "delete", "user_id": "u2", "card_id": "c2"},
+            {"op": "append", "user_id": "u1", "card_id": "c7", "row": row("u1", "c7")},
+        ]
+    )
+    assert [r[6] for r in sheet.rows[1:]] == ["c4", "c5", "c6", "c7"]
+    assert sheet.rows[3][2] == "W"
+    assert_index_matches(sheet)
+    assert [r[6] for r in sheets._read_user_rows(sheet, "u1")] == ["c5", "c7"]
+
+
+def test_external_append_is_seen_after_revision_change(sheet):
+    backend = sheets.SheetsBackend()
+    backend.revision()
+    assert [c.card_id for c in backend.load_user_data("u1").cards] == [
+        "c1",
+        "c3",
+        "c5",
+    ]
+
+    # 另一个进程追加了一行: 索引里的行都还属于 u1，只有 revision 能发现缺了一行
+    sheet.rows.append(row("u1", "c6"))
+    sheet.spreadsheet.revision = "r2"
+    backend.revision()
+    assert [c.card_id for c in backend.load_user_data("u1").cards] == [
+        "c1",
+        "c3",
+        "c5",
+        "c6",
+    ]
+
+
+def test_local_write_does_not_rebuild_the_index(sheet):
+    backend = sheets.SheetsBackend()
+    backend.revision()
+    sheets._row_index.rebuild(sheet)
+    sheets._write_sheet_batch(
+        [{"op": "append", "user_id": "u1", "card_id": "c6", "row": row("u1", "c6")}]
+    )
+    # 本进程写入引起的 revision 变化不需要重建 (重建会读取 A:A 和 G:G)
+    sheet.spreadsheet.revision = "r2"
+    backend.revision()
+    sheet.calls.clear()
+    assert [r[6] for r in sheets._read_user_rows(sheet, "u1")] == [
+        "c1",
+        "c3",
+        "c5",
+        "c6",
+    ]
+    assert sheet.calls == ["get"]
+
+
+def test_migrating_legacy_rows_twice_keeps_their_ids(sheet, tmp_path):
+    # 旧数据: 没有 card_id 列
+    sheet.rows = [HEADER[:6], row("u1", "")[:6], row("u2", "")[:6]]
+    target = SQLiteBackend(str(tmp_path / "walle.db"))
+
+    assert migrate(sheets.SheetsBackend(), target) == 2
+    # 回填的 ID 写回了表格，第二次导出的是同样的 ID
+    assert sheet.rows[0][6] == "card_id"
+    assert all(r[6] for r in sheet.rows[1:])
+    assert migrate(sheets.SheetsBackend(), target) == 2
+    assert sorted(c.card_id for _, c in target.export_cards()) == sorted(
+        r[6] for r in sheet.rows[1:]
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.singleflight import SingleFlight
+
+
+def slow_counter(delay=0.2):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(delay)
+        return "result"
+
+    return fn, calls
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    fn, calls = slow_counter()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: flight.do("q1", fn, timeout=5), range(8)))
+
+    assert results == ["result"] * 8
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "shared": 7, "timeouts": 0}
+
+
+def test_leader_error_is_shared():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("quota exceeded")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "q", failing)
+        started.wait()
+        follower = pool.submit(flight.do, "q", lambda: "unused")
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            follower.result()
+
+
+def test_follower_wait_is_bounded():
+    flight = SingleFlight()
+    fn, calls = slow_counter(delay=0.5)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pool.submit(flight.do, "q", fn)
+        time.sleep(0.05)
+        started = time.perf_counter()
+        assert flight.do("q", lambda: "own", timeout=0.05) == "own"
+        assert time.perf_counter() - started < 0.4
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_async_callers_coalesce_with_threads():
+    flight = SingleFlight()
+    fn, calls = slow_counter()
+
+    async def run():
+        thread = asyncio.to_thread(flight.do, "q", fn)
+        tasks = [flight.do_async("q", fn, timeout=5) for _ in range(5)]
+        return await asyncio.gather(thread, *tasks)
+
+    assert asyncio.run(run()) == ["result"] * 6
+    assert len(calls) == 1
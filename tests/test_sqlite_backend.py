@@ -0,0 +1,47 @@
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.backends.sqlite import SQLiteBackend
+from src.migrate import migrate
+from src.models import CreditCard
+
+
+def test_crud_by_card_id(tmp_path):
+    db = SQLiteBackend(str(tmp_path / "walle.db"))
+
+    db.save_new_card("u1", CreditCard("Chase", "Freedom Flex", "Mastercard", "1234"))
+    db.save_new_card("u2", CreditCard("Citi", "Premier", "Mastercard", "5555"))
+    db.save_new_card(
+        "u1", CreditCard("Amex", "Gold", "Amex", "1001", open_date="2024-03-01")
+    )
+
+    user = db.load_user_data("u1")
+    assert [c.name for c in user.cards] == ["Freedom Flex", "Gold"]
+    assert user.cards[1].open_date == "2024-03-01"
+
+    freedom, gold = user.cards
+    db.update_card("u1", gold.card_id, CreditCard("Amex", "Platinum", "Amex", "1001"))
+    db.delete_card("u1", freedom.card_id)
+
+    user = db.load_user_data("u1")
+    assert [c.name for c in user.cards] == ["Platinum"]
+    assert user.cards[0].card_id == gold.card_id
+    assert [c.name for c in db.load_user_data("u2").cards] == ["Premier"]
+
+
+def test_migrate_between_backends(tmp_path):
+    source = SQLiteBackend(str(tmp_path / "a.db"))
+    target = SQLiteBackend(str(tmp_path / "b.db"))
+    source.save_new_card("u1", CreditCard("Chase", "Sapphire Reserve", "Visa"))
+    source.save_new_card("u2", CreditCard("Bilt", "Bilt Mastercard", "Mastercard"))
+
+    assert migrate(source, target) == 2
+    assert target.export_cards()[1][0] == "u2"
+    assert target.load_user_data("u1").cards[0].name == "Sapphire Reserve"
+
+    # 重新运行 (或中断后继续) 不会失败，也不会产生重复的卡片
+    assert migrate(source, target) == 2
+    assert len(target.export_cards()) == 2
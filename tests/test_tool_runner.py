@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+import time
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.tool_runner import ToolRunner
+
+
+def slow_search(query, delay=0.2):
+    time.sleep(delay)
+    return f"results for {query}"
+
+
+def failing_tool():
+    raise RuntimeError("quota exceeded")
+
+
+REGISTRY = {"search": slow_search, "failing": failing_tool}
+
+
+def test_calls_run_in_parallel_and_keep_order():
+    runner = ToolRunner(REGISTRY)
+    calls = [("search", {"query": f"card {i}"}) for i in range(5)]
+
+    started = time.perf_counter()
+    results = runner.run(calls)
+    elapsed = time.perf_counter() - started
+
+    assert results == [{"result": f"results for card {i}"} for i in range(5)]
+    assert elapsed < 0.6  # 串行执行需要 1 秒
+
+
+def test_timeouts_and_errors_do_not_block_other_calls():
+    runner = ToolRunner(REGISTRY, timeouts={"search": 0.1})
+    results = runner.run(
+        [
+            ("search", {"query": "slow", "delay": 1.0}),
+            ("search", {"query": "fast", "delay": 0.0}),
+            ("failing", {}),
+            ("missing", None),
+        ]
+    )
+    assert results[0] == {"error": "Tool timed out after 0.1s"}
+    assert results[1] == {"result": "results for fast"}
+    assert results[2] == {"error": "quota exceeded"}
+    assert results[3] == {"error": "Unknown tool: missing"}
+    assert runner.stats() == {"calls": 4, "errors": 1, "timed_out": 1}
+
+
+def test_run_async_awaits_coroutine_tools_and_threads_the_rest():
+    async def search_async(query, delay=0.2):
+        await asyncio.sleep(delay)
+        return f"async results for {query}"
+
+    runner = ToolRunner(
+        REGISTRY,
+        timeouts={"search": 0.5},
+        async_registry={"search": search_async},
+    )
+    calls = [("search", {"query": f"card {i}"}) for i in range(5)]
+    calls += [("search", {"query": "slow", "delay": 2.0}), ("failing", {})]
+
+    started = time.perf_counter()
+    results = asyncio.run(runner.run_async(calls))
+    elapsed = time.perf_counter() - started
+
+    assert results[:5] == [{"result": f"async results for card {i}"} for i in range(5)]
+    assert results[5] == {"error": "Tool timed out after 0.5s"}
+    assert results[6] == {"error": "quota exceeded"}
+    assert elapsed < 1.0
@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import tracing
+from src.tracing import (
+    NOOP_SPAN,
+    JSONLExporter,
+    Tracer,
+    bind,
+    hash_user,
+    otlp_payload,
+    span,
+    waterfall,
+)
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+def enable(monkeypatch, exporter=None):
+    exporter = exporter or MemoryExporter()
+    monkeypatch.setattr(tracing, "tracer", Tracer(enabled=True, exporters=[exporter]))
+    return exporter
+
+
+def test_disabled_tracer_returns_shared_noop_span(monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", Tracer(enabled=False))
+    with span("chat.turn", user="x") as s:
+        assert s is NOOP_SPAN
+        s.set(cache_hit=True)
+    fn = lambda: 1
+    assert bind(fn) is fn
+    assert tracing.tracer.last_trace() is None
+
+
+def test_nested_spans_share_a_trace_and_export_once(monkeypatch):
+    exporter = enable(monkeypatch)
+    with span("chat.turn", user=hash_user("a@b.com")) as root:
+        with span("prompt.build"):
+            pass
+        with span("llm.reply", model="m") as reply:
+            with span("gemini.generate", round=0):
+                pass
+            reply.set(cache_hit=False)
+
+    assert len(exporter.traces) == 1
+    spans = {s.name: s for s in exporter.traces[0]}
+    assert set(spans) == {"chat.turn", "prompt.build", "llm.reply", "gemini.generate"}
+    assert len({s.trace.trace_id for s in spans.values()}) == 1
+    assert spans["prompt.build"].parent is root
+    assert spans["gemini.generate"].parent is spans["llm.reply"]
+    assert spans["llm.reply"].attributes == {"model": "m", "cache_hit": False}
+    # 原始用户 ID 不出现在 trace 中
+    assert "a@b.com" not in json.dumps(root.to_dict())
+    assert tracing.tracer.last_trace("chat.turn", user=hash_user("a@b.com")) is not None
+    assert tracing.tracer.last_trace("chat.turn", user=hash_user("other")) is None
+
+
+def test_errors_are_recorded_on_the_span(monkeypatch):
+    exporter = enable(monkeypatch)
+    try:
+        with span("chat.turn"):
+            with span("tavily.request"):
+                raise TimeoutError("slow")
+    except TimeoutError:
+        pass
+    failed = {s.name: s for s in exporter.traces[0]}["tavily.request"]
+    assert failed.status == "error"
+    assert "TimeoutError: slow" in failed.error
+
+
+def test_bind_carries_the_parent_span_into_thread_pools(monkeypatch):
+    exporter = enable(monkeypatch)
+
+    def fetch(i):
+        with span("search.fetch", i=i):
+            return i
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        with span("search") as parent:
+            assert list(pool.map(bind(fetch), range(3))) == [0, 1, 2]
+
+    spans = exporter.traces[0]
+    fetches = [s for s in spans if s.name == "search.fetch"]
+    assert len(fetches) == 3
+    assert all(s.parent is parent for s in fetches)
+
+
+def test_spans_survive_generators(monkeypatch):
+    exporter = enable(monkeypatch)
+
+    def stream():
+        with span("chat.turn"):
+            with span("llm.reply"):
+                yield "a"
+                yield "b"
+
+    assert "".join(stream()) == "ab"
+    # 中途放弃的生成器也会结束 span，且不算错误
+    gen = stream()
+    next(gen)
+    gen.close()
+    assert len(exporter.traces) == 2
+    assert all(s.status == "ok" for s in exporter.traces[1])
+
+
+def test_jsonl_exporter_rotates(monkeypatch, tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    enable(monkeypatch, JSONLExporter(path, max_bytes=200, backups=2))
+    for i in range(10):
+        with span("chat.turn", i=i):
+            pass
+
+    assert os.path.exists(f"{path}.1")
+    assert os.path.exists(f"{path}.2")
+    assert not os.path.exists(f"{path}.3")
+    with open(path) as f:
+        last = [json.loads(line) for line in f][-1]
+    assert last["name"] == "chat.turn"
+    assert last["attributes"] == {"i": 9}
+    assert last["parent_id"] is None
+
+
+def test_otlp_payload_shape(monkeypatch):
+    exporter = enable(monkeypatch)
+    with span("chat.turn", cache_hit=True, prompt_tokens=12, model="m"):
+        with span("tools.run"):
+            pass
+
+    payload = otlp_payload(exporter.traces[0])
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = next(s for s in spans if s["name"] == "chat.turn")
+    child = next(s for s in spans if s["name"] == "tools.run")
+    assert child["parentSpanId"] == root["spanId"]
+    assert child["traceId"] == root["traceId"]
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes == {
+        "cache_hit": {"boolValue": True},
+        "prompt_tokens": {"intValue": "12"},
+        "model": {"stringValue": "m"},
+    }
+
+
+def test_waterfall_indents_children(monkeypatch):
+    enable(monkeypatch)
+    with span("chat.turn"):
+        with span("llm.reply"):
+            with span("gemini.generate"):
+                pass
+
+    lines = waterfall(tracing.tracer.last_trace()).splitlines()
+    assert [line.split()[0] for line in lines] == [
+        "chat.turn",
+        "llm.reply",
+        "gemini.generate",
+    ]
+    assert lines[1].startswith("  llm.reply")
+    assert lines[2].startswith("    gemini.generate")
+    assert waterfall(None) == ""
@@ -0,0 +1,83 @@
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.history import ConversationHistory
+from src.transcript import Transcript, TranscriptStore
+
+
+def make_store(tmp_path):
+    return TranscriptStore(str(tmp_path / "transcripts.db"))
+
+
+def fill(transcript, n):
+    for i in range(n):
+        transcript.append("user" if i % 2 == 0 else "assistant", f"message {i}")
+
+
+def test_only_the_recent_window_stays_in_memory(tmp_path):
+    store = make_store(tmp_path)
+    transcript = Transcript("alice", store, window=4, page_size=3)
+    fill(transcript, 10)
+
+    assert [m["content"] for m in transcript] == [f"message {i}" for i in range(6, 10)]
+    assert transcript.offset == 6
+    assert transcript.total == 10
+    assert store.count("alice") == 10
+
+
+def test_load_earlier_pages_from_disk(tmp_path):
+    transcript = Transcript("alice", make_store(tmp_path), window=4, page_size=3)
+    fill(transcript, 10)
+
+    assert transcript.load_earlier() == 3
+    assert transcript[0]["content"] == "message 3"
+    assert transcript.load_earlier() == 3
+    assert transcript.load_earlier() == 0
+    assert not transcript.has_earlier
+    assert len(transcript) == 10
+
+    # 下一条新消息会把窗口收回到 window 条
+    transcript.append("user", "message 10")
+    assert len(transcript) == 4
+    assert transcript.offset == 7
+
+
+def test_transcript_persists_across_sessions(tmp_path):
+    store = make_store(tmp_path)
+    fill(Transcript("alice", store, window=4), 7)
+    Transcript("bob", store).append("user", "你好，bob")
+
+    again = Transcript("alice", store, window=4)
+    assert [m["content"] for m in again] == [f"message {i}" for i in range(3, 7)]
+    assert again.start == again.offset == 3
+    assert Transcript("bob", store)[0]["content"] == "你好，bob"
+
+
+def test_since_reads_evicted_messages_back_from_disk(tmp_path):
+    transcript = Transcript("alice", make_store(tmp_path), window=3)
+    fill(transcript, 6)
+
+    assert [m["content"] for m in transcript.since(1)] == [
+        f"message {i}" for i in range(1, 6)
+    ]
+    assert transcript.since(4) == list(transcript[1:])
+
+
+def test_history_compacts_a_tail_with_offset():
+    folded = []
+
+    def summarizer(summary, messages):
+        folded.extend(m["content"] for m in messages)
+        return "summary"
+
+    messages = [{"role": "user", "content": "x" * 400} for _ in range(6)]
+    manager = ConversationHistory(token_budget=250, summarizer=summarizer)
+
+    # 前 10 条属于之前的 session，不在上下文中
+    prompt = manager.compact(messages, offset=10)
+    assert manager.folded == 14
+    assert len(folded) == 4
+    assert len(prompt) == 3  # 摘要 + 最近 2 条原文
@@ -0,0 +1,67 @@
+import datetime
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import warmup
+from src.tools.search_cache import query_ttl
+
+
+def test_rotating_cards_warm_current_quarter():
+    queries = warmup.warmup_queries(datetime.date(2026, 2, 1), include_benefits=False)
+    assert ("Chase Freedom Flex 5% quarterly categories Q1 2026") in [
+        q for q, _ in queries
+    ]
+    assert len(queries) == 2  # Freedom Flex + Discover it
+    assert all("Q2" not in q for q, _ in queries)
+
+
+def test_next_quarter_is_warmed_before_rollover():
+    queries = warmup.warmup_queries(datetime.date(2026, 12, 20), include_benefits=False)
+    assert [q for q, _ in queries if "Freedom" in q] == [
+        "Chase Freedom Flex 5% quarterly categories Q4 2026",
+        "Chase Freedom Flex 5% quarterly categories Q1 2027",
+    ]
+    assert "2027年第一季度 Chase Freedom Flex 5% 类别" in [zh for _, zh in queries]
+
+
+def test_benefit_queries_cover_popular_cards():
+    queries = warmup.warmup_queries(datetime.date(2026, 2, 1))
+    assert any(q.startswith("Amex Platinum annual credits") for q, _ in queries)
+
+
+def test_schedule_does_not_miss_quarter_rollover():
+    now = datetime.datetime(2026, 3, 31, 23, 0)
+    wait = warmup.seconds_until_next_run(now, interval=6 * 3600)
+    assert wait == 3600 + warmup.ROLLOVER_DELAY
+    assert warmup.seconds_until_next_run(datetime.datetime(2026, 2, 1), 3600) == 3600
+
+
+def test_warmup_entries_outlive_the_schedule():
+    # 预热的结果必须比预热间隔活得久，否则每一轮都会重新请求 Tavily
+    now = datetime.datetime(2026, 2, 1, 12, 0)
+    for query, query_zh in warmup.warmup_queries(now.date()):
+        assert query_ttl(query, now) > warmup.WARMUP_INTERVAL
+        assert query_ttl(query_zh, now) > warmup.WARMUP_INTERVAL
+
+
+def test_claim_run_is_shared_across_processes(tmp_path):
+    marker = str(tmp_path / "warmup_last_run")
+    assert warmup.claim_run(3600, marker, now=10000.0)
+    assert not warmup.claim_run(3600, marker, now=11000.0)
+    assert warmup.claim_run(3600, marker, now=14000.0)
+    # 另一个进程持有锁时跳过
+    open(f"{marker}.lock", "w").close()
+    assert not warmup.claim_run(3600, marker, now=99999.0)
+
+
+def test_runs_before_rollover_do_not_count():
+    just_after = datetime.datetime(2026, 4, 1, 0, 30)
+    assert (
+        warmup.min_gap_between_runs(6 * 3600, just_after)
+        == 1800 - warmup.ROLLOVER_DELAY
+    )
+    mid_quarter = datetime.datetime(2026, 5, 1)
+    assert warmup.min_gap_between_runs(6 * 3600, mid_quarter) == 6 * 3600 * 0.9
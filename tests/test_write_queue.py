@@ -0,0 +1,87 @@
+import os
+import sys
+
+# 将 src 目录添加到路径，以便导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.write_queue import WriteBehindQueue, WriteJournal
+
+
+def test_consecutive_edits_are_merged():
+    batches = []
+    queue = WriteBehindQueue(batches.append)
+
+    queue.enqueue({"op": "update", "user_id": "u1", "card_id": "c1", "row": ["a"]})
+    queue.enqueue({"op": "update", "user_id": "u1", "card_id": "c1", "row": ["b"]})
+    queue.enqueue({"op": "delete", "user_id": "u1", "card_id": "c1"})
+    queue.enqueue({"op": "append", "user_id": "u1", "row": ["c"]})
+    queue.flush()
+
+    assert batches == [
+        [
+            {"op": "delete", "user_id": "u1", "card_id": "c1"},
+            {"op": "append", "user_id": "u1", "row": ["c"]},
+        ]
+    ]
+    assert not queue.has_pending()
+
+
+def test_journal_survives_restart(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    def failing_apply(ops):
+        raise RuntimeError("sheets down")
+
+    queue = WriteBehindQueue(failing_apply, journal=WriteJournal(journal_path))
+    queue.enqueue({"op": "append", "user_id": "u1", "row": ["x"]})
+    try:
+        queue.flush()
+    except RuntimeError:
+        pass
+    assert queue.has_pending("u1")
+
+    # 模拟进程重启: 新队列从日志中重放
+    batches = []
+    restarted = WriteBehindQueue(batches.append, journal=WriteJournal(journal_path))
+    assert restarted.has_pending("u1")
+    restarted.flush()
+    assert batches == [[{"op": "append", "user_id": "u1", "row": ["x"]}]]
+
+    # 刷写成功后日志被清空
+    assert WriteJournal(journal_path).load() == []
+
+
+def test_each_process_keeps_its_own_journal(tmp_path):
+    prefix = str(tmp_path / "write_journal")
+    ours = WriteJournal.for_process(prefix)
+    assert ours.path == f"{prefix}.{os.getpid()}.jsonl"
+
+    # 另一个 (仍在运行的) 进程的日志不会被本进程的 rewrite 覆盖，也不会被接管
+    parent = WriteJournal(f"{prefix}.{os.getppid()}.jsonl")
+    parent.append({"op": "delete", "user_id": "u2", "card_id": "c9"})
+    queue = WriteBehindQueue(lambda batch: None, journal=ours)
+    queue.enqueue({"op": "append", "user_id": "u1", "row": ["a"]})
+    queue.flush()
+    assert parent.load() == [{"op": "delete", "user_id": "u2", "card_id": "c9"}]
+    assert not os.path.exists(ours.path)
+
+
+def test_journals_of_exited_processes_are_adopted(tmp_path):
+    prefix = str(tmp_path / "write_journal")
+    # 不存在的 pid 和旧版本的共享日志都视为孤儿
+    WriteJournal(f"{prefix}.999999999.jsonl").append(
+        {"op": "append", "user_id": "u1", "row": ["a"]}
+    )
+    WriteJournal(f"{prefix}.jsonl").append(
+        {"op": "delete", "user_id": "u1", "card_id": "c1"}
+    )
+
+    batches = []
+    journal = WriteJournal.for_process(prefix)
+    queue = WriteBehindQueue(batches.append, journal=journal)
+    assert queue.has_pending("u1")
+    assert len(journal.load()) == 2
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(journal.path)]
+
+    queue.flush()
+    assert len(batches[0]) == 2